@@ -0,0 +1,153 @@
+"""Flat, array-backed representation of the R tree
+
+Struct-of-arrays layout: node kind, paradigm, flags and child ranges are
+stored in parallel `array`s instead of one Python object per node.
+Nodes are laid out breadth-first, so the children of a node are always
+a contiguous range of node indexes. It is only used to compare memory
+footprints in `run_benchmarks.py`.
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections import deque
+
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.utils.spans import NO_SPAN
+from hhat_lang.syntax_trees.ast import (
+    ATO,
+    Literal,
+    Id,
+    ASTType,
+    DataTypeEnum,
+    ExprParadigm,
+)
+
+
+kind_list = tuple(ASTType) + tuple(DataTypeEnum)
+kind_codes = {k: n for n, k in enumerate(kind_list)}
+paradigm_list = tuple(ExprParadigm)
+paradigm_codes = {k: n for n, k in enumerate(paradigm_list)}
+role_list = ("", "caller", "callee")
+role_codes = {k: n for n, k in enumerate(role_list)}
+
+# flags bits
+HAS_Q = 1
+IS_ATO = 2
+ROLE_SHIFT = 2
+
+
+class FlatTree:
+    """Array-backed R tree
+
+    For node `i`: `kind[i]` and `paradigm[i]` index `kind_list` and
+    `paradigm_list`, `flags[i]` holds has_q, whether it is an ATO and its
+    role, `token[i]` indexes `tokens` (-1 if none), `span[i]` is its
+    source span and its children are the nodes in
+    `range(first[i], first[i] + size[i])`.
+
+    The conversion keeps the shape of the tree but loses the node ids,
+    `execute_after`, the variable slots resolved in `Id.ref`/`Id.slot`
+    and the node table (parent ids and sources). The tree `to_r` builds
+    has new ids and cannot be evaluated the same way as the original.
+    """
+    def __init__(self):
+        self.kind = array("B")
+        self.paradigm = array("B")
+        self.flags = array("B")
+        self.token = array("i")
+        self.first = array("I")
+        self.size = array("I")
+        self.span = array("q")
+        self.tokens: list[str] = []
+        self._token_index: dict[str, int] = dict()
+
+    @classmethod
+    def from_r(cls, code: R | ATO) -> FlatTree:
+        tree = cls()
+        queue = deque((code,))
+        next_free = 1
+        while queue:
+            node = queue.popleft()
+            if isinstance(node, ATO):
+                tree.add_node(node.type, ExprParadigm.NONE, node.has_q, "", node.token, True, node.span)
+                tree.first.append(0)
+                tree.size.append(0)
+                continue
+            tree.add_node(node.type, node.paradigm, node.has_q, node.role, None, False, node.span)
+            tree.first.append(next_free)
+            tree.size.append(len(node.value))
+            next_free += len(node.value)
+            queue.extend(node.value)
+        tree._token_index = dict()
+        return tree
+
+    def add_node(
+            self,
+            kind: ASTType | DataTypeEnum,
+            paradigm: ExprParadigm,
+            has_q: bool,
+            role: str,
+            token: str | None,
+            is_ato: bool,
+            span: int = NO_SPAN,
+    ) -> None:
+        self.kind.append(kind_codes[kind])
+        self.span.append(span)
+        self.paradigm.append(paradigm_codes[paradigm])
+        self.flags.append(
+            (HAS_Q if has_q else 0)
+            | (IS_ATO if is_ato else 0)
+            | (role_codes[role] << ROLE_SHIFT)
+        )
+        if token is None:
+            self.token.append(-1)
+        else:
+            idx = self._token_index.get(token)
+            if idx is None:
+                idx = self._token_index[token] = len(self.tokens)
+                self.tokens.append(token)
+            self.token.append(idx)
+
+    def children(self, idx: int) -> range:
+        return range(self.first[idx], self.first[idx] + self.size[idx])
+
+    def get_kind(self, idx: int) -> ASTType | DataTypeEnum:
+        return kind_list[self.kind[idx]]
+
+    def get_token(self, idx: int) -> str | None:
+        token = self.token[idx]
+        return self.tokens[token] if token >= 0 else None
+
+    def get_role(self, idx: int) -> str:
+        return role_list[self.flags[idx] >> ROLE_SHIFT]
+
+    def has_q(self, idx: int) -> bool:
+        return bool(self.flags[idx] & HAS_Q)
+
+    def to_r(self, idx: int = 0) -> R | ATO:
+        """Rebuild the (sub)tree rooted at node `idx` as R and ATO objects."""
+        kind = self.get_kind(idx)
+        if self.flags[idx] & IS_ATO:
+            if isinstance(kind, DataTypeEnum):
+                res = Literal(token=self.get_token(idx), lit_type=kind)
+            else:
+                res = Id(token=self.get_token(idx), ato_type=kind)
+        else:
+            res = R(
+                ast_type=kind,
+                value=tuple(self.to_r(k) for k in self.children(idx)),
+                paradigm_type=paradigm_list[self.paradigm[idx]],
+                role=self.get_role(idx),
+                execute_after=None,
+                has_q=self.has_q(idx),
+            )
+        res.span = self.span[idx]
+        return res
+
+    def nbytes(self) -> int:
+        arrays = (self.kind, self.paradigm, self.flags, self.token, self.first, self.size, self.span)
+        return sum(k.itemsize * len(k) for k in arrays) + sum(len(k) for k in self.tokens)
+
+    def __len__(self) -> int:
+        return len(self.kind)
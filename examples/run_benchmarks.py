@@ -0,0 +1,604 @@
+import io
+import os
+import sys
+import random
+import tracemalloc
+from contextlib import redirect_stdout
+from copy import deepcopy
+from time import perf_counter
+
+from hhat_lang.interpreter.parsing import (
+    parse_code,
+    ParserBackend,
+    clear_parser_cache,
+)
+from hhat_lang.interpreter.fast_parsing import tokenize
+from hhat_lang.interpreter.semantics import analyze, Analysis
+from hhat_lang.interpreter.eval import Eval, EvalBackend, eval_token
+from hhat_lang.interpreter.governor import Budget, governor
+from hhat_lang.interpreter.pool import set_parallel_lines, set_workers
+from hhat_lang.interpreter.vm import compile_code
+from hhat_lang.interpreter.inline_cache import call_builtin, call_convention, CallConv
+from hhat_lang.interpreter.stats import get_stats, reset_stats
+from hhat_lang.builtins.memo import clear_memo, set_memo_size
+from hhat_lang.utils.event_trace import events
+from hhat_lang.utils.profiling import profiler
+from hhat_lang.utils.spans import SourceMap
+from hhat_lang.interpreter.hotspots import sampler
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.datatypes.builtin_datatype import Bool, Int, IntArray
+from hhat_lang.datatypes.array_storage import ArrayStorage, np, set_array_storage
+from hhat_lang.builtins.functions import Sum, Times
+from hhat_lang.interpreter.memory import Mem
+from hhat_lang.syntax_trees.ast import ATO, Id, ASTType, ExprParadigm
+from flat_tree import FlatTree
+from run_examples import code_list
+
+
+def scale_code(code: str, times: int) -> str:
+    return "\n".join(code for _ in range(times))
+
+
+def timeit(fn, *args, repeat: int = 1, **kwargs) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        fn(*args, **kwargs)
+    return (perf_counter() - start) / repeat
+
+
+def bench_parsing(repeat: int = 20) -> None:
+    """Cold (parser built from scratch) vs warm (cached parser) parse times."""
+    code = code_list[0]
+    print("[parsing] cold vs warm parse_code times")
+    for backend in ParserBackend:
+        clear_parser_cache()
+        cold = timeit(parse_code, code, backend=backend)
+        warm = timeit(parse_code, code, backend=backend, repeat=repeat)
+        print(
+            f"  {backend.name.lower():>8}: cold {cold * 1e3:8.3f} ms"
+            f" | warm {warm * 1e3:8.3f} ms | speedup {cold / warm:6.1f}x"
+        )
+
+
+def bench_fast_parser(times: int = 200, repeat: int = 3) -> None:
+    """Throughput, in tokens per second, of each parser backend."""
+    code = scale_code(code_list[0], times)
+    n_tokens = len(tokenize(code)[0])
+    print(f"[parsing] throughput on {n_tokens} tokens")
+    for backend in ParserBackend:
+        parse_code(code, backend=backend)
+        elapsed = timeit(parse_code, code, backend=backend, repeat=repeat)
+        print(
+            f"  {backend.name.lower():>8}: {elapsed * 1e3:9.2f} ms"
+            f" | {n_tokens / elapsed:12,.0f} tokens/s"
+        )
+
+
+def traced_memory(fn, *args, **kwargs) -> tuple:
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    res = fn(*args, **kwargs)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return res, used
+
+
+def bench_memory(times: int = 2000) -> None:
+    """Memory footprint of the parsed and analyzed trees."""
+    code = scale_code(code_list[0], times)
+
+    def build() -> tuple:
+        ast = parse_code(code, backend=ParserBackend.FAST)
+        return ast, analyze(ast)
+
+    (ast, r_tree), tree_bytes = traced_memory(build)
+    flat, flat_bytes = traced_memory(FlatTree.from_r, r_tree)
+    n_nodes = len(flat)
+    print(f"[memory] {n_nodes} R/ATO nodes")
+    print(f"  AST + R objects: {tree_bytes / 2**20:8.2f} MiB | {tree_bytes / n_nodes:6.1f} bytes/node")
+    print(f"  flat tree:       {flat_bytes / 2**20:8.2f} MiB | {flat_bytes / n_nodes:6.1f} bytes/node")
+
+
+def bench_vm(times: int = 50, repeat: int = 3) -> None:
+    """Tree-walker vs bytecode VM on the scaled up example programs."""
+    for n, code in enumerate(code_list):
+        r_tree = Analysis(parse_code(scale_code(code, times), backend=ParserBackend.FAST)).run()
+        compile_time = timeit(compile_code, r_tree)
+        print(f"[eval] example {n} x{times}: {len(compile_code(r_tree))} instructions, compiled in {compile_time * 1e3:.2f} ms")
+        elapsed = dict()
+        for engine in EvalBackend:
+            with redirect_stdout(io.StringIO()):
+                elapsed[engine] = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+            print(f"  {engine.name.lower():>8}: {elapsed[engine] * 1e3:9.2f} ms")
+        print(f"  speedup: {elapsed[EvalBackend.TREE] / elapsed[EvalBackend.VM]:6.2f}x")
+
+
+def bench_folding(times: int = 50, repeat: int = 3) -> None:
+    """Execution time of the scaled up examples with and without constant folding."""
+    code = parse_code(scale_code(code_list[0], times), backend=ParserBackend.FAST)
+    elapsed = dict()
+    for opt_level in (0, 1):
+        r_tree = Analysis(code, opt_level=opt_level).run()
+        for engine in EvalBackend:
+            with redirect_stdout(io.StringIO()):
+                elapsed[opt_level, engine] = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+    print(f"[optimize] example 0 x{times}, constant folding")
+    for engine in EvalBackend:
+        before, after = elapsed[0, engine], elapsed[1, engine]
+        print(
+            f"  {engine.name.lower():>8}: -O0 {before * 1e3:9.2f} ms"
+            f" | -O1 {after * 1e3:9.2f} ms | speedup {before / after:5.2f}x"
+        )
+
+
+def fusion_code(lines: int = 300, seed: int = 0) -> str:
+    """Pipelines of pure builtins that cannot be folded (they follow `print`)."""
+    rng = random.Random(seed)
+    code = []
+    for _ in range(lines):
+        ints = " ".join(str(rng.randrange(1, 4)) for _ in range(3))
+        steps = ":".join(rng.choice(["sum", "times"]) for _ in range(rng.randint(2, 6)))
+        code.append(f".[{ints}]:print:{steps}:print")
+    return "\n".join(code)
+
+
+def bench_fusion(repeat: int = 5) -> None:
+    """Execution time of pure builtin pipelines, unfused (-O1) vs fused (-O2)."""
+    code = parse_code(fusion_code(), backend=ParserBackend.FAST)
+    elapsed = dict()
+    for opt_level in (1, 2):
+        r_tree = Analysis(code, opt_level=opt_level).run()
+        for engine in EvalBackend:
+            with redirect_stdout(io.StringIO()):
+                elapsed[opt_level, engine] = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+    print("[optimize] 300 pipelines of 2 to 6 pure builtins, pipeline fusion")
+    for engine in EvalBackend:
+        before, after = elapsed[1, engine], elapsed[2, engine]
+        print(
+            f"  {engine.name.lower():>8}: -O1 {before * 1e3:9.2f} ms"
+            f" | -O2 {after * 1e3:9.2f} ms | speedup {before / after:5.2f}x"
+        )
+
+
+class Probe:
+    """Quantum builtin stand-in that does nothing, to time the dispatch alone."""
+    quantum = True
+
+    def __init__(self, mem, *values):
+        pass
+
+
+def slow_call(fn, mem, data, code):
+    # builtin call without inline cache, as `eval_oper` used to do it
+    if call_convention(fn, data) == CallConv.QUANTUM:
+        return fn(mem, *(data + (code,)))
+    return fn(mem, data)
+
+
+def bench_inline_cache(repeat: int = 5, calls: int = 200_000) -> None:
+    """Inline cache hit rates on a program and cost of the builtin call dispatch."""
+    code = parse_code(fusion_code(), backend=ParserBackend.FAST)
+    print("[inline cache] 300 pipelines of 2 to 6 pure builtins")
+    for engine in EvalBackend:
+        # fresh nodes, so the other engine did not fill the caches
+        r_tree = Analysis(code, opt_level=1).run()
+        reset_stats("inline_cache")
+        with redirect_stdout(io.StringIO()):
+            elapsed = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+        stats = get_stats("inline_cache")
+        print(
+            f"  {engine.name.lower():>8}: {elapsed * 1e3:9.2f} ms | {stats['sites']} sites,"
+            f" hit rate {stats['hit_rate']:.2%} ({stats['hits']} hits, {stats['misses']} misses)"
+        )
+    node = R(
+        ast_type=ASTType.BUILTIN,
+        value=(),
+        paradigm_type=ExprParadigm.SINGLE,
+        role="",
+        execute_after=None,
+    )
+    samples = (Int(3), Int(5))
+    mem = Mem()
+    for name, call in (("slow path", slow_call), ("cached", call_builtin)):
+        start = perf_counter()
+        for n in range(calls):
+            call(Probe, mem, samples[n & 1], node)
+        elapsed = perf_counter() - start
+        print(f"  {name:>9}: {elapsed / calls * 1e9:7.1f} ns per quantum builtin dispatch")
+
+
+MEMO_SIZE = 1024
+
+
+def memo_code(lines: int = 300, distinct: int = 20, seed: int = 0) -> str:
+    """Script repeating a few pipelines of pure builtins (run unfolded, at -O0)."""
+    rng = random.Random(seed)
+    pipelines = [
+        " ".join(str(rng.randrange(1, 20)) for _ in range(rng.randint(3, 8)))
+        for _ in range(distinct)
+    ]
+    code = []
+    for _ in range(lines):
+        ints = rng.choice(pipelines)
+        code.append(f".[{ints}]:.(sum times):sum:times")
+    return "\n".join(code)
+
+
+def bench_memo(repeat: int = 5) -> None:
+    """Repeated pure builtin calls without and with memoization."""
+    code = parse_code(memo_code(), backend=ParserBackend.FAST)
+    print("[memo] 300 lines repeating 20 pipelines of `sum` and `times`")
+    for engine in EvalBackend:
+        r_tree = Analysis(code).run()
+        elapsed = dict()
+        for size in (0, MEMO_SIZE):
+            set_memo_size(size)
+            clear_memo()
+            reset_stats("memo")
+            with redirect_stdout(io.StringIO()):
+                elapsed[size] = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+        stats = get_stats("memo")
+        print(
+            f"  {engine.name.lower():>8}: no memo {elapsed[0] * 1e3:8.2f} ms"
+            f" | memo {elapsed[MEMO_SIZE] * 1e3:8.2f} ms"
+            f" | speedup {elapsed[0] / elapsed[MEMO_SIZE]:5.2f}x"
+            f" | hit rate {stats['hit_rate']:.2%}"
+        )
+    set_memo_size()
+
+
+def bench_profile(times: int = 50, repeat: int = 5) -> None:
+    """Execution time with and without the profiler, and its report."""
+    code = parse_code(scale_code(code_list[0], times), backend=ParserBackend.FAST)
+    r_tree = Analysis(code).run()
+    print(f"[profile] example 0 x{times}")
+    for engine in EvalBackend:
+        ev = Eval(r_tree, backend=engine)
+        with redirect_stdout(io.StringIO()):
+            off = timeit(ev.run, repeat=repeat)
+            profiler.enable()
+            on = timeit(ev.run, repeat=repeat)
+            profiler.disable()
+        print(
+            f"  {engine.name.lower():>8}: off {off * 1e3:8.2f} ms | on {on * 1e3:8.2f} ms"
+            f" | overhead {on / off:5.2f}x"
+        )
+    print(profiler.report(limit=5))
+
+
+def bench_hotspots(times: int = 50, repeat: int = 5) -> None:
+    """Execution time with and without hot-spot sampling, and its report."""
+    source = scale_code(code_list[0], times)
+    r_tree = Analysis(parse_code(source, backend=ParserBackend.FAST)).run()
+    print(f"[hotspots] example 0 x{times}")
+    for engine in EvalBackend:
+        ev = Eval(r_tree, backend=engine)
+        with redirect_stdout(io.StringIO()):
+            off = timeit(ev.run, repeat=repeat)
+            sampler.start()
+            on = timeit(ev.run, repeat=repeat)
+            sampler.stop()
+        print(
+            f"  {engine.name.lower():>8}: off {off * 1e3:8.2f} ms | on {on * 1e3:8.2f} ms"
+            f" | overhead {on / off:5.2f}x"
+        )
+    print(sampler.report(SourceMap(source), limit=5))
+
+
+def bench_events(times: int = 50, repeat: int = 5) -> None:
+    """Execution time with and without event recording, and its hottest stacks."""
+    code = parse_code(scale_code(code_list[0], times), backend=ParserBackend.FAST)
+    r_tree = Analysis(code).run()
+    print(f"[events] example 0 x{times}")
+    for engine in EvalBackend:
+        ev = Eval(r_tree, backend=engine)
+        with redirect_stdout(io.StringIO()):
+            off = timeit(ev.run, repeat=repeat)
+            events.enable()
+            on = timeit(ev.run, repeat=repeat)
+            events.disable()
+        print(
+            f"  {engine.name.lower():>8}: off {off * 1e3:8.2f} ms | on {on * 1e3:8.2f} ms"
+            f" | overhead {on / off:5.2f}x | {len(events)} events"
+        )
+    for stack, self_time in events.collapsed().most_common(5):
+        print(f"  {self_time / 1e6:8.2f} ms  {stack}")
+
+
+def bench_budget(times: int = 50, repeat: int = 5) -> None:
+    """Execution time without and with an execution budget (never reached)."""
+    code = parse_code(scale_code(code_list[0], times), backend=ParserBackend.FAST)
+    r_tree = Analysis(code).run()
+    budget = Budget(max_steps=10 ** 9, timeout=3600.0, max_mem=10 ** 9)
+    print(f"[budget] example 0 x{times}")
+    for engine in EvalBackend:
+        off_ev = Eval(r_tree, backend=engine)
+        on_ev = Eval(r_tree, backend=engine, budget=budget)
+        with redirect_stdout(io.StringIO()):
+            off = timeit(off_ev.run, repeat=repeat)
+            on = timeit(on_ev.run, repeat=repeat)
+        print(
+            f"  {engine.name.lower():>8}: off {off * 1e3:8.2f} ms | on {on * 1e3:8.2f} ms"
+            f" | overhead {on / off:5.2f}x | {governor.steps} steps"
+        )
+
+
+def bench_arrays(sizes: tuple = (4, 100, 1000), repeat: int = 20) -> None:
+    """Int array arithmetic, `sum` and `times` with tuple and ndarray storage."""
+    if np is None:
+        print("[arrays] skipped: NumPy is not installed")
+        return
+    print("[arrays] tuple vs numpy storage (us per operation)")
+    mem = Mem()
+    ops = {
+        "array + array": lambda a, k: a + a,
+        "array * int": lambda a, k: a * k,
+        "int + array": lambda a, k: k + a,
+        "sum": lambda a, k: Sum(mem, a)(),
+        "times": lambda a, k: Times(mem, a)(),
+        "sum(int)": lambda a, k: Sum(mem, a)(k),
+    }
+    try:
+        for size in sizes:
+            res = dict()
+            for storage in ArrayStorage:
+                set_array_storage(storage)
+                clear_memo()
+                array = IntArray(*(Int(str(n % 2 + 1)) for n in range(size)))
+                k = Int("3")
+                for name, op in ops.items():
+                    set_memo_size(0)
+                    t = timeit(op, array, k, repeat=repeat)
+                    res.setdefault(name, dict())[storage] = t, str(op(array, k)[0] if name.startswith(("sum", "times")) else op(array, k))
+            for name, by_storage in res.items():
+                (t_tuple, out_tuple), (t_np, out_np) = by_storage[ArrayStorage.TUPLE], by_storage[ArrayStorage.NUMPY]
+                assert out_tuple == out_np, (name, size)
+                print(
+                    f"  {size:>6} {name:<14}: tuple {t_tuple * 1e6:10.1f} | numpy {t_np * 1e6:10.1f}"
+                    f" | speedup {t_tuple / t_np:6.2f}x"
+                )
+    finally:
+        set_array_storage(ArrayStorage.TUPLE)
+        set_memo_size()
+
+
+def bench_scalars(n: int = 100000, repeat: int = 5) -> None:
+    """Time and memory blocks kept per result of scalar arithmetic."""
+    print(f"[scalars] x{n}")
+    small, big, true = Int("3"), Int("5000"), Bool("T")
+    ops = {
+        "Int(token)": lambda: Int("42"),
+        "small + small": lambda: small + small,
+        "big + big": lambda: big + big,
+        "small * big": lambda: small * big,
+        "bool + bool": lambda: true + true,
+    }
+    for name, op in ops.items():
+        t = min(timeit(op, repeat=n) for _ in range(repeat))
+        blocks = sys.getallocatedblocks()
+        kept = [op() for _ in range(n)]
+        blocks = (sys.getallocatedblocks() - blocks) / n
+        del kept
+        print(f"  {name:<14}: {t * 1e9:7.0f} ns | {blocks:5.2f} blocks per result")
+
+
+def unresolve_names(code) -> None:
+    stack = [code]
+    while stack:
+        k = stack.pop()
+        if isinstance(k, Id):
+            k.ref, k.slot = None, -1
+        elif not isinstance(k, ATO):
+            stack.extend(k)
+
+
+def vars_code(n_vars: int = 30, lines: int = 2000, seed: int = 0) -> str:
+    """Program reading many variables, without array scopes."""
+    rng = random.Random(seed)
+    code = [f"{k}:x{k}" for k in range(n_vars)]
+    for _ in range(lines):
+        args = " ".join(f"x{rng.randrange(n_vars)}" for _ in range(3))
+        code.append(f"{rng.randrange(10)}:sum({args}):times({args})")
+    return "\n".join(code)
+
+
+def bench_resolution(repeat: int = 5) -> None:
+    """Name lookups (eval_token) and execution time, resolved vs by name."""
+    r_tree = Analysis(parse_code(vars_code(), backend=ParserBackend.FAST)).run()
+    ids = []
+    stack = [r_tree]
+    while stack:
+        k = stack.pop()
+        if isinstance(k, Id):
+            ids.append(k)
+        elif not isinstance(k, ATO):
+            stack.extend(k)
+    with redirect_stdout(io.StringIO()):
+        mem = Eval(r_tree).run()
+
+    def lookups() -> None:
+        for k in ids:
+            eval_token(k, mem)
+
+    lookup_time, elapsed = dict(), dict()
+    for resolved in (True, False):
+        if not resolved:
+            unresolve_names(r_tree)
+        lookup_time[resolved] = timeit(lookups, repeat=repeat * 10)
+        for engine in EvalBackend:
+            with redirect_stdout(io.StringIO()):
+                elapsed[resolved, engine] = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+    print(f"[resolution] variables program, {len(ids)} names")
+    before, after = lookup_time[False], lookup_time[True]
+    print(
+        f"  {'lookups':>8}: by name {before * 1e3:9.2f} ms"
+        f" | resolved {after * 1e3:9.2f} ms | speedup {before / after:5.2f}x"
+    )
+    for engine in EvalBackend:
+        before, after = elapsed[False, engine], elapsed[True, engine]
+        print(
+            f"  {engine.name.lower():>8}: by name {before * 1e3:9.2f} ms"
+            f" | resolved {after * 1e3:9.2f} ms | speedup {before / after:5.2f}x"
+        )
+
+
+def scopes_code(n_vars: int, lines: int = 200) -> str:
+    """Program with many variables and array scopes."""
+    code = [f"{k}:x{k}" for k in range(n_vars)]
+    code += [f".[{k % 7} 2]:.[sum times]:.[sum print]" for k in range(lines)]
+    return "\n".join(code)
+
+
+def bench_scopes(repeat: int = 3) -> None:
+    """Array scopes as copy-on-write branches vs deep copies of memory."""
+    branch = Mem.branch
+    print("[scopes] 200 lines of nested arrays")
+    for n_vars in (10, 50, 200):
+        r_tree = Analysis(parse_code(scopes_code(n_vars), backend=ParserBackend.FAST)).run()
+        elapsed = dict()
+        for name, fn in (("deepcopy", deepcopy), ("branch", branch)):
+            Mem.branch = fn
+            try:
+                for engine in EvalBackend:
+                    with redirect_stdout(io.StringIO()):
+                        elapsed[name, engine] = timeit(Eval(r_tree, backend=engine).run, repeat=repeat)
+            finally:
+                Mem.branch = branch
+        for engine in EvalBackend:
+            before, after = elapsed["deepcopy", engine], elapsed["branch", engine]
+            print(
+                f"  {n_vars:>5} vars {engine.name.lower():>5}: deepcopy {before * 1e3:9.2f} ms"
+                f" | branch {after * 1e3:9.2f} ms | speedup {before / after:6.2f}x"
+            )
+
+
+def stack_ops(depth: int, ops: int = 20000) -> None:
+    mem = Mem()
+    for k in range(depth):
+        mem.put_stack(k)
+    for k in range(ops):
+        mem.put_stack(k)
+        mem.put_expr(k)
+        mem.pop_expr()
+        mem.pop_stack()
+
+
+def stack_programs() -> dict[str, str]:
+    """Programs keeping many values on the memory stacks."""
+    ints = " ".join(str(k % 10) for k in range(2000))
+    return {
+        "long array": f".[{ints}]:sum:print",
+        "long args": f"1:sum({ints}):print",
+        "long pipelines": "\n".join("1" + ":sum(1)" * 50 + ":print" for _ in range(20)),
+        "many arrays": "\n".join(f".[{k % 5} 2 3]:.[sum times]:print" for k in range(500)),
+    }
+
+
+def bench_stacks(repeat: int = 3) -> None:
+    """Memory stack operations and stack-heavy programs."""
+    print("[stacks] 20000 push/pop pairs on stacks and exprs")
+    for depth in (10, 1000, 10000):
+        t = timeit(stack_ops, depth, repeat=repeat)
+        print(f"  depth {depth:>6}: {t * 1e3:9.2f} ms | {t / 40000 * 1e9:7.1f} ns/op")
+    for name, code in stack_programs().items():
+        r_tree = Analysis(parse_code(code, backend=ParserBackend.FAST)).run()
+        times = []
+        for engine in EvalBackend:
+            with redirect_stdout(io.StringIO()):
+                times.append(f"{engine.name.lower()} {timeit(Eval(r_tree, backend=engine).run, repeat=repeat) * 1e3:9.2f} ms")
+        print(f"  {name:>14}: " + " | ".join(times))
+
+
+def parallel_code(elements: int = 8, steps: int = 40, seed: int = 0) -> str:
+    """A `{...}` array of long, independent pipelines."""
+    rng = random.Random(seed)
+    chains = []
+    for _ in range(elements):
+        start = " ".join(str(rng.randrange(1, 10)) for _ in range(8))
+        chains.append(f".[{start}]" + ":.(sum sum)" * steps + ":sum")
+    return f".{{{' '.join(chains)}}}:print"
+
+
+def bench_parallel(repeat: int = 3) -> None:
+    """Parallel `{...}` arrays with 1 to `cpu_count` worker processes."""
+    r_tree = Analysis(parse_code(parallel_code(), backend=ParserBackend.FAST)).run()
+    default = os.cpu_count() or 1
+    elapsed, outputs = dict(), set()
+    for workers in range(1, max(2, default) + 1):
+        set_workers(workers)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Eval(r_tree).run()  # warm up the pool
+            elapsed[workers] = timeit(Eval(r_tree).run, repeat=repeat)
+        outputs.add(out.getvalue())
+    set_workers()
+    if len(outputs) != 1:
+        raise AssertionError(f"parallel arrays output depends on the workers: {outputs}")
+    print(f"[parallel] 8 elements, {default} CPU(s)")
+    for workers, t in elapsed.items():
+        print(f"  {workers:>2} worker(s): {t * 1e3:9.2f} ms | speedup {elapsed[1] / t:5.2f}x")
+
+
+def lines_code(lines: int = 2000, steps: int = 4, seed: int = 0) -> str:
+    """Batch script of independent top-level expressions."""
+    rng = random.Random(seed)
+    code = []
+    for k in range(lines):
+        start = " ".join(str(rng.randrange(1, 10)) for _ in range(4))
+        code.append(f".[{start}]" + ":.(sum sum)" * steps + f":sum:x{k}:print")
+    return "\n".join(code)
+
+
+def bench_lines(repeat: int = 3) -> None:
+    """Independent top-level expressions, serially and on 2 to `cpu_count` workers."""
+    r_tree = Analysis(parse_code(lines_code(), backend=ParserBackend.FAST)).run()
+    default = os.cpu_count() or 1
+    elapsed, outputs = dict(), set()
+    for workers in range(1, max(2, default) + 1):
+        set_workers(workers)
+        set_parallel_lines(True)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Eval(r_tree).run()  # warm up the pool
+            elapsed[workers] = timeit(Eval(r_tree).run, repeat=repeat)
+        outputs.add(out.getvalue())
+    set_parallel_lines(False)
+    set_workers()
+    if len(outputs) != 1:
+        raise AssertionError("top-level expressions output depends on the workers")
+    print(f"[parallel] 2000 independent top-level expressions, {default} CPU(s)")
+    for workers, t in elapsed.items():
+        print(f"  {workers:>2} worker(s): {t * 1e3:9.2f} ms | speedup {elapsed[1] / t:5.2f}x")
+
+
+benchmarks = {
+    "parsing": bench_parsing,
+    "fast-parser": bench_fast_parser,
+    "memory": bench_memory,
+    "vm": bench_vm,
+    "folding": bench_folding,
+    "fusion": bench_fusion,
+    "inline-cache": bench_inline_cache,
+    "memo": bench_memo,
+    "profile": bench_profile,
+    "hotspots": bench_hotspots,
+    "events": bench_events,
+    "budget": bench_budget,
+    "arrays": bench_arrays,
+    "scalars": bench_scalars,
+    "resolution": bench_resolution,
+    "scopes": bench_scopes,
+    "stacks": bench_stacks,
+    "parallel": bench_parallel,
+    "lines": bench_lines,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or benchmarks.keys()
+    print("***[START]***")
+    print("=" * 80)
+    for name in names:
+        benchmarks[name]()
+        print("=" * 80)
+    print("***[END]***")
@@ -1,14 +1,21 @@
-from typing import Any
+from typing import Any, Callable
 from abc import ABC, abstractmethod
 from functools import reduce
 from hhat_lang.interpreter.memory import Mem
+from hhat_lang.builtins.memo import memo_cache, memoized
 from hhat_lang.interpreter.var_handlers import Var
 from hhat_lang.datatypes import (
     builtin_array_types_dict,
     quantum_array_types_list,
 )
 from hhat_lang.datatypes import DataType, DataTypeArray
+from hhat_lang.datatypes.array_storage import array_prod, array_sum, is_ndarray
+from hhat_lang.datatypes.builtin_datatype import Int, IntArray
+from hhat_lang.syntax_trees.ast import DataTypeEnum
 from hhat_lang.utils import get_types_set
+from hhat_lang.utils.event_trace import events, traced_call
+from hhat_lang.utils.profiling import profiled, profiler
+from hhat_lang.utils.tracing import tracer, TraceCategory
 
 
 class MetaTypeFn(type):
@@ -16,9 +23,26 @@ class MetaTypeFn(type):
         return f"{cls.__name__}"
 
 
+# builtins defining a `__call__`, to wrap (see `install_calls`)
+builtin_classes: list[type] = []
+
+
 class MetaFn(ABC):
     token = "meta-default"
     type = "fn"
+    # no side effects and result depends only on its data: can be
+    # evaluated ahead of time on literal data
+    pure = False
+    quantum = False
+    # does input/output (or calls a quantum backend): branches of
+    # concurrent arrays yield to each other after calling it
+    io = False
+
+    def __init_subclass__(cls, **kwargs: Any):
+        super().__init_subclass__(**kwargs)
+        if "__call__" in cls.__dict__:
+            cls.plain_call = cls.__call__
+            builtin_classes.append(cls)
 
     def __init__(self, mem: Mem, *values: Any):
         self.mem = self.check_mem(mem, *values)
@@ -38,6 +62,9 @@ class MetaFn(ABC):
         if isinstance(data, DataType):
             return data,
         if isinstance(data, DataTypeArray):
+            if is_ndarray(data.data) and len(data):
+                # elements of one type, never changed in place: no copy
+                return data,
             res = ()
             for k in data:
                 res += self.check_data(k)
@@ -62,6 +89,8 @@ class MetaFn(ABC):
 
 class MetaQFn(MetaFn, ABC):
     token = "@meta-default"
+    quantum = True
+    io = True
 
     # This `check_mem` can be used when placing MetaQFn into
     # quantum variables data, so it can be used as a wildcard
@@ -100,8 +129,26 @@ class MetaQFn(MetaFn, ABC):
         ...
 
 
+def vector_reduce(data: Any, oper: Callable[[Any], int]) -> Int | None:
+    """`oper` (`array_sum` or `array_prod`) of a non-empty, ndarray-backed `IntArray`"""
+    if isinstance(data, IntArray) and is_ndarray(data.data) and len(data):
+        return Int(oper(data.data))
+    return None
+
+
+def vector_broadcast(data: Any, other: Any, type_val: Any) -> bool:
+    """Whether `data` and `other` can be combined as ndarray and int"""
+    return (
+        type_val == DataTypeEnum.INT
+        and isinstance(data, IntArray)
+        and is_ndarray(data.data)
+        and isinstance(other, Int)
+    )
+
+
 class Sum(MetaFn):
     token = "sum"
+    pure = True
 
     def __init__(self, mem: Mem, *values: Any):
         super().__init__(mem, *values)
@@ -110,13 +157,20 @@ class Sum(MetaFn):
         types_set_self = get_types_set(self.values)
         if len(types_set_self) == 1:
             if not values:
+                res = vector_reduce(self.values, array_sum)
+                if res is not None:
+                    return res,
                 return reduce(lambda x, y: x + y, self.values),
             values = self.check_data(values)[0]
             if len(values) == len(self.values):
                 return (values + self.values),
             types_set_other = get_types_set(values)
             type_val_other = types_set_other.pop()
-            other_res = reduce(lambda x, y: x + y, values)
+            other_res = vector_reduce(values, array_sum)
+            if other_res is None:
+                other_res = reduce(lambda x, y: x + y, values)
+            if vector_broadcast(self.values, other_res, type_val_other):
+                return self.values + other_res,
             self_oper = map(lambda x: x + other_res, self.values)
             return builtin_array_types_dict[type_val_other](*self_oper),
         raise NotImplementedError(
@@ -126,6 +180,7 @@ class Sum(MetaFn):
 
 class Times(MetaFn):
     token = "times"
+    pure = True
 
     def __init__(self, mem: Mem, *values: Any):
         super().__init__(mem, *values)
@@ -134,6 +189,9 @@ class Times(MetaFn):
         types_set_self = get_types_set(self.values)
         if len(types_set_self) == 1:
             if not values:
+                res = vector_reduce(self.values, array_prod)
+                if res is not None:
+                    return res,
                 return reduce(lambda x, y: x * y, self.values),
             values = self.check_data(values)
             if len(values) == len(self.values):
@@ -141,6 +199,8 @@ class Times(MetaFn):
             types_set_other = get_types_set(*values)
             type_val_other = types_set_other.pop()
             other_res = reduce(lambda x, y: x * y, values)
+            if vector_broadcast(self.values, other_res, type_val_other):
+                return self.values * other_res,
             self_oper = map(lambda x: x * other_res, self.values)
             return builtin_array_types_dict[type_val_other](*self_oper),
         raise NotImplementedError(
@@ -150,6 +210,7 @@ class Times(MetaFn):
 
 class Print(MetaFn):
     token = "print"
+    io = True
 
     def __init__(self, mem: Mem, *values: Any):
         super().__init__(mem, *values)
@@ -197,10 +258,12 @@ class QShuffle(MetaQFn):
         pass
 
     def __call__(self, *values: Any) -> tuple[Any]:
-        print(f">> @shuffle {self.token} values: {self.values}")
+        if tracer.quantum:
+            tracer.debug(TraceCategory.QUANTUM, ">> @shuffle %s values: %s", self.token, self.values)
         *new_self_vals, ast_data = self.values
         new_self_vals = tuple(new_self_vals)
-        print(f">> {new_self_vals=} | {ast_data=}")
+        if tracer.quantum:
+            tracer.debug(TraceCategory.QUANTUM, ">> new_self_vals=%r | ast_data=%r", new_self_vals, ast_data)
         types_set_self = get_types_set(*new_self_vals)
         if len(types_set_self) == 1:
             if len(values) == 0:
@@ -208,7 +271,8 @@ class QShuffle(MetaQFn):
                     if isinstance(k, Var):
                         self.mem.append_var_data(k, ast_data)
                     else:
-                        print("dunno what to do here")
+                        if tracer.quantum:
+                            tracer.warning(TraceCategory.QUANTUM, "dunno what to do here")
                 return new_self_vals
             raise NotImplementedError(
                 f"operation {self.token} is not implemented for extra args."
@@ -249,10 +313,12 @@ class QSync(MetaQFn):
         pass
 
     def __call__(self, *values: Any) -> tuple[Any]:
-        print(f">> @sync: {self.token} values: {self.values}")
+        if tracer.quantum:
+            tracer.debug(TraceCategory.QUANTUM, ">> @sync: %s values: %s", self.token, self.values)
         *new_self_vals, ast_data = self.values
         new_self_vals = tuple(new_self_vals)
-        print(f">> {new_self_vals=} | {ast_data=}")
+        if tracer.quantum:
+            tracer.debug(TraceCategory.QUANTUM, ">> new_self_vals=%r | ast_data=%r", new_self_vals, ast_data)
         types_set_self = get_types_set(*new_self_vals)
         if len(types_set_self) == 1:
             if len(values) == 0:
@@ -260,7 +326,8 @@ class QSync(MetaQFn):
                     if isinstance(k, Var):
                         self.mem.append_var_data(k, ast_data)
                     else:
-                        print("dunno what to do here")
+                        if tracer.quantum:
+                            tracer.warning(TraceCategory.QUANTUM, "dunno what to do here")
                 return new_self_vals
             raise NotImplementedError(
                 f"operation {self.token} is not implemented for extra args."
@@ -270,6 +337,28 @@ class QSync(MetaQFn):
         )
 
 
+def install_calls() -> None:
+    """Set the `__call__` of the builtins: the plain one, wrapped by what
+    is on, memoization (pure builtins, see `builtins.memo`), profiling
+    and event recording
+    """
+    for cls in builtin_classes:
+        call = cls.plain_call
+        if cls.pure and memo_cache.size:
+            call = memoized(call)
+        if profiler.enabled:
+            call = profiled(call)
+        if events.enabled:
+            call = traced_call(call)
+        cls.__call__ = call
+
+
+install_calls()
+memo_cache.listeners.append(install_calls)
+profiler.listeners.append(install_calls)
+events.listeners.append(install_calls)
+
+
 builtin_classical_fn_dict = {
     "sum": Sum,
     "times": Times,
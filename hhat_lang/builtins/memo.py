@@ -0,0 +1,168 @@
+"""Memoization of pure builtin calls
+
+Builtins declaring `pure = True` get their `__call__` memoized: results
+are kept in a size-bounded LRU cache keyed by the builtin token and the
+structure of its data (data types and values, nesting included), so an
+identical call returns the same, immutable, result objects. Calls with
+data that has no such key (variables, functions, quantum data) are not
+cached.
+
+Memoization is off by default: keys cost a walk over the data of every
+call, hit or miss. It is turned on by setting a cache size with
+`set_memo_size` (0 turns it off again), which installs the memoized
+`__call__` of the builtins, and its counters are available as
+`get_stats("memo")`.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Hashable
+
+from hhat_lang.datatypes import DataType, DataTypeArray
+from hhat_lang.datatypes.array_storage import is_ndarray
+from hhat_lang.datatypes.builtin_datatype import QArray
+from hhat_lang.interpreter.stats import register_stats
+
+
+DEFAULT_MEMO_SIZE = 0
+
+
+class MemoCache:
+    """LRU cache of builtin results"""
+    __slots__ = ("size", "entries", "hits", "misses", "uncached", "evictions", "listeners")
+
+    def __init__(self, size: int = DEFAULT_MEMO_SIZE):
+        self.size = size
+        self.entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        # called when memoization is turned on or off
+        self.listeners: list[Callable[[], None]] = []
+        self.reset()
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.evictions = 0
+
+    def resize(self, size: int) -> None:
+        if size < 0:
+            raise ValueError(f"memo size must be at least 0, got {size}.")
+        toggled = (size == 0) != (self.size == 0)
+        self.size = size
+        while len(self.entries) > size:
+            self.entries.popitem(last=False)
+        if toggled:
+            for listener in self.listeners:
+                listener()
+
+    def get(self, key: Hashable) -> tuple | None:
+        res = self.entries.get(key)
+        if res is not None:
+            self.entries.move_to_end(key)
+        return res
+
+    def put(self, key: Hashable, res: tuple) -> None:
+        self.entries[key] = res
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            uncached=self.uncached,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            evictions=self.evictions,
+            entries=len(self.entries),
+            size=self.size,
+        )
+
+
+memo_cache = MemoCache()
+register_stats("memo", memo_cache.as_dict, memo_cache.reset)
+
+
+def set_memo_size(size: int = DEFAULT_MEMO_SIZE) -> None:
+    """Maximum number of cached results (0: no memoization)"""
+    memo_cache.resize(size)
+
+
+def get_memo_size() -> int:
+    return memo_cache.size
+
+
+def clear_memo() -> None:
+    memo_cache.entries.clear()
+
+
+# how `data_key` handles each class, found once per class
+SCALAR, ARRAY, TUPLE, LEAF, NO_KEY = range(5)
+_kinds: dict[type, int] = dict()
+
+
+def data_kind(cls: type) -> int:
+    kind = _kinds.get(cls)
+    if kind is None:
+        if issubclass(cls, DataType):
+            kind = SCALAR
+        elif issubclass(cls, DataTypeArray) and not issubclass(cls, QArray):
+            kind = ARRAY
+        elif cls is tuple:
+            kind = TUPLE
+        elif cls in (bool, int, str, type(None)):
+            kind = LEAF
+        else:
+            kind = NO_KEY
+        _kinds[cls] = kind
+    return kind
+
+
+def data_key(data: Any) -> Hashable:
+    """Structural key of builtin data; `TypeError` if it has none"""
+    cls = type(data)
+    kind = data_kind(cls)
+    if kind == SCALAR:
+        # results of builtins may be scalars wrapping other scalars
+        key = ()
+        while kind == SCALAR:
+            key += cls,
+            data = data.data
+            cls = type(data)
+            kind = data_kind(cls)
+        if kind == LEAF:
+            return key + (cls, data)
+        return key + (data_key(data),)
+    if kind == ARRAY:
+        if is_ndarray(data.data):
+            return cls, data.data.dtype.str, data.data.tobytes()
+        return cls, tuple(data_key(k) for k in data.data)
+    if kind == TUPLE:
+        return tuple(data_key(k) for k in data)
+    if kind == LEAF:
+        return cls, data
+    raise TypeError(f"no memoization key for {cls.__name__}.")
+
+
+def memoized(call: Callable[..., tuple]) -> Callable[..., tuple]:
+    """Memoize the `__call__` of a pure builtin"""
+    @wraps(call)
+    def wrapper(self, values: Any | None = None) -> tuple:
+        try:
+            key = self.token, data_key(self.values), data_key(values)
+        except (TypeError, RecursionError):
+            memo_cache.uncached += 1
+            return call(self, values)
+        res = memo_cache.get(key)
+        if res is not None:
+            memo_cache.hits += 1
+            return res
+        memo_cache.misses += 1
+        res = call(self, values)
+        memo_cache.put(key, res)
+        return res
+
+    return wrapper
@@ -0,0 +1,115 @@
+"""Storage of classical arrays
+
+`IntArray` and `BoolArray` keep their elements as a tuple of `Int`/`Bool`
+objects (`ArrayStorage.TUPLE`, the default). With NumPy installed
+(`pip install hhat-lang[numpy]`), `set_array_storage(ArrayStorage.NUMPY)`
+makes them keep an `int64`/`bool` ndarray instead, so their arithmetic,
+broadcasting against `Int`, `sum` and `times` are single vectorized
+calls. Iterating such an array still gives `Int`/`Bool` objects.
+
+Python ints do not overflow: operations whose result may not fit in an
+`int64` run on Python ints, and arrays of values that do not fit (or of
+anything else than ints and bools) are stored as tuples.
+"""
+
+from __future__ import annotations
+
+from enum import Enum, unique
+from math import prod
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+INT64_BITS = 63
+
+
+@unique
+class ArrayStorage(Enum):
+    TUPLE       = "tuple"
+    NUMPY       = "numpy"
+
+
+_numpy_arrays = False
+
+
+def set_array_storage(storage: ArrayStorage | str = ArrayStorage.TUPLE) -> None:
+    global _numpy_arrays
+    storage = ArrayStorage(storage)
+    if storage == ArrayStorage.NUMPY and np is None:
+        raise NotImplementedError("numpy array storage needs NumPy (`pip install hhat-lang[numpy]`).")
+    _numpy_arrays = storage == ArrayStorage.NUMPY
+
+
+def get_array_storage() -> ArrayStorage:
+    return ArrayStorage.NUMPY if _numpy_arrays else ArrayStorage.TUPLE
+
+
+def numpy_arrays() -> bool:
+    return _numpy_arrays
+
+
+def is_ndarray(data: Any) -> bool:
+    return np is not None and isinstance(data, np.ndarray)
+
+
+def to_ndarray(values: list, dtype: Any) -> Any:
+    """ndarray of `values`; `None` if they do not fit in `dtype`"""
+    try:
+        return np.array(values, dtype=dtype)
+    except OverflowError:
+        return None
+
+
+def bound(data: Any) -> int:
+    """Largest absolute value in an int ndarray (or of an int)"""
+    if isinstance(data, int):
+        return abs(data)
+    if not len(data):
+        return 0
+    return max(int(data.max()), -int(data.min()))
+
+
+def fits(bits: int) -> bool:
+    return bits < INT64_BITS
+
+
+def add(first: Any, second: Any) -> Any:
+    """Elementwise `first + second` (ndarrays or an ndarray and an int),
+    the length of the shortest array; `None` if it may overflow
+    """
+    first, second = truncated(first, second)
+    if fits(max(bound(first), bound(second)).bit_length() + 1):
+        return first + second
+    return None
+
+
+def mul(first: Any, second: Any) -> Any:
+    """Elementwise `first * second`, as `add`"""
+    first, second = truncated(first, second)
+    if fits(bound(first).bit_length() + bound(second).bit_length()):
+        return first * second
+    return None
+
+
+def truncated(first: Any, second: Any) -> tuple[Any, Any]:
+    # as `map` over two tuples, stop at the end of the shortest one
+    if is_ndarray(first) and is_ndarray(second) and len(first) != len(second):
+        size = min(len(first), len(second))
+        return first[:size], second[:size]
+    return first, second
+
+
+def array_sum(data: Any) -> int:
+    if fits(bound(data).bit_length() + len(data).bit_length()):
+        return int(data.sum())
+    return sum(data.tolist())
+
+
+def array_prod(data: Any) -> int:
+    if fits(bound(data).bit_length() * len(data)):
+        return int(data.prod())
+    return prod(data.tolist())
@@ -3,10 +3,20 @@ from typing import Any, Iterable
 
 
 class DataType(ABC):
+    """Scalar data: `data` holds the native value (e.g. `int`, `bool`)"""
+    __slots__ = ("data",)
+
     def __init__(self, value: Any):
-        self.value = value
-        self.data = self.cast()
-        self.value = str(value)
+        self.data = self.cast(value)
+
+    @property
+    def value(self) -> str:
+        # written form, only built for output
+        return repr(self)
+
+    def __reduce__(self) -> tuple:
+        # rebuilt through the constructor (and its caches, if any)
+        return self.__class__, (self.data,)
 
     @property
     @abstractmethod
@@ -18,8 +28,9 @@ class DataType(ABC):
     def type(self):
         ...
 
+    @classmethod
     @abstractmethod
-    def cast(self):
+    def cast(cls, value: Any) -> Any:
         ...
 
     @abstractmethod
@@ -53,6 +64,14 @@ class DataTypeArray(ABC):
         self.value = values
         self.data = self.cast()
 
+    @classmethod
+    def from_data(cls, data: Any) -> "DataTypeArray":
+        """Array holding `data`, already cast"""
+        res = cls.__new__(cls)
+        res.value = data
+        res.data = data
+        return res
+
     @property
     @abstractmethod
     def token(self):
@@ -90,4 +109,4 @@ class DataTypeArray(ABC):
         yield from self.data
 
     def __repr__(self):
-        return f"[{' '.join(str(k) for k in self.data)}]"
+        return f"[{' '.join(str(k) for k in self)}]"
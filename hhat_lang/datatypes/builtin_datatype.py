@@ -1,8 +1,13 @@
-from typing import Any
+from __future__ import annotations
+
+from numbers import Integral
+from typing import Any, Callable, Iterable
 
 from hhat_lang.datatypes import DataType, DataTypeArray
+from hhat_lang.datatypes.array_storage import add, is_ndarray, mul, np, numpy_arrays, to_ndarray
 from hhat_lang.syntax_trees.ast import ASTType, DataTypeEnum
 from hhat_lang.interpreter.post_ast import R
+from hhat_lang.utils.tracing import tracer, TraceCategory
 
 
 ################
@@ -10,6 +15,8 @@ from hhat_lang.interpreter.post_ast import R
 ################
 
 class DefaultType(DataType):
+    __slots__ = ()
+
     @property
     def token(self):
         return "default-type"
@@ -18,8 +25,9 @@ class DefaultType(DataType):
     def type(self):
         return "default-type"
 
-    def cast(self) -> Any:
-        return self.value
+    @classmethod
+    def cast(cls, value: Any) -> Any:
+        return value
 
     def __add__(self, other: Any) -> Any:
         raise ValueError(f"cannot add with {self.__class__.__name__}.")
@@ -38,9 +46,21 @@ class DefaultType(DataType):
 
 
 class Bool(DataType):
+    __slots__ = ()
     undo_bool_dict = {True: "T", False: "F"}
     convert2bool_dict = dict(T=True, F=False)
 
+    def __new__(cls, value: Any = False) -> Bool:
+        data = cls.cast(value)
+        if cls is Bool:
+            return _bools[data]
+        res = object.__new__(cls)
+        res.data = data
+        return res
+
+    # `data` is set by `__new__`
+    __init__ = object.__init__
+
     @property
     def token(self):
         return "bool"
@@ -49,14 +69,19 @@ class Bool(DataType):
     def type(self):
         return DataTypeEnum.BOOL
 
-    def cast(self) -> Any:
-        if self.value in self.convert2bool_dict.keys():
-            return self.value
-        raise ValueError(f"Wrong value for boolean: {self.value}.")
+    @classmethod
+    def cast(cls, value: Any) -> bool:
+        if value is True or value is False:
+            return value
+        if type(value) is str and value in cls.convert2bool_dict:
+            return cls.convert2bool_dict[value]
+        if isinstance(value, Bool):
+            return value.data
+        raise ValueError(f"Wrong value for boolean: {value}.")
 
     def __add__(self, other: Any) -> Any:
         if isinstance(other, Bool):
-            return Bool(self.convert2bool_dict[self.data] and self.convert2bool_dict[other.data])
+            return Bool(self.data and other.data)
         raise ValueError(f"cannot add {self.__class__.__name__} with {other.__class__.__name__}")
 
     def __radd__(self, other: Any) -> Any:
@@ -70,8 +95,33 @@ class Bool(DataType):
     def __rmul__(self, other: Any) -> Any:
         ...
 
+    def __repr__(self) -> str:
+        return self.undo_bool_dict[self.data]
+
+
+_bools = {k: object.__new__(Bool) for k in (True, False)}
+for _k, _v in _bools.items():
+    _v.data = _k
+
+
+# `Int` objects of these values are cached, as small Python ints are
+SMALL_INT_MIN, SMALL_INT_MAX = -128, 1024
+
 
 class Int(DataType):
+    __slots__ = ()
+
+    def __new__(cls, value: Any = 0) -> Int:
+        data = value if type(value) is int else cls.cast(value)
+        if cls is Int and SMALL_INT_MIN <= data <= SMALL_INT_MAX:
+            return _small_ints[data - SMALL_INT_MIN]
+        res = object.__new__(cls)
+        res.data = data
+        return res
+
+    # `data` is set by `__new__`
+    __init__ = object.__init__
+
     @property
     def token(self):
         return "int"
@@ -80,14 +130,27 @@ class Int(DataType):
     def type(self):
         return DataTypeEnum.INT
 
-    def cast(self) -> Any:
-        return int(self.value) if isinstance(self.value, str) else self.value
+    @classmethod
+    def cast(cls, value: Any) -> int:
+        # results of builtins may be given as `Int` objects
+        while isinstance(value, Int):
+            value = value.data
+        if type(value) is int:
+            return value
+        if isinstance(value, (str, Integral)):
+            # `bool` and NumPy ints are stored as `int`
+            return int(value)
+        raise ValueError(f"Wrong value for int: {value!r}.")
 
     def __add__(self, other: Any) -> Any:
         if isinstance(other, Int):
             return Int(self.data + other.data)
         if isinstance(other, IntArray):
-            return IntArray(*tuple(map(lambda x: self.data + x, other.data)))
+            if is_ndarray(other.data):
+                res = other.vectorized(add, self)
+                if res is not None:
+                    return res
+            return IntArray(*tuple(map(lambda x: self.data + x, other.items())))
         if isinstance(other, int):
             return Int(self.data + other)
         if isinstance(other, tuple):
@@ -98,7 +161,11 @@ class Int(DataType):
         if isinstance(other, Int):
             return Int(other.data + self.data)
         if isinstance(other, IntArray):
-            return IntArray(*tuple(map(lambda x: x + self.data, other.data)))
+            if is_ndarray(other.data):
+                res = other.vectorized(add, self)
+                if res is not None:
+                    return res
+            return IntArray(*tuple(map(lambda x: x + self.data, other.items())))
         if isinstance(other, int):
             return Int(other + self.data)
         if isinstance(other, tuple):
@@ -109,7 +176,11 @@ class Int(DataType):
         if isinstance(other, Int):
             return Int(self.data * other.data)
         if isinstance(other, IntArray):
-            return IntArray(*tuple(map(lambda x: self.data * x, other.data)))
+            if is_ndarray(other.data):
+                res = other.vectorized(mul, self)
+                if res is not None:
+                    return res
+            return IntArray(*tuple(map(lambda x: self.data * x, other.items())))
         if isinstance(other, int):
             return Int(self.data * other)
         raise ValueError(f"cannot multiply {self.__class__.__name__} with {other.__class__.__name__}")
@@ -118,12 +189,29 @@ class Int(DataType):
         if isinstance(other, Int):
             return Int(other.data * self.data)
         if isinstance(other, IntArray):
-            return IntArray(*tuple(map(lambda x: x * self.data, other.data)))
+            if is_ndarray(other.data):
+                res = other.vectorized(mul, self)
+                if res is not None:
+                    return res
+            return IntArray(*tuple(map(lambda x: x * self.data, other.items())))
         if isinstance(other, int):
             return Int(other * self.data)
         raise ValueError(f"cannot multiply {self.__class__.__name__} with {other.__class__.__name__}")
 
 
+_small_ints = []
+for _k in range(SMALL_INT_MIN, SMALL_INT_MAX + 1):
+    _small_ints.append(object.__new__(Int))
+    _small_ints[-1].data = _k
+
+
+def int_value(data: Any) -> int | None:
+    # results of builtins may be Int wrapping other Int objects
+    while isinstance(data, Int):
+        data = data.data
+    return data if isinstance(data, int) and not isinstance(data, bool) else None
+
+
 ###############
 # ARRAY TYPES #
 ###############
@@ -140,15 +228,40 @@ class BoolArray(DataTypeArray):
         return DataTypeEnum.BOOL
 
     def cast(self) -> Any:
-        return tuple(Bool(k) for k in self.value)
+        if numpy_arrays():
+            data = self.cast_ndarray()
+            if data is not None:
+                return data
+        return tuple(k if isinstance(k, Bool) else Bool(k) for k in self.value)
+
+    def cast_ndarray(self) -> Any:
+        values = []
+        for k in self.value:
+            if isinstance(k, Bool):
+                values.append(k.data)
+            elif k in self.bool_dict:
+                values.append(self.bool_dict[k])
+            else:
+                return None
+        return to_ndarray(values, np.bool_)
+
+    def items(self) -> tuple:
+        return self.data if isinstance(self.data, tuple) else tuple(self)
+
+    @staticmethod
+    def and_bools(x: Bool, y: Bool) -> Bool:
+        return Bool(x.data and y.data)
 
     def __add__(self, other: Any) -> Any:
         if isinstance(other, BoolArray):
-            return BoolArray(*tuple(map(lambda x, y: x and y, self.data, other.data)))
+            if is_ndarray(self.data) and is_ndarray(other.data):
+                size = min(len(self), len(other))
+                return BoolArray.from_data(self.data[:size] & other.data[:size])
+            return BoolArray(*tuple(map(self.and_bools, self.items(), other.items())))
 
     def __radd__(self, other: Any) -> Any:
         if isinstance(other, BoolArray):
-            return BoolArray(*tuple(map(lambda x, y: x and y, other.data, self.data)))
+            return other + self
 
     def __mul__(self, other: Any) -> Any:
         ...
@@ -156,6 +269,12 @@ class BoolArray(DataTypeArray):
     def __rmul__(self, other: Any) -> Any:
         ...
 
+    def __iter__(self) -> Iterable:
+        if is_ndarray(self.data):
+            yield from (Bool(k) for k in self.data.tolist())
+        else:
+            yield from self.data
+
 
 class IntArray(DataTypeArray):
     @property
@@ -167,45 +286,110 @@ class IntArray(DataTypeArray):
         return DataTypeEnum.INT
 
     def cast(self):
+        if numpy_arrays():
+            data = self.cast_ndarray()
+            if data is not None:
+                return data
         res = ()
         for k in self.value:
             if isinstance(k, IntArray):
-                res += tuple(Int(p) for p in k)
+                # elements may also be variables
+                res += tuple(Int(p) if isinstance(p, Int) else p for p in k)
             elif isinstance(k, Int):
                 res += Int(k),
             else:
                 res += k,
         return res
 
+    def cast_ndarray(self) -> Any:
+        values = []
+        for k in self.value:
+            if isinstance(k, IntArray):
+                if is_ndarray(k.data):
+                    values.extend(k.data.tolist())
+                else:
+                    values.extend(int_value(p) for p in k.data)
+            else:
+                values.append(int_value(k))
+        if None in values:
+            return None
+        return to_ndarray(values, np.int64)
+
+    def items(self) -> tuple:
+        return self.data if isinstance(self.data, tuple) else tuple(self)
+
+    def vectorized(self, oper: Callable, other: Any) -> IntArray | None:
+        """`oper` (`add` or `mul`) on the ndarray of this array and an
+        ndarray-backed `IntArray` or an `Int`, if it fits in `int64`
+        """
+        if isinstance(other, IntArray):
+            if not is_ndarray(other.data):
+                return None
+            data = other.data
+        else:
+            data = int_value(other)
+            if data is None:
+                return None
+        res = oper(self.data, data)
+        return None if res is None else IntArray.from_data(res)
+
     def __add__(self, other: Any) -> Any:
+        if is_ndarray(self.data):
+            res = self.vectorized(add, other)
+            if res is not None:
+                return res
         if isinstance(other, IntArray):
-            return IntArray(*tuple(map(lambda x, y: x + y, self.data, other.data)))
+            return IntArray(*tuple(map(lambda x, y: x + y, self.items(), other.items())))
         if isinstance(other, Int):
-            return IntArray(*tuple(map(lambda x: x + other.data, self.data)))
-        print(f"* [add] what is other? {type(other)} {other}")
+            return IntArray(*tuple(map(lambda x: x + other.data, self.items())))
+        if tracer.eval:
+            tracer.warning(TraceCategory.EVAL, "* [add] what is other? %s %s", type(other), other)
 
     def __radd__(self, other: Any) -> Any:
+        if is_ndarray(self.data):
+            res = self.vectorized(add, other)
+            if res is not None:
+                return res
         if isinstance(other, IntArray):
-            return IntArray(*tuple(map(lambda x, y: x + y, other.data, self.data)))
+            return IntArray(*tuple(map(lambda x, y: x + y, other.items(), self.items())))
         if isinstance(other, Int):
-            return IntArray(*tuple(map(lambda x: other.data + x, self.data)))
-        print(f"* [radd] what is other? {type(other)} {other}")
+            return IntArray(*tuple(map(lambda x: other.data + x, self.items())))
+        if tracer.eval:
+            tracer.warning(TraceCategory.EVAL, "* [radd] what is other? %s %s", type(other), other)
 
     def __mul__(self, other: Any) -> Any:
+        if is_ndarray(self.data):
+            res = self.vectorized(mul, other)
+            if res is not None:
+                return res
         if isinstance(other, IntArray):
-            print(f"mult int array: {self.data} ({type(self.data)}) | {other.data} ({type(other.data)})")
-            return IntArray(*tuple(map(lambda x, y: x * y, self.data, other.data)))
+            if tracer.eval:
+                tracer.debug(TraceCategory.EVAL, "mult int array: %s (%s) | %s (%s)", self.data, type(self.data), other.data, type(other.data))
+            return IntArray(*tuple(map(lambda x, y: x * y, self.items(), other.items())))
         if isinstance(other, Int):
-            return IntArray(*tuple(map(lambda x: x * other.data, self.data)))
-        print(f"* [mul] mult int array: {self.data} ({type(self.data)}) | {other.data} ({type(other.data)})")
+            return IntArray(*tuple(map(lambda x: x * other.data, self.items())))
+        if tracer.eval:
+            tracer.warning(TraceCategory.EVAL, "* [mul] what is other? %s %s", type(other), other)
 
     def __rmul__(self, other: Any) -> Any:
         if isinstance(other, IntArray):
-            print(f"mult int array: {self.data} ({type(self.data)}) | {other.data} ({type(other.data)})")
-            return IntArray(*tuple(map(lambda x, y: x + y, other.data, self.data)))
+            if tracer.eval:
+                tracer.debug(TraceCategory.EVAL, "mult int array: %s (%s) | %s (%s)", self.data, type(self.data), other.data, type(other.data))
+            return IntArray(*tuple(map(lambda x, y: x + y, other.items(), self.items())))
         if isinstance(other, Int):
-            return IntArray(*tuple(map(lambda x: other.data * x, self.data)))
-        print(f"* [rmul] mult int array: {self.data} ({type(self.data)}) | {other.data} ({type(other.data)})")
+            if is_ndarray(self.data):
+                res = self.vectorized(mul, other)
+                if res is not None:
+                    return res
+            return IntArray(*tuple(map(lambda x: other.data * x, self.items())))
+        if tracer.eval:
+            tracer.warning(TraceCategory.EVAL, "* [rmul] what is other? %s %s", type(other), other)
+
+    def __iter__(self) -> Iterable:
+        if is_ndarray(self.data):
+            yield from (Int(k) for k in self.data.tolist())
+        else:
+            yield from self.data
 
 
 class MultiTypeArray(DataTypeArray):
@@ -243,7 +427,8 @@ class QArray(DataTypeArray):
         return "@array"
 
     def cast(self) -> tuple[Any]:
-        print(f">>> cast @array -> {self.value}")
+        if tracer.quantum:
+            tracer.debug(TraceCategory.QUANTUM, ">>> cast @array -> %s", self.value)
         return tuple(k for k in self.value)
 
     def __add__(self, other: Any) -> Any:
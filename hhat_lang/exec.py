@@ -1,7 +1,21 @@
-from hhat_lang.interpreter import parse_code, Analysis, Eval
+from hhat_lang.interpreter import (
+    parse_code, ParserBackend, Analysis, Eval, EvalBackend, Budget, ExecutionBudgetExceeded,
+)
 from hhat_lang.interpreter.post_ast import R
+from hhat_lang.interpreter.cache import load_analysis, store_analysis, cache_path
+from hhat_lang.interpreter.pool import set_parallel_lines, set_workers
+from hhat_lang.builtins.memo import DEFAULT_MEMO_SIZE, set_memo_size
+from hhat_lang.datatypes.array_storage import ArrayStorage, set_array_storage
+from hhat_lang.interpreter.hotspots import sampler
+from hhat_lang.interpreter.streaming import iter_file_chunks, stream_analyze
 from hhat_lang.syntax_trees import AST
+from hhat_lang.utils.event_trace import events
+from hhat_lang.utils.ids import new_run
+from hhat_lang.utils.profiling import profiler
+from hhat_lang.utils.spans import NO_SPAN, SourceMap
+from hhat_lang.utils.tracing import tracer, TraceCategory, TraceLevel, TraceSink
 from hhat_lang import __version__
+from typing import Iterable
 import click
 
 
@@ -10,8 +24,12 @@ def read_file(file: str) -> str:
         return open(file, "r").read()
 
 
-def execute_parsing_code(c: str, verbose: bool = False) -> AST:
-    pc_ = parse_code(c)
+def execute_parsing_code(
+        c: str,
+        verbose: bool = False,
+        backend: ParserBackend = ParserBackend.PEG,
+) -> AST:
+    pc_ = parse_code(c, backend=backend)
     if verbose:
         print("-" * 80)
         print(f"- code:\n{c}")
@@ -20,40 +38,407 @@ def execute_parsing_code(c: str, verbose: bool = False) -> AST:
     return pc_
 
 
-def execute_analysis(pc: AST, verbose: bool = False) -> R:
+def execute_analysis(
+        pc: AST,
+        verbose: bool = False,
+        opt_level: int = 0,
+        source: SourceMap | None = None,
+) -> R:
     if verbose:
         print("-" * 80)
         print(f"- analysis (pre-evaluation):")
-    analysis = Analysis(pc)
+    analysis = Analysis(pc, opt_level=opt_level)
     res_ = analysis.run()
-    print("\n")
+    if verbose:
+        print(f"{res_}\n")
+        path_cost, path = analysis.dataflow.critical_path()
+        print(
+            f"- dataflow: {len(analysis.dataflow.levels())} levels"
+            f" | critical path: {len(path)} expression(s), {path_cost} nodes"
+        )
+        if source is not None:
+            print_path(res_, path, source)
+        print()
     return res_
 
 
-def execute_eval(c: R) -> None:
-    ev_ = Eval(c)
+def print_path(code: R, path: tuple[int, ...], source: SourceMap) -> None:
+    """Location and source text of the top-level expressions in `path`"""
+    lines = {k.id: k for k in code if isinstance(k, R)}
+    for node_id in path:
+        span = lines[node_id].span
+        if span != NO_SPAN:
+            print(f"    {source.location(span)}  {' '.join(source.text(span).split())}")
+
+
+def execute_cached_analysis(
+        c: str,
+        file: str,
+        verbose: bool = False,
+        backend: ParserBackend = ParserBackend.PEG,
+        cache_dir: str | None = None,
+        opt_level: int = 0,
+) -> R:
+    pev_ = load_analysis(file, c, cache_dir, opt_level=opt_level)
+    if pev_ is not None:
+        new_run().adopt(pev_)
+        if verbose:
+            print("-" * 80)
+            print(f"- analysis loaded from {cache_path(file, cache_dir)}\n")
+        return pev_
+    pc_ = execute_parsing_code(c, verbose, backend)
+    pev_ = execute_analysis(pc_, verbose, opt_level, SourceMap(c, file))
+    store_analysis(file, c, pev_, cache_dir, opt_level=opt_level)
+    return pev_
+
+
+def execute_eval(
+        c: R | Iterable[R],
+        engine: EvalBackend = EvalBackend.TREE,
+        profile: bool = False,
+        hotspots: bool = False,
+        record_events: bool = False,
+        budget: Budget | None = None,
+) -> None:
+    ev_ = Eval(c, backend=engine, budget=budget)
     print("- executing code:\n")
-    ev_.run()
+    if profile:
+        profiler.enable()
+    if hotspots:
+        sampler.start()
+    if record_events:
+        events.enable()
+    try:
+        ev_.run()
+    finally:
+        events.disable()
+        sampler.stop()
+        profiler.disable()
+
+
+def run_codes(
+        c: str,
+        verbose: bool = False,
+        backend: ParserBackend = ParserBackend.PEG,
+        engine: EvalBackend = EvalBackend.TREE,
+        opt_level: int = 0,
+        profile: bool = False,
+        hotspots: bool = False,
+        record_events: bool = False,
+        budget: Budget | None = None,
+) -> None:
+    pc_ = execute_parsing_code(c, verbose, backend)
+    pev_ = execute_analysis(pc_, verbose, opt_level, SourceMap(c))
+    print("-" * 80)
+    execute_eval(pev_, engine, profile, hotspots, record_events, budget)
+
+
+def run_file(
+        file: str,
+        verbose: bool = False,
+        backend: ParserBackend = ParserBackend.PEG,
+        use_cache: bool = True,
+        cache_dir: str | None = None,
+        engine: EvalBackend = EvalBackend.TREE,
+        opt_level: int = 0,
+        profile: bool = False,
+        hotspots: bool = False,
+        record_events: bool = False,
+        budget: Budget | None = None,
+) -> None:
+    c = read_file(file)
+    if use_cache:
+        pev_ = execute_cached_analysis(c, file, verbose, backend, cache_dir, opt_level)
+    else:
+        pc_ = execute_parsing_code(c, verbose, backend)
+        pev_ = execute_analysis(pc_, verbose, opt_level, SourceMap(c, file))
+    print("-" * 80)
+    execute_eval(pev_, engine, profile, hotspots, record_events, budget)
 
 
-def run_codes(c: str, verbose: bool = False) -> None:
-    pc_ = execute_parsing_code(c, verbose)
-    pev_ = execute_analysis(pc_, verbose)
+def run_file_stream(
+        file: str,
+        verbose: bool = False,
+        backend: ParserBackend = ParserBackend.PEG,
+        engine: EvalBackend = EvalBackend.TREE,
+        opt_level: int = 0,
+        profile: bool = False,
+        hotspots: bool = False,
+        record_events: bool = False,
+        budget: Budget | None = None,
+) -> None:
+    if verbose:
+        print("-" * 80)
+        print(f"- streaming code from {file}")
     print("-" * 80)
-    execute_eval(pev_)
+    code = stream_analyze(iter_file_chunks(file), backend=backend, opt_level=opt_level)
+    execute_eval(code, engine, profile, hotspots, record_events, budget)
+
+
+def write_profile(file: str | None = None) -> None:
+    if file is None:
+        click.echo(profiler.report(), err=True)
+    else:
+        with open(file, "w") as f:
+            profiler.write_json(f)
+
+
+def write_hotspots(file: str) -> None:
+    click.echo(sampler.report(SourceMap.from_file(file)), err=True)
+
+
+def write_events(flamegraph: str | None, chrome_trace: str | None) -> None:
+    if flamegraph is not None:
+        with open(flamegraph, "w") as f:
+            events.write_collapsed(f)
+    if chrome_trace is not None:
+        with open(chrome_trace, "w") as f:
+            events.write_chrome(f)
+
+
+def enable_tracing(trace: str, level: str, file: str | None = None) -> None:
+    if trace == "all":
+        categories = tuple(TraceCategory)
+    else:
+        categories = tuple(TraceCategory(k.strip()) for k in trace.split(","))
+    sink = TraceSink(open(file, "w")) if file else None
+    tracer.enable(categories, level=level, sink=sink)
 
 
 @click.group(invoke_without_command=True, context_settings=dict(ignore_unknown_options=True))
 @click.argument("file", type=click.Path(exists=True), required=False)
 @click.option("-v", "--version", "version", is_flag=True)
 @click.option("--verbose", "verbose", is_flag=True)
-def main(file, version, verbose):
+@click.option(
+    "--parser",
+    "parser",
+    type=click.Choice([k.name.lower() for k in ParserBackend]),
+    default=ParserBackend.PEG.name.lower(),
+    help=(
+        "peg: compile grammar.peg; python: use the precompiled python grammar;"
+        " fast: use the hand-written lexer and parser."
+    ),
+)
+@click.option(
+    "--engine",
+    "engine",
+    type=click.Choice([k.name.lower() for k in EvalBackend]),
+    default=EvalBackend.TREE.name.lower(),
+    help="tree: walk the analyzed tree; vm: compile it to bytecode and run it on a stack VM.",
+)
+@click.option(
+    "-O",
+    "--opt-level",
+    "opt_level",
+    type=click.IntRange(0, 2),
+    default=0,
+    help="0: no optimization; 1: fold constant pipelines (e.g. `.[2 3 4]:sum`); 2: also fuse runs of pure builtin calls (e.g. `x:sum:times`).",
+)
+@click.option(
+    "--workers",
+    "workers",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="worker processes for parallel `{...}` arrays; 1 runs them serially, 0 uses one per CPU.",
+)
+@click.option(
+    "--parallel-lines",
+    "parallel_lines",
+    is_flag=True,
+    default=False,
+    help="run independent top-level expressions on the `--workers` pool; output stays in program order (not with --stream).",
+)
+@click.option(
+    "--memo-size",
+    "memo_size",
+    type=click.IntRange(min=0),
+    default=DEFAULT_MEMO_SIZE,
+    show_default=True,
+    help="results of pure builtin calls (e.g. `sum`, `times`) to keep for identical calls; 0 disables memoization.",
+)
+@click.option(
+    "--arrays",
+    "arrays",
+    type=click.Choice([k.value for k in ArrayStorage]),
+    default=ArrayStorage.TUPLE.value,
+    show_default=True,
+    help="storage of int and bool arrays; numpy vectorizes their arithmetic (needs NumPy).",
+)
+@click.option("--no-cache", "no_cache", is_flag=True, help="do not read or write .hatc files.")
+@click.option(
+    "--cache-dir",
+    "cache_dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="store .hatc files in this directory instead of next to the source.",
+)
+@click.option(
+    "--stream",
+    "stream",
+    is_flag=True,
+    help="parse, analyze and execute one top-level expression at a time (no .hatc cache).",
+)
+@click.option(
+    "--trace",
+    "trace",
+    default=None,
+    help=(
+        "comma-separated trace categories ("
+        + ", ".join(k.value for k in TraceCategory)
+        + ") or 'all'."
+    ),
+)
+@click.option(
+    "--trace-level",
+    "trace_level",
+    type=click.Choice([k.name.lower() for k in TraceLevel if k is not TraceLevel.OFF]),
+    default=TraceLevel.DEBUG.name.lower(),
+)
+@click.option(
+    "--trace-file",
+    "trace_file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="write traces to this file instead of stderr.",
+)
+@click.option(
+    "--profile",
+    "profile",
+    is_flag=True,
+    help="print calls, times and allocations per node type, VM instruction and builtin to stderr.",
+)
+@click.option(
+    "--profile-file",
+    "profile_file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="write the profile as JSON to this file (implies --profile).",
+)
+@click.option(
+    "--hotspots",
+    "hotspots",
+    is_flag=True,
+    help="sample the execution and print the source lines and pipelines taking the most time to stderr.",
+)
+@click.option(
+    "--flamegraph",
+    "flamegraph",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="record the evaluated nodes and builtin calls and write them as collapsed stacks (ns) to this file.",
+)
+@click.option(
+    "--chrome-trace",
+    "chrome_trace",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="record the evaluated nodes and builtin calls and write them as Chrome trace events to this file.",
+)
+@click.option(
+    "--max-steps",
+    "max_steps",
+    type=click.IntRange(min=0),
+    default=None,
+    help="abort the execution after this many evaluation steps (nodes or VM instructions).",
+)
+@click.option(
+    "--timeout",
+    "timeout",
+    type=click.FloatRange(min=0),
+    default=None,
+    help="abort the execution after this many seconds.",
+)
+@click.option(
+    "--max-mem",
+    "max_mem",
+    type=click.IntRange(min=0),
+    default=None,
+    help="abort the execution when the memory holds more than this many values.",
+)
+def main(
+        file,
+        version,
+        verbose,
+        parser,
+        engine,
+        opt_level,
+        workers,
+        parallel_lines,
+        memo_size,
+        arrays,
+        no_cache,
+        cache_dir,
+        stream,
+        trace,
+        trace_level,
+        trace_file,
+        profile,
+        profile_file,
+        hotspots,
+        flamegraph,
+        chrome_trace,
+        max_steps,
+        timeout,
+        max_mem,
+):
+    if trace:
+        enable_tracing(trace, trace_level, trace_file)
+    set_workers(workers or None)
+    set_parallel_lines(parallel_lines)
+    set_memo_size(memo_size)
+    try:
+        set_array_storage(arrays)
+    except NotImplementedError as e:
+        raise click.UsageError(str(e))
+    profile = profile or profile_file is not None
+    record_events = flamegraph is not None or chrome_trace is not None
+    budget = (
+        Budget(max_steps=max_steps, timeout=timeout, max_mem=max_mem)
+        if (max_steps, timeout, max_mem) != (None, None, None)
+        else None
+    )
     if version:
         click.echo(f"H-hat version {__version__}")
     else:
-        if file:
-            code_text = read_file(file)
-            run_codes(code_text, verbose=verbose)
-        else:
-            # TODO: make a REPL?
-            pass
+        exceeded = None
+        try:
+            if file and stream:
+                run_file_stream(
+                    file,
+                    verbose=verbose,
+                    backend=ParserBackend[parser.upper()],
+                    engine=EvalBackend[engine.upper()],
+                    opt_level=opt_level,
+                    profile=profile,
+                    hotspots=hotspots,
+                    record_events=record_events,
+                    budget=budget,
+                )
+            elif file:
+                run_file(
+                    file,
+                    verbose=verbose,
+                    backend=ParserBackend[parser.upper()],
+                    use_cache=not no_cache,
+                    cache_dir=cache_dir,
+                    engine=EvalBackend[engine.upper()],
+                    opt_level=opt_level,
+                    profile=profile,
+                    hotspots=hotspots,
+                    record_events=record_events,
+                    budget=budget,
+                )
+            else:
+                # TODO: make a REPL?
+                pass
+        except ExecutionBudgetExceeded as e:
+            exceeded = e
+        if file and profile:
+            write_profile(profile_file)
+        if file and hotspots:
+            write_hotspots(file)
+        if file and record_events:
+            write_events(flamegraph, chrome_trace)
+        if exceeded is not None:
+            raise click.ClickException(str(exceeded))
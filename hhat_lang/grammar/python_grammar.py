@@ -0,0 +1,61 @@
+"""Precompiled H-hat grammar
+
+Python-grammar version of `grammar.peg`, to be used with Arpeggio's
+`ParserPython`. It skips the cleanpeg grammar compilation step when
+building the parser. It must be kept in sync with `grammar.peg`: rule
+names are the same, so the `CST` visitor works on both parse trees.
+`test_python_grammar` fails if the rules of the two grammars differ.
+"""
+
+from arpeggio import ZeroOrMore, OneOrMore, Optional, EOF, RegExMatch
+
+
+def program():
+    return ZeroOrMore(exprs), EOF
+
+
+def exprs():
+    return (
+        [single, (".", sequential), (".", concurrent), (".", parallel)],
+        ZeroOrMore(":", exprs),
+    )
+
+
+def expr():
+    return [literal, operation]
+
+
+def single():
+    return expr
+
+
+def sequential():
+    return "[", OneOrMore(exprs), "]"
+
+
+def concurrent():
+    return "(", OneOrMore(exprs), ")"
+
+
+def parallel():
+    return "{", OneOrMore(exprs), "}"
+
+
+def operation():
+    return id, Optional([sequential, concurrent, parallel])
+
+
+def id():
+    return RegExMatch(r"(\!)?(\`)?(\@)?[a-zA-Z\-\+][a-zA-Z\-\+_0-9]*")
+
+
+def literal():
+    return [BOOL, INT]
+
+
+def BOOL():
+    return RegExMatch(r"T|F")
+
+
+def INT():
+    return RegExMatch(r"(0|-?[1-9][0-9]*)")
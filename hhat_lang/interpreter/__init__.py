@@ -1,3 +1,4 @@
-from .parsing import parse_code
+from .parsing import parse_code, ParserBackend, ParseError
 from .semantics import Analysis
-from .eval import Eval
+from .eval import Eval, EvalBackend
+from .governor import Budget, ExecutionBudgetExceeded
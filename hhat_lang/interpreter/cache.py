@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import pickle
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+
+from hhat_lang import __version__
+from hhat_lang.interpreter.post_ast import R
+
+
+# Bump it whenever the pickled layout of R, AST or ATO objects, or what
+# the analysis stores in them, changes, so old .hatc files are rebuilt
+# instead of loaded.
+HATC_FORMAT = 8
+HATC_SUFFIX = ".hatc"
+
+
+def source_key(code: str, **options: Any) -> str:
+    """Key of a compiled artifact
+
+    Hash of the interpreter version, the artifact format, the analysis
+    options and the source code itself.
+    """
+    header = f"{__version__}|{HATC_FORMAT}|" + "|".join(
+        f"{k}={v}" for k, v in sorted(options.items())
+    )
+    return sha256((header + "\n" + code).encode("utf-8")).hexdigest()
+
+
+def cache_path(file: str, cache_dir: str | None = None) -> Path:
+    """Path of the .hatc file for a given source file
+
+    Placed next to the source file or, if `cache_dir` is given, inside it
+    with a name derived from the absolute source path.
+    """
+    source = Path(file).resolve()
+    if cache_dir is None:
+        return source.with_suffix(HATC_SUFFIX)
+    name = source.stem + "-" + sha256(str(source).encode("utf-8")).hexdigest()[:16]
+    return Path(cache_dir) / (name + HATC_SUFFIX)
+
+
+def load_analysis(
+        file: str,
+        code: str,
+        cache_dir: str | None = None,
+        **options: Any,
+) -> R | None:
+    """Load the analyzed R tree of `code`, if a valid artifact exists
+
+    Anything wrong with the artifact (missing, unreadable, from another
+    version, format or source) is a cache miss. Artifacts are unpickled,
+    so cache directories must be as trusted as the source files.
+    """
+    path = cache_path(file, cache_dir)
+    try:
+        with open(path, "rb") as f:
+            artifact = pickle.load(f)
+        if (
+            artifact["format"] == HATC_FORMAT
+            and artifact["key"] == source_key(code, **options)
+            and isinstance(artifact["code"], R)
+        ):
+            return artifact["code"]
+    except Exception:
+        pass
+    return None
+
+
+def store_analysis(
+        file: str,
+        code: str,
+        analyzed: R,
+        cache_dir: str | None = None,
+        **options: Any,
+) -> Path | None:
+    """Store the analyzed R tree of `code` as a .hatc file
+
+    The file is written atomically, so concurrent runs never read a
+    partial artifact. Failing to write it only means no caching.
+    """
+    path = cache_path(file, cache_dir)
+    artifact = dict(
+        format=HATC_FORMAT,
+        version=__version__,
+        key=source_key(code, **options),
+        code=analyzed,
+    )
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError, RecursionError):
+        tmp_path.unlink(missing_ok=True)
+        return None
+    return path
@@ -0,0 +1,172 @@
+"""Dataflow dependencies between expressions
+
+Records which variables each top-level expression and each array
+element defines and reads, and stores in its `execute_after` the ids of
+the sibling expressions it depends on. Siblings are the top-level
+expressions of the program or the elements of the same array, so each
+level forms its own DAG. The program order is kept for dependent
+expressions only: independent ones could run out of order or
+concurrently.
+
+A variable is defined by its first assignment (`:z`) in program order;
+later references only read it, since initialized variables cannot be
+assigned again. Quantum variables (`@q1`) are updated by the quantum
+functions they go through, so every reference after the first one is
+both a read and a write.
+"""
+
+from __future__ import annotations
+
+from enum import Enum, auto, unique
+from typing import Iterable
+
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.syntax_trees.ast import ATO, ASTType
+from hhat_lang.utils.tracing import tracer, TraceCategory
+
+
+@unique
+class Access(Enum):
+    USE     = auto()
+    DEF     = auto()
+    UPDATE  = auto()
+
+
+class Siblings:
+    """Dependencies between sibling expressions, added in program order"""
+    __slots__ = ("last_writer", "readers")
+
+    def __init__(self):
+        self.last_writer: dict[str, int] = dict()
+        self.readers: dict[str, list[int]] = dict()
+
+    def link(self, node_id: int, accesses: Iterable[tuple[str, Access]]) -> tuple[int, ...]:
+        deps = set()
+        for name, access in accesses:
+            writer = self.last_writer.get(name)
+            if writer is not None:
+                deps.add(writer)
+            if access == Access.USE:
+                self.readers.setdefault(name, []).append(node_id)
+            else:
+                deps.update(self.readers.pop(name, ()))
+                self.last_writer[name] = node_id
+        deps.discard(node_id)
+        return tuple(sorted(deps))
+
+
+class DataflowBuilder:
+    """Dataflow pass, fed with top-level expressions in program order
+
+    Expressions can be added one at a time (e.g. while streaming). With
+    `keep_graph=False` only what is needed to link the next expressions
+    is kept: `execute_after` is still filled in, but no graph is kept for
+    `critical_path` and `levels`.
+    """
+    def __init__(self, keep_graph: bool = True):
+        self.keep_graph = keep_graph
+        self.defined: set[str] = set()
+        self.top = Siblings()
+        self.order: list[int] = []
+        self.deps: dict[int, tuple[int, ...]] = dict()
+        self.cost: dict[int, int] = dict()
+        self.defs: dict[int, frozenset[str]] = dict()
+        self.uses: dict[int, frozenset[str]] = dict()
+
+    def add_program(self, code: R) -> None:
+        for k in code:
+            self.add(k)
+
+    def add(self, code: R | ATO) -> None:
+        """Add the next top-level expression"""
+        accesses, size = self.collect(code)
+        if isinstance(code, R):
+            code.execute_after = self.top.link(code.id, accesses)
+            self.record(code, accesses)
+            if self.keep_graph:
+                self.order.append(code.id)
+                self.deps[code.id] = code.execute_after
+                self.cost[code.id] = size
+
+    def record(self, code: R, accesses: list[tuple[str, Access]]) -> None:
+        if tracer.analysis:
+            tracer.debug(
+                TraceCategory.ANALYSIS,
+                "dataflow %s: %s after %s",
+                code.id,
+                " ".join(f"{a.name.lower()}:{n}" for n, a in accesses),
+                code.execute_after,
+            )
+        if self.keep_graph:
+            self.defs[code.id] = frozenset(n for n, a in accesses if a != Access.USE)
+            self.uses[code.id] = frozenset(n for n, a in accesses if a != Access.DEF)
+
+    def var_access(self, code: R) -> Access:
+        name = code.value[0].token
+        if name in self.defined:
+            return Access.UPDATE if name.startswith("@") else Access.USE
+        if code.role == "callee":
+            # read before any assignment: fails at execution, in order
+            return Access.USE
+        self.defined.add(name)
+        return Access.DEF
+
+    def collect(self, code: R | ATO) -> tuple[list[tuple[str, Access]], int]:
+        """Variable accesses of `code`, in execution order, and its size"""
+        if isinstance(code, ATO):
+            return [], 1
+        if code.type == ASTType.ID and len(code) == 1 and isinstance(code.value[0], ATO):
+            return [(code.value[0].token, self.var_access(code))], 2
+        accesses = []
+        size = 1
+        if code.type == ASTType.ARRAY:
+            siblings = Siblings()
+            for k in code:
+                k_accesses, k_size = self.collect(k)
+                if isinstance(k, R):
+                    k.execute_after = siblings.link(k.id, k_accesses)
+                    self.record(k, k_accesses)
+                accesses += k_accesses
+                size += k_size
+        else:
+            for k in code:
+                k_accesses, k_size = self.collect(k)
+                accesses += k_accesses
+                size += k_size
+        return accesses, size
+
+    def critical_path(self) -> tuple[int, tuple[int, ...]]:
+        """Longest chain of dependent top-level expressions
+
+        Expressions are weighted by their number of nodes. Returns the
+        total weight and the ids along the path.
+        """
+        best: dict[int, tuple[int, tuple[int, ...]]] = dict()
+        for node_id in self.order:
+            prev = max((best[k] for k in self.deps[node_id]), default=(0, ()))
+            best[node_id] = prev[0] + self.cost[node_id], prev[1] + (node_id,)
+        return max(best.values(), default=(0, ()))
+
+    def levels(self) -> tuple[tuple[int, ...], ...]:
+        """Top-level expression ids grouped by depth in the DAG
+
+        Expressions in the same level do not depend on each other.
+        """
+        depth: dict[int, int] = dict()
+        res: list[list[int]] = []
+        for node_id in self.order:
+            n = max((depth[k] + 1 for k in self.deps[node_id]), default=0)
+            depth[node_id] = n
+            if n == len(res):
+                res.append([])
+            res[n].append(node_id)
+        return tuple(tuple(k) for k in res)
+
+
+def build_dataflow(code: R | ATO, keep_graph: bool = True) -> DataflowBuilder:
+    builder = DataflowBuilder(keep_graph=keep_graph)
+    if isinstance(code, R) and code.type == ASTType.MAIN:
+        builder.add_program(code)
+    else:
+        builder.add(code)
+    return builder
@@ -1,29 +1,70 @@
-from typing import Any
+from typing import Any, Iterable
 
-from copy import deepcopy
+from collections import deque
+from contextlib import redirect_stdout
+from enum import Enum, auto, unique
+from itertools import chain
 import asyncio
+import io
+import pickle
+import sys
 from hhat_lang.interpreter.post_ast import R
 from hhat_lang.interpreter.var_handlers import Var
-from hhat_lang.syntax_trees.ast import ATO, ASTType, operations_or_id, ExprParadigm
+from hhat_lang.syntax_trees.ast import ATO, ASTType, Id, operations_or_id, ExprParadigm
 from hhat_lang.datatypes.builtin_datatype import (
     builtin_data_types_dict,
     builtin_array_types_dict,
-    quantum_array_types_list,
 )
 from hhat_lang.datatypes.base_datatype import DataType, DataTypeArray
 from hhat_lang.builtins.functions import builtin_fn_dict, builtin_quantum_fn_dict
-from hhat_lang.utils.utils import get_types_set
 from hhat_lang.interpreter.memory import Mem
+from hhat_lang.interpreter.governor import Budget, ExecutionBudgetExceeded, governor, run_governed
+from hhat_lang.interpreter.inline_cache import call_builtin
+from hhat_lang.interpreter.pool import get_parallel_lines, get_pool, get_workers
+from hhat_lang.utils.event_trace import events
+from hhat_lang.utils.ids import current_ids, new_run
+from hhat_lang.utils.profiling import profiler, ProfileKind
+from hhat_lang.utils.tracing import tracer, TraceCategory
+
+
+@unique
+class EvalBackend(Enum):
+    TREE    = auto()
+    VM      = auto()
 
 
 class Eval:
-    def __init__(self, code: R):
+    def __init__(
+            self,
+            code: R | Iterable[R | ATO],
+            backend: EvalBackend = EvalBackend.TREE,
+            budget: Budget | None = None,
+    ):
         self.code = code
+        self.backend = backend
+        self.budget = budget
 
-    def run(self):
+    def run(self) -> Mem:
+        """Run the code (raises `ExecutionBudgetExceeded` when over budget)"""
         mem = Mem()
-        execute(self.code, mem)
-        print("\n", mem)
+        run_governed(self.budget, self.run_on, mem)
+        if tracer.eval:
+            tracer.info(TraceCategory.EVAL, "memory: %s", mem)
+        return mem
+
+    def run_on(self, mem: Mem) -> None:
+        if self.backend == EvalBackend.VM:
+            from hhat_lang.interpreter.vm import run_vm, run_vm_stream
+
+            if isinstance(self.code, R):
+                run_vm(self.code, mem)
+            else:
+                run_vm_stream(self.code, mem)
+        elif isinstance(self.code, R):
+            execute(self.code, mem)
+        else:
+            # top-level expressions streamed one by one
+            eval_stream(self.code, mem)
 
 
 #######################
@@ -72,28 +113,377 @@ def sequential_paradigm_fn(code: R, mem: Mem) -> Any:
 #################################
 
 
-# pain :{{{{{{{{{{{{{{{{{{{{{{{{{{{{
+def var_names(code: R | ATO) -> set[str]:
+    """Names of the variables `code` uses"""
+    res = set()
+    stack = [code]
+    while stack:
+        k = stack.pop()
+        if isinstance(k, R):
+            stack.extend(k.value)
+        elif isinstance(k, Id) and k.ref is None and k.token not in builtin_fn_dict.keys():
+            res.add(k.token)
+    return res
+
 
-async def eval_conc_fn(code: ATO | R, mem: Mem) -> Any:
-    pass
+def is_io_step(code: R | ATO) -> bool:
+    """Whether `code` calls a builtin doing input/output"""
+    stack = [code]
+    while stack:
+        k = stack.pop()
+        if isinstance(k, R):
+            stack.extend(k.value)
+        elif isinstance(k, Id):
+            fn = k.ref or builtin_fn_dict.get(k.token)
+            if fn is not None and fn.io:
+                return True
+    return False
 
 
-async def concurrent_paradigm_fn(code: R, mem: Mem) -> Any:
-    return await asyncio.gather(*[eval_conc_fn(k, mem) for k in code])
+def is_stepped(code: R | ATO) -> bool:
+    # quantum expressions are not run but kept as data, in a single step
+    return isinstance(code, R) and code.type == ASTType.EXPR and not code.has_q
+
+
+def interleaves(code: R) -> bool:
+    """Whether the branches of a concurrent array can interleave
+
+    A branch yields after its input/output steps; if none does before its
+    last step, branches run to completion one after the other, as in a
+    sequential array.
+    """
+    return any(is_stepped(k) and any(is_io_step(s) for s in k.value[:-1]) for k in code)
+
+
+class ConcurrentScope:
+    """Variables shared between the branches of a concurrent array
+
+    A variable is defined by the first branch using it (in source order),
+    as in a sequential array. Later branches using it wait on its future
+    until that branch defines it. If the branch ends without defining it,
+    the waiting branches would wait forever: they fail instead.
+    """
+    def __init__(self, code: R, mem: Mem):
+        loop = asyncio.get_running_loop()
+        self.owner: dict[str, int] = dict()
+        self.futures: dict[str, asyncio.Future] = dict()
+        self.waiting: set[str] = set()
+        self.error: Exception | None = None
+        for n, k in enumerate(code):
+            for name in var_names(k):
+                if name not in mem and name not in self.owner:
+                    self.owner[name] = n
+                    self.futures[name] = loop.create_future()
+
+    async def wait(self, n: int, code: R | ATO, mem: Mem) -> None:
+        """Wait for the variables `code` uses that other branches define"""
+        for name in sorted(var_names(code)):
+            if self.owner.get(name, n) >= n or name in mem:
+                continue
+            future = self.futures[name]
+            if not future.done():
+                if tracer.eval:
+                    tracer.debug(TraceCategory.EVAL, "* branch %s waits for %s", n, name)
+                self.waiting.add(name)
+            var = await future
+            mem.put_var(var["data"], var["scope_id"])
+
+    def publish(self, n: int, mem: Mem) -> None:
+        for name, future in self.futures.items():
+            if self.owner[name] == n and not future.done() and name in mem:
+                future.set_result(mem.data["shared"]["vars"][name])
+
+    def release(self, n: int) -> None:
+        """Branch `n` ended: fail the waits on variables it did not define"""
+        for name, future in self.futures.items():
+            if self.owner[name] == n and not future.done():
+                if name in self.waiting:
+                    future.set_exception(
+                        ValueError(f"deadlock: variable '{name}' is never defined by its concurrent branch.")
+                    )
+                else:
+                    future.cancel()
+
+
+async def eval_conc_fn(code: ATO | R, mem: Mem, scope: ConcurrentScope, n: int) -> tuple:
+    """Run branch `n` of a concurrent array, step by step
+
+    Yields to the other branches after each input/output step.
+    """
+    try:
+        if not is_stepped(code):
+            await scope.wait(n, code, mem)
+            res = execute(code, mem)
+            scope.publish(n, mem)
+            return res
+        if tracer.eval:
+            tracer.debug(TraceCategory.EVAL, "* expr:")
+        res = ()
+        for k in code:
+            await scope.wait(n, k, mem)
+            if scope.error is not None:
+                # another branch failed: stop as a sequential array would
+                return ()
+            res += execute(k, mem)
+            if (
+                k.type in builtin_data_types_dict.keys()
+                or isinstance(k, Var)
+            ):
+                mem.put_stack(res[-1])
+            scope.publish(n, mem)
+            if is_io_step(k):
+                await asyncio.sleep(0)
+        return (res[-1],) if res else ()
+    except Exception as e:
+        if scope.error is None:
+            scope.error = e
+        raise
+    finally:
+        scope.release(n)
+
+
+async def concurrent_paradigm_fn(code: R, mem: Mem) -> tuple:
+    """Run the elements of a concurrent array as tasks of an event loop
+
+    Each element runs on its own branch of memory, as in `eval_array`, and
+    their variables are shared back in source order.
+    """
+    scope = ConcurrentScope(code, mem)
+    mems = [mem.push_scope() for _ in code]
+    results = await asyncio.gather(
+        *[eval_conc_fn(k, k_mem, scope, n) for n, (k, k_mem) in enumerate(zip(code, mems))]
+    )
+    for k_mem in mems:
+        k_mem.pop_scope()
+    return tuple(chain.from_iterable(results))
+
+
+def in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
 
 
 ###############################
 # PARALLEL PARADIGM FUNCTIONS #
 ###############################
 
-# TODO: start is a good starting point
+def parallel_waves(code: R) -> list[list[int]]:
+    """Indexes of the array elements, grouped in waves
 
-def eval_par_fn(code: ATO | R, mem: Mem) -> Any:
-    pass
+    Elements of a wave do not depend on each other and can run at the
+    same time; an element runs in a later wave than the elements it
+    depends on (its `execute_after`, filled in by the dataflow pass).
+    """
+    index = {k.id: n for n, k in enumerate(code) if isinstance(k, R)}
+    wave_of = []
+    waves = []
+    for k in code:
+        wave = 0
+        if isinstance(k, R):
+            wave = max((wave_of[index[d]] + 1 for d in k.execute_after if d in index), default=0)
+        wave_of.append(wave)
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(len(wave_of) - 1)
+    return waves
+
+
+def eval_par_fn(code: R, mem_data: bytes, counters: tuple, budget: Budget | None) -> tuple:
+    """Run one parallel array element, in a worker process
+
+    As in `eval_array`, the element runs on its own scope. Returns the
+    element result, the variables it wrote (to share them back), what it
+    printed, the error it raised (if any), the steps it took (to charge
+    them to the budget) and the id counters.
+    """
+    new_run().advance(counters)
+    mem = pickle.loads(mem_data).push_scope()
+    out = io.StringIO()
+    res = ()
+    error = None
+    try:
+        with redirect_stdout(out):
+            res = run_governed(budget, execute, code, mem)
+    except Exception as e:
+        error = e
+    finally:
+        tracer.flush()
+    steps = governor.steps if budget is not None else 0
+    return res, mem.written_vars(), out.getvalue(), error, steps, current_ids().counters()
+
+
+def parallel_paradigm_fn(code: R, mem: Mem) -> tuple:
+    """Run the elements of a parallel array on the process pool
+
+    As in `eval_array`, each element runs on its own scope (here, of a
+    pickled memory, without the scopes it was pushed from). Results,
+    printed output and variables are merged back in source order, so the
+    program behaves as if run serially. Tokens and quantum elements run
+    in this process.
+    """
+    pool = get_pool()
+    ids = current_ids()
+    results = [()] * len(code)
+    for wave in parallel_waves(code):
+        # pickled now: `mem` changes while the workers are running
+        mem_data = pickle.dumps(mem, protocol=pickle.HIGHEST_PROTOCOL)
+        futures = dict()
+        for n in wave:
+            k = code.value[n]
+            if isinstance(k, R) and not k.has_q:
+                futures[n] = pool.submit(eval_par_fn, k, mem_data, ids.reserve(), governor.remaining())
+        for n in wave:
+            if n in futures:
+                res, variables, output, error, steps, k_counters = futures[n].result()
+                ids.advance(k_counters)
+                governor.charge(steps, mem)
+                sys.stdout.write(output)
+                if error is not None:
+                    raise error
+                mem.merge_vars(variables)
+            else:
+                new_mem = mem.push_scope()
+                res = execute(code.value[n], new_mem)
+                new_mem.pop_scope()
+            results[n] = res
+    return tuple(chain.from_iterable(results))
 
 
-def parallel_paradigm_fn(code: R, mem: Mem) -> Any:
-    pass
+def parallel_lines(code: R) -> bool:
+    """Whether the top-level expressions of `code` run on the process pool"""
+    return get_parallel_lines() and len(code) > 1 and get_workers() > 1
+
+
+def left_on_stacks(base: Mem, mem: Mem) -> dict | None:
+    """What an expression run on `mem`, a branch of `base`, left on its
+    exprs and data stacks; `None` if it also took some of `base` values
+    """
+    res = dict()
+    for name in ("exprs", "data"):
+        before = base.data["shared"][name]
+        after = mem.data["shared"][name]
+        if len(after) < len(before) or any(a is not b for a, b in zip(before, after)):
+            return None
+        res[name] = after[len(before):]
+    return res
+
+
+def eval_main_lines(lines: tuple, mem_data: bytes, counters: tuple, budget: Budget | None) -> tuple:
+    """Run independent top-level expressions, in a worker process
+
+    Each one runs on its own branch of the memory, so only its variables
+    and what it left on the stacks are sent back, with its result, what it
+    printed and the error it raised (if any). They all run under `budget`:
+    once over it, the expressions left are not run (nor sent back). The
+    steps they took and the id counters are sent back as well.
+    """
+    new_run().advance(counters)
+    base = pickle.loads(mem_data)
+    res = []
+    try:
+        run_governed(budget, eval_lines, lines, base, res)
+    except ExecutionBudgetExceeded:
+        pass
+    tracer.flush()
+    steps = governor.steps if budget is not None else 0
+    return res, steps, current_ids().counters()
+
+
+def eval_lines(lines: tuple, base: Mem, res: list) -> None:
+    for k in lines:
+        mem = base.push_scope()
+        out = io.StringIO()
+        value = ()
+        error = None
+        try:
+            with redirect_stdout(out):
+                value = execute(k, mem)
+        except ExecutionBudgetExceeded:
+            raise
+        except Exception as e:
+            error = e
+        res.append((value, mem.written_vars(), left_on_stacks(base, mem), out.getvalue(), error))
+
+
+def parallel_main_fn(code: R, mem: Mem) -> tuple:
+    """Run the top-level expressions of a program on the process pool
+
+    An expression is sent to the pool once the expressions it depends on
+    (its `execute_after`) are done. Results are merged back in program
+    order: output, variables and leftovers on the memory stacks are the
+    same as when running serially. Quantum expressions, and the ones that
+    failed or used values left by other expressions, run (again) in this
+    process, in turn.
+    """
+    pool = get_pool()
+    ids = current_ids()
+    lines = code.value
+    index = {k.id: n for n, k in enumerate(lines) if isinstance(k, R)}
+    waiting = [0] * len(lines)
+    dependents = [[] for _ in lines]
+    for n, k in enumerate(lines):
+        if isinstance(k, R):
+            for d in k.execute_after:
+                if d in index:
+                    waiting[n] += 1
+                    dependents[index[d]].append(n)
+    inline = [not isinstance(k, R) or k.has_q for k in lines]
+    ready = deque(n for n in range(len(lines)) if waiting[n] == 0 and not inline[n])
+    futures = dict()
+    # futures whose steps are still to charge to the budget
+    uncharged = set()
+    mem_data = None
+    results = ()
+
+    def submit() -> None:
+        nonlocal mem_data
+        if not ready:
+            return
+        if mem_data is None:
+            mem_data = pickle.dumps(mem, protocol=pickle.HIGHEST_PROTOCOL)
+        # a few chunks per worker: fewer round trips, still balanced
+        size = max(1, len(ready) // (4 * get_workers()))
+        while ready:
+            chunk = [ready.popleft() for _ in range(min(size, len(ready)))]
+            future = pool.submit(
+                eval_main_lines, tuple(lines[n] for n in chunk), mem_data, ids.reserve(), governor.remaining(),
+            )
+            uncharged.add(future)
+            for pos, n in enumerate(chunk):
+                futures[n] = future, pos
+
+    for n, k in enumerate(lines):
+        submit()
+        done = None
+        if n in futures:
+            future, pos = futures.pop(n)
+            k_results, steps, k_counters = future.result()
+            ids.advance(k_counters)
+            if future in uncharged:
+                uncharged.discard(future)
+                governor.charge(steps, mem)
+            done = k_results[pos] if pos < len(k_results) else None
+        if done is None or done[2] is None or done[4] is not None:
+            res = execute(k, mem)
+        else:
+            res, variables, leftovers, output, _ = done
+            sys.stdout.write(output)
+            mem.merge_vars(variables)
+            for p in leftovers["exprs"]:
+                mem.put_expr(p)
+            for p in leftovers["data"]:
+                mem.put_data(p)
+        results += res,
+        mem.clear_stack()
+        mem_data = None
+        for d in dependents[n]:
+            waiting[d] -= 1
+            if waiting[d] == 0 and not inline[d]:
+                ready.append(d)
+    return results
 
 
 ##################
@@ -101,20 +491,30 @@ def parallel_paradigm_fn(code: R, mem: Mem) -> Any:
 ##################
 
 def eval_token(code: ATO, mem: Mem) -> Any:
-    print(f"* token: {code}")
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* token: %s", code)
     if code.type in operations_or_id:
-        if code.token in builtin_fn_dict.keys():
+        # resolved at analysis time (see `semantics.resolve_names`)
+        if code.ref is not None:
+            return code.ref
+        if code.slot >= 0:
+            var = mem.get_slot(code.slot)
+            if var is not None:
+                return var
+        elif code.token in builtin_fn_dict.keys():
             return builtin_fn_dict[code.token]
         if code.token in mem:
             return mem.get_var(code.token)
-        return Var(code.token)
+        return Var(code.token, code.slot)
     if code.type in builtin_data_types_dict.keys():
-        return builtin_data_types_dict[code.type](code.token)
+        # literals hold their native value (see `Literal`)
+        return builtin_data_types_dict[code.type](code.value)
     raise NotImplementedError(f"Type {code.type} not implemented yet.")
 
 
 def eval_oper(code: R, mem: Mem) -> Any:
-    print("* oper:")
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* oper:")
     res = ()
     for k in code:
         last = execute(k, mem)
@@ -131,25 +531,15 @@ def eval_oper(code: R, mem: Mem) -> Any:
             res += last
         else:
             # if data is not variable or data array (should be function?)
-            data = mem.pop_stack()
-            types = get_types_set(data)
-            if (
-                len(set(quantum_array_types_list).intersection(types)) > 0
-                and last[0].token in builtin_quantum_fn_dict.keys()
-            ):
-                # this has some quantum, let's do the magic
-                print(f"* * has quantum! {code} -> {data}")
-                data = data + (code,)
-                oper = last[0](mem, *data)
-            else:
-                oper = last[0](mem, data)
+            oper = call_builtin(last[0], mem, mem.pop_stack(), code)
             mem.put_expr(oper)
             res += oper,
     return res
 
 
 def eval_args(code: R, mem: Mem) -> Any:
-    print("* args:")
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* args:")
     res = ()
     for k in code:
         last = execute(k, mem)
@@ -159,7 +549,8 @@ def eval_args(code: R, mem: Mem) -> Any:
 
 
 def eval_call(code: R, mem: Mem) -> Any:
-    print("* call:")
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* call:")
     res = ()
     for k in code:
         res += execute(k, mem)
@@ -189,11 +580,50 @@ def eval_call(code: R, mem: Mem) -> Any:
                 for p in new_res:
                     mem.put_stack(p)
             else:
-                print("/!\\ unexpected code /!\\")
+                if tracer.eval:
+                    tracer.warning(TraceCategory.EVAL, "/!\\ unexpected code /!\\ %s", oper)
                 new_res = res
     return new_res
 
 
+def fused_fns(code: R) -> tuple[type, ...]:
+    # FUSED children are calls of builtins: CALL(BUILTIN(token))
+    return tuple(builtin_fn_dict[k.value[0].value[0].token] for k in code)
+
+
+def run_fused(fns: tuple[type, ...], code: R, mem: Mem) -> tuple:
+    """Apply the builtins of a fused pipeline to the memory stack top
+
+    Same effects as calling them one by one, without pushing and popping
+    the intermediate results through memory.
+    """
+    try:
+        data = mem.pop_stack()
+    except IndexError:
+        # unfused path, to fail where the calls do
+        res = ()
+        for k in code:
+            res = execute(k, mem)
+        return res
+    res = ()
+    for fn in fns:
+        if data is None:
+            data = mem.pop_stack()
+        res = fn(mem, data)()
+        for p in res[:-1]:
+            mem.put_stack(p)
+        data = res[-1] if res else None
+    if data is not None:
+        mem.put_stack(data)
+    return res
+
+
+def eval_fused(code: R, mem: Mem) -> Any:
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* fused: %s", code)
+    return run_fused(fused_fns(code), code, mem)
+
+
 def eval_array(code: R, mem: Mem) -> Any:
     """Evaluating array expressions.
 
@@ -216,25 +646,38 @@ def eval_array(code: R, mem: Mem) -> Any:
         paradigm and will be passed forward to the next expression
         to evaluate it
     """
-    print("* array:")
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* array:")
 
     # TODO: implement the paradigms in separated functions:
     #  1- sequential
     #  2- concurrent
     #  3- parallel
 
-    res = ()
-    for k in code:
-        new_mem = deepcopy(mem)
-        res += execute(k, new_mem)
-        new_mem.share_vars(mem)
+    if code.paradigm == ExprParadigm.PARALLEL and len(code) > 1 and get_workers() > 1:
+        res = parallel_paradigm_fn(code, mem)
+    elif (
+        code.paradigm == ExprParadigm.CONCURRENT
+        and interleaves(code)
+        # nested in a concurrent branch: run it sequentially, one of
+        # its valid schedules
+        and not in_event_loop()
+    ):
+        res = asyncio.run(concurrent_paradigm_fn(code, mem))
+    else:
+        res = ()
+        for k in code:
+            new_mem = mem.push_scope()
+            res += execute(k, new_mem)
+            new_mem.pop_scope()
     mem.clear_stack()
     res = arrange_array_output(res, mem)
     return res
 
 
 def eval_expr(code: R, mem: Mem) -> Any:
-    print("* expr:")
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* expr:")
     res = ()
     for k in code:
         res += execute(k, mem)
@@ -247,6 +690,8 @@ def eval_expr(code: R, mem: Mem) -> Any:
 
 
 def eval_main(code: R, mem: Mem) -> Any:
+    if parallel_lines(code):
+        return parallel_main_fn(code, mem)
     res = ()
     for k in code:
         res += execute(k, mem),
@@ -254,12 +699,25 @@ def eval_main(code: R, mem: Mem) -> Any:
     return res
 
 
+def eval_stream(code: Iterable[R | ATO], mem: Mem) -> None:
+    """Evaluating a stream of top-level expressions.
+
+    Same as `eval_main`, but expressions are consumed as they are
+    produced and their results are not kept, so memory does not grow
+    with the program size.
+    """
+    for k in code:
+        execute(k, mem)
+        mem.clear_stack()
+
+
 ##########################
 # EVAL QUANTUM FUNCTIONS #
 ##########################
 
 def eval_q_expr(code: R, mem: Mem) -> tuple[R]:
-    print(f"@* expr: {code}")
+    if tracer.quantum:
+        tracer.debug(TraceCategory.QUANTUM, "@* expr: %s", code)
     res = ()
     for k in code:
         if isinstance(k, ATO):
@@ -276,12 +734,15 @@ def eval_q_expr(code: R, mem: Mem) -> tuple[R]:
         role=code.role,
         execute_after=code.execute_after,
         has_q=code.has_q,
+        source=code.source,
     )
+    new_r.span = code.span
     return new_r,
 
 
 def eval_q_call(code: R, mem: Mem) -> tuple[R]:
-    print(f"@* call: {code}")
+    if tracer.quantum:
+        tracer.debug(TraceCategory.QUANTUM, "@* call: %s", code)
     res = ()
     for k in code:
         res += execute(k, mem)
@@ -292,12 +753,15 @@ def eval_q_call(code: R, mem: Mem) -> tuple[R]:
         role=code.role,
         execute_after=code.execute_after,
         has_q=code.has_q,
+        source=code.source,
     )
+    new_r.span = code.span
     return new_r,
 
 
 def eval_q_array(code: R, mem: Mem) -> tuple[R]:
-    print(f"@* array: {code}")
+    if tracer.quantum:
+        tracer.debug(TraceCategory.QUANTUM, "@* array: %s", code)
     res = ()
     for k in code:
         if not isinstance(k, ATO):
@@ -312,13 +776,16 @@ def eval_q_array(code: R, mem: Mem) -> tuple[R]:
         role=code.role,
         execute_after=code.execute_after,
         has_q=code.has_q,
+        source=code.source,
     )
+    new_r.span = code.span
     mem.put_q(new_r)
     return new_r,
 
 
 def eval_q_oper(code: R, mem: Mem) -> Any:
-    print(f"@* oper: {code} | {code.type}")
+    if tracer.quantum:
+        tracer.debug(TraceCategory.QUANTUM, "@* oper: %s | %s", code, code.type)
     res = ()
     for k in code:
         if k.token in builtin_quantum_fn_dict.keys():
@@ -327,7 +794,7 @@ def eval_q_oper(code: R, mem: Mem) -> Any:
             if k.token in mem:
                 res += k,
             else:
-                q_var = Var(k.token)
+                q_var = Var(k.token, k.slot)
                 data = mem.get_q()
                 data_r = R(
                     ast_type=ASTType.EXPR,
@@ -350,7 +817,9 @@ def eval_q_oper(code: R, mem: Mem) -> Any:
         role=code.role,
         execute_after=code.execute_after,
         has_q=code.has_q,
+        source=code.source,
     )
+    new_r.span = code.span
     return new_r,
 
 
@@ -359,6 +828,43 @@ def eval_q_oper(code: R, mem: Mem) -> Any:
 ####################
 
 def execute(code: R | ATO, mem: Mem) -> tuple[Any]:
+    if governor.enabled:
+        governor.step(mem)
+    if events.enabled:
+        if profiler.enabled:
+            return events.record(
+                node_event(code),
+                profiler.measure, ProfileKind.NODE, node_kind(code), execute_node, code, mem,
+            )
+        return events.record(node_event(code), execute_node, code, mem)
+    if profiler.enabled:
+        return profiler.measure(ProfileKind.NODE, node_kind(code), execute_node, code, mem)
+    return execute_node(code, mem)
+
+
+def node_kind(code: R | ATO) -> str:
+    if isinstance(code, ATO):
+        return f"token:{code.type.name}"
+    return ("@" if code.has_q else "") + code.type.name
+
+
+def node_event(code: R | ATO) -> int:
+    """Event id of a node: its type and, for operations, its token or paradigm"""
+    if isinstance(code, ATO):
+        if code.type in operations_or_id:
+            return events.intern((code.type, code.token), f"{code.type.name}:{code.token}", "token")
+        return events.intern((code.type, None), f"token:{code.type.name}", "token")
+    key = code.type, code.has_q, code.paradigm
+    eid = events.ids.get(key)
+    if eid is None:
+        name = node_kind(code)
+        if code.paradigm not in (ExprParadigm.NONE, ExprParadigm.SINGLE):
+            name += f"({code.paradigm.name.lower()})"
+        eid = events.intern(key, name, "quantum" if code.has_q else "node")
+    return eid
+
+
+def execute_node(code: R | ATO, mem: Mem) -> tuple[Any]:
     res = ()
     match code:
         case R():
@@ -390,6 +896,9 @@ def execute(code: R | ATO, mem: Mem) -> tuple[Any]:
                     case ASTType.CALL:
                         res = eval_call(code, mem)
 
+                    case ASTType.FUSED:
+                        res = eval_fused(code, mem)
+
                     case ASTType.ARGS:
                         res = eval_args(code, mem)
 
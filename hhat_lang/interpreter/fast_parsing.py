@@ -0,0 +1,196 @@
+"""Hand-written lexer and recursive-descent parser for H-hat
+
+Faster alternative to the Arpeggio path (`ParserPEG` + `CST`). It builds
+the very same `Main`/`Array`/`Expr`/`Operation`/`Id`/`Literal` tree in a
+single pass, following `grammar.peg` and the tree reduction done by
+Arpeggio, so both can be used interchangeably.
+"""
+
+from __future__ import annotations
+
+import re
+
+from hhat_lang.syntax_trees.ast import (
+    Main,
+    Array,
+    Expr,
+    Operation,
+    Id,
+    Literal,
+    ExprParadigm,
+    DataTypeEnum,
+)
+from hhat_lang.utils.spans import make_span
+
+
+# Same regexes as grammar.peg. Alternatives are tried in order, as the
+# PEG ordered choice `literal / operation` does; that is why `T` and `F`
+# are always matched as literals, even at the start of a word.
+token_regex = re.compile(
+    r"(?P<BOOL>T|F)"
+    r"|(?P<INT>0|-?[1-9][0-9]*)"
+    r"|(?P<ID>(\!)?(\`)?(\@)?[a-zA-Z\-\+][a-zA-Z\-\+_0-9]*)"
+    r"|(?P<PUNCT>[.:\[\](){}])"
+    r"|(?P<WS>[ \t\r\n]+)"
+    r"|(?P<ERROR>.)",
+    re.DOTALL,
+)
+
+EOF_TOKEN = "EOF"
+
+open_brackets = {
+    "[": ("]", ExprParadigm.SEQUENTIAL),
+    "(": (")", ExprParadigm.CONCURRENT),
+    "{": ("}", ExprParadigm.PARALLEL),
+}
+
+literal_tokens = {
+    "BOOL": DataTypeEnum.BOOL,
+    "INT": DataTypeEnum.INT,
+}
+
+
+class ParseError(SyntaxError):
+    """Syntax error raised by every parser backend
+
+    `line` and `col` give where parsing failed (1-based).
+    """
+    def __init__(self, msg: str, line: int, col: int):
+        super().__init__(msg)
+        self.line = line
+        self.col = col
+
+
+def pos_to_linecol(code: str, pos: int) -> tuple[int, int]:
+    line = code.count("\n", 0, pos) + 1
+    col = pos - (code.rfind("\n", 0, pos) + 1) + 1
+    return line, col
+
+
+def tokenize(code: str) -> tuple[list[str], list[str], list[int]]:
+    """Split the code into tokens
+
+    Returns three parallel lists: token kinds, token texts and their
+    positions in the code. Punctuation kind is the punctuation itself.
+    The last token is always `EOF`.
+    """
+    kinds, texts, positions = [], [], []
+    for m in token_regex.finditer(code):
+        kind = m.lastgroup
+        if kind == "WS":
+            continue
+        text = m.group()
+        if kind == "PUNCT":
+            kind = text
+        elif kind == "ERROR":
+            line, col = pos_to_linecol(code, m.start())
+            raise ParseError(f"unexpected character {text!r} at ({line}, {col}).", line, col)
+        kinds.append(kind)
+        texts.append(text)
+        positions.append(m.start())
+    kinds.append(EOF_TOKEN)
+    texts.append("")
+    positions.append(len(code))
+    return kinds, texts, positions
+
+
+class FastParser:
+    """Recursive-descent parser over `tokenize` output
+
+    Pipes (`a:b:c`) are parsed iteratively, so long pipelines do not
+    grow the recursion depth; only nested brackets do.
+    """
+    def __init__(self, code: str, offset: int = 0):
+        self.code = code
+        self.kinds, self.texts, self.positions = tokenize(code)
+        self.idx = 0
+        # position of the code in the whole source (e.g. when streaming)
+        self.offset = offset
+
+    def spanned(self, start: int, node):
+        """Set the span of `node`, from token `start` to the last one read"""
+        last = self.idx - 1
+        node.span = make_span(
+            self.offset + self.positions[start],
+            self.offset + self.positions[last] + len(self.texts[last]),
+        )
+        return node
+
+    def error(self, expected: str) -> ParseError:
+        line, col = pos_to_linecol(self.code, self.positions[self.idx])
+        found = self.texts[self.idx] or EOF_TOKEN
+        return ParseError(
+            f"expected {expected} at ({line}, {col}), found {found!r}.", line, col
+        )
+
+    def parse_program(self) -> Main:
+        kinds = self.kinds
+        res = ()
+        while kinds[self.idx] != EOF_TOKEN:
+            res += self.parse_exprs(),
+        main = Main(Array(ExprParadigm.CONCURRENT, *res))
+        if self.idx > 0:
+            # from the first token to the end, as Arpeggio's `program` node
+            main.span = main.edges.span = make_span(
+                self.offset + self.positions[0], self.offset + len(self.code)
+            )
+        return main
+
+    def parse_exprs(self) -> Expr | Array | Operation | Id | Literal:
+        kinds = self.kinds
+        start = self.idx
+        if kinds[self.idx] == ".":
+            self.idx += 1
+            values = [self.parse_array()]
+            reduced = False
+        else:
+            values = [self.parse_single()]
+            reduced = True
+        while kinds[self.idx] == ":":
+            self.idx += 1
+            reduced = False
+            if kinds[self.idx] == ".":
+                self.idx += 1
+                values.append(self.parse_array())
+            else:
+                values.append(self.parse_single())
+        if reduced:
+            # a single element is not wrapped, as in Arpeggio's reduced tree
+            return values[0]
+        return self.spanned(start, Expr(*values, has_q=any(p.has_q for p in values)))
+
+    def parse_single(self) -> Operation | Id | Literal:
+        kind = self.kinds[self.idx]
+        start = self.idx
+        if kind in literal_tokens:
+            token = self.texts[self.idx]
+            self.idx += 1
+            return self.spanned(start, Literal(token=token, lit_type=literal_tokens[kind]))
+        if kind == "ID":
+            oper = Id(token=self.texts[self.idx])
+            self.idx += 1
+            self.spanned(start, oper)
+            if self.kinds[self.idx] in open_brackets:
+                return self.spanned(start, Operation(oper, self.parse_array()))
+            return oper
+        raise self.error("literal or id")
+
+    def parse_array(self) -> Array:
+        kinds = self.kinds
+        bracket = kinds[self.idx]
+        if bracket not in open_brackets:
+            raise self.error("'[', '(' or '{'")
+        closing, paradigm = open_brackets[bracket]
+        start = self.idx
+        self.idx += 1
+        values = [self.parse_exprs()]
+        while kinds[self.idx] != closing:
+            if kinds[self.idx] in (EOF_TOKEN, "]", ")", "}"):
+                raise self.error(repr(closing))
+            values.append(self.parse_exprs())
+        self.idx += 1
+        return self.spanned(start, Array(paradigm, *values, has_q=all(p.has_q for p in values)))
+
+
+def fast_parse_code(code: str, offset: int = 0) -> Main:
+    return FastParser(code, offset).parse_program()
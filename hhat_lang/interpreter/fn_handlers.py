@@ -1,11 +1,10 @@
-from uuid import uuid4
-
 from hhat_lang.interpreter.post_ast import R
+from hhat_lang.utils.ids import current_ids
 
 
 class Fn:
     def __init__(self, name: str, args: R | None, body: R):
-        self.id = str(uuid4())
+        self.id = current_ids().new_fn()
         self.name = name
         self.args = args
         self.body = body
@@ -0,0 +1,174 @@
+"""Execution budgets
+
+`Eval(code, budget=Budget(...))` runs the code under `governor`, which
+counts the evaluation steps (nodes run by `execute`, instructions run by
+the VM) and, every `check_every` steps, checks the step limit, the
+deadline and the size of the memory (`Mem.size`). Going over any of them
+aborts the execution with `ExecutionBudgetExceeded`. Steps are counted
+down in place and guarded like trace points:
+
+    if governor.enabled:
+        governor.step(mem)
+
+so checks cost one attribute lookup while no budget is set. Work sent to
+worker processes runs under what is left of the budget when it is sent,
+and the steps it took are charged back (`Governor.charge`) when its
+results are merged. Time is wall-clock time, so workers need no charge.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from enum import Enum, unique
+from time import monotonic
+from typing import Any
+
+from hhat_lang.interpreter.memory import Mem
+
+
+DEFAULT_CHECK_EVERY = 1024
+
+
+@unique
+class BudgetKind(Enum):
+    STEPS       = "steps"
+    TIME        = "time"
+    MEMORY      = "memory"
+
+
+@dataclass(frozen=True)
+class Budget:
+    """Limits of an execution (`None`: no limit)
+
+    `timeout` is in seconds and `max_mem` counts the values held in
+    memory (see `Mem.size`).
+    """
+    max_steps: int | None = None
+    timeout: float | None = None
+    max_mem: int | None = None
+    check_every: int = DEFAULT_CHECK_EVERY
+
+    def __post_init__(self):
+        for name in ("max_steps", "timeout", "max_mem"):
+            value = getattr(self, name)
+            if value is not None and value < 0:
+                raise ValueError(f"{name} must be at least 0, got {value}.")
+        if self.check_every < 1:
+            raise ValueError(f"check_every must be at least 1, got {self.check_every}.")
+
+
+class ExecutionBudgetExceeded(RuntimeError):
+    """The execution went over its `kind` budget"""
+    def __init__(self, kind: BudgetKind, limit: float, used: float, steps: int, elapsed: float):
+        super().__init__(kind, limit, used, steps, elapsed)
+        self.kind = kind
+        self.limit = limit
+        self.used = used
+        self.steps = steps
+        self.elapsed = elapsed
+
+    def __str__(self) -> str:
+        return (
+            f"execution budget exceeded: {self.kind.value} {self.used:g} over limit {self.limit:g}"
+            f" (after {self.steps} steps, {self.elapsed:.3f} s)"
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            kind=self.kind.value,
+            limit=self.limit,
+            used=self.used,
+            steps=self.steps,
+            elapsed=self.elapsed,
+        )
+
+
+class Governor:
+    def __init__(self):
+        self.enabled = False
+        self.budget = Budget()
+        # steps of the periods already checked, length of the current
+        # period and steps left in it
+        self.counted = 0
+        self.period = 0
+        self.left = 0
+        self.started = 0.0
+        self.deadline: float | None = None
+
+    @property
+    def steps(self) -> int:
+        return self.counted + self.period - self.left
+
+    def start(self, budget: Budget) -> None:
+        self.budget = budget
+        self.counted = 0
+        self.started = monotonic()
+        self.deadline = self.started + budget.timeout if budget.timeout is not None else None
+        self.new_period()
+        self.enabled = True
+
+    def stop(self) -> None:
+        self.enabled = False
+
+    def new_period(self) -> None:
+        period = self.budget.check_every
+        if self.budget.max_steps is not None:
+            # the period ends right on the first step over the limit
+            period = min(period, self.budget.max_steps + 1 - self.counted)
+        self.period = self.left = period
+
+    def step(self, mem: Mem) -> None:
+        self.left -= 1
+        if self.left <= 0:
+            self.check(mem)
+
+    def check(self, mem: Mem) -> None:
+        """End of a period: check the budget and start the next period"""
+        self.counted += self.period - self.left
+        self.left = self.period
+        budget = self.budget
+        if budget.max_steps is not None and self.counted > budget.max_steps:
+            self.exceeded(BudgetKind.STEPS, budget.max_steps, self.counted)
+        now = monotonic()
+        if self.deadline is not None and now > self.deadline:
+            self.exceeded(BudgetKind.TIME, budget.timeout, now - self.started)
+        if budget.max_mem is not None:
+            size = mem.size()
+            if size > budget.max_mem:
+                self.exceeded(BudgetKind.MEMORY, budget.max_mem, size)
+        self.new_period()
+
+    def charge(self, steps: int, mem: Mem) -> None:
+        """Count `steps` run elsewhere (e.g. in a worker process) and check the budget"""
+        if self.enabled:
+            self.counted += steps
+            self.check(mem)
+
+    def exceeded(self, kind: BudgetKind, limit: float, used: float) -> None:
+        self.enabled = False
+        raise ExecutionBudgetExceeded(kind, limit, used, self.counted, monotonic() - self.started)
+
+    def remaining(self) -> Budget | None:
+        """Budget left, for work run elsewhere (e.g. in a worker process)"""
+        if not self.enabled:
+            return None
+        budget = self.budget
+        return replace(
+            budget,
+            max_steps=max(0, budget.max_steps - self.steps) if budget.max_steps is not None else None,
+            timeout=max(0.0, self.deadline - monotonic()) if self.deadline is not None else None,
+        )
+
+
+governor = Governor()
+
+
+def run_governed(budget: Budget | None, fn: Any, *args: Any) -> Any:
+    """Run `fn(*args)` under `budget` (if any)"""
+    if budget is None:
+        return fn(*args)
+    governor.start(budget)
+    try:
+        return fn(*args)
+    finally:
+        governor.stop()
@@ -0,0 +1,132 @@
+"""Sampling hot-spot report
+
+`sampler` interrupts the program every `interval` seconds of CPU time
+(`SIGPROF`) and looks at the interpreter frames on the stack: the
+source span of the innermost node being evaluated gives the sample's
+source line, the span of its top-level expression its pipeline. Nothing
+is recorded between samples, so the interpreter runs at full speed.
+
+Only the main thread of the current process can be sampled: work sent
+to worker processes counts as the node that waits for it.
+"""
+
+from __future__ import annotations
+
+import signal
+from collections import Counter
+from typing import Any
+
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.syntax_trees.ast import ASTType
+from hhat_lang.utils.spans import NO_SPAN, SourceMap, span_start
+
+
+DEFAULT_INTERVAL = 1e-3
+
+
+class HotSpotSampler:
+    def __init__(self):
+        self.enabled = False
+        self.interval = DEFAULT_INTERVAL
+        self.lines: Counter[int] = Counter()
+        self.pipelines: Counter[int] = Counter()
+        self.total = 0
+        self.node_code = None
+        self.vm_code = None
+        self.previous: Any = None
+
+    def reset(self) -> None:
+        self.lines.clear()
+        self.pipelines.clear()
+        self.total = 0
+
+    def start(self, interval: float = DEFAULT_INTERVAL, reset: bool = True) -> None:
+        if not hasattr(signal, "setitimer"):
+            raise NotImplementedError("hot-spot sampling needs `signal.setitimer` (not available here).")
+        from hhat_lang.interpreter.eval import execute_node
+        from hhat_lang.interpreter.vm import VM
+
+        if reset:
+            self.reset()
+        self.node_code = execute_node.__code__
+        self.vm_code = VM.run.__code__
+        self.interval = interval
+        self.previous = signal.signal(signal.SIGPROF, self.sample)
+        self.enabled = True
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def stop(self) -> None:
+        if not self.enabled:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+        self.enabled = False
+
+    def sample(self, signum: int, frame: Any) -> None:
+        """Signal handler: record the spans found on the stack"""
+        self.total += 1
+        line = pipeline = NO_SPAN
+        while frame is not None:
+            if frame.f_code is self.node_code:
+                code = frame.f_locals.get("code")
+                span = code.span
+                if span != NO_SPAN and not (isinstance(code, R) and code.type == ASTType.MAIN):
+                    if line == NO_SPAN:
+                        line = span
+                    # the outermost one is the top-level expression
+                    pipeline = span
+            elif frame.f_code is self.vm_code:
+                f_locals = frame.f_locals
+                pc, bc = f_locals.get("pc"), f_locals.get("bc")
+                if pc is not None:
+                    if line == NO_SPAN:
+                        line = bc.spans[pc]
+                    if bc.tops[pc] != NO_SPAN:
+                        pipeline = bc.tops[pc]
+            frame = frame.f_back
+        if line != NO_SPAN:
+            self.lines[line] += 1
+        if pipeline != NO_SPAN:
+            self.pipelines[pipeline] += 1
+
+    def per_line(self, source: SourceMap) -> Counter[int]:
+        res: Counter[int] = Counter()
+        for span, samples in self.lines.items():
+            res[source.line_of(span)] += samples
+        return res
+
+    def as_dict(self, source: SourceMap) -> dict[str, Any]:
+        return dict(
+            interval=self.interval,
+            samples=self.total,
+            lines={line: samples for line, samples in self.per_line(source).most_common()},
+            pipelines={
+                source.location(span): dict(samples=samples, code=source.text(span))
+                for span, samples in self.pipelines.most_common()
+            },
+        )
+
+    def report(self, source: SourceMap, limit: int | None = 10) -> str:
+        """Text report of the lines and pipelines with the most samples"""
+        total = self.total or 1
+        lines = [
+            f"hot spots: {self.total} samples every {self.interval * 1e3:g} ms of CPU time",
+            f"{'line':>6} {'samples':>8} {'%':>6} {'~ms':>8}  code",
+        ]
+        for line, samples in self.per_line(source).most_common(limit):
+            lines.append(
+                f"{line:>6} {samples:>8} {samples / total * 100:>5.1f}%"
+                f" {samples * self.interval * 1e3:>8.1f}  {source.line_text(line).strip()}"
+            )
+        lines.append(f"{'pipeline':<12} {'samples':>8} {'%':>6} {'~ms':>8}  code")
+        for span, samples in self.pipelines.most_common(limit):
+            code = " ".join(source.text(span).split())
+            line, col = source.linecol(span_start(span))
+            lines.append(
+                f"{f'{line}:{col}':<12} {samples:>8} {samples / total * 100:>5.1f}%"
+                f" {samples * self.interval * 1e3:>8.1f}  {code[:60] + '...' if len(code) > 60 else code}"
+            )
+        return "\n".join(lines)
+
+
+sampler = HotSpotSampler()
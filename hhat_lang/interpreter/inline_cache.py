@@ -0,0 +1,148 @@
+"""Inline caches for builtin calls
+
+Calling a builtin on the data popped from the memory stack needs a call
+convention: quantum builtins given quantum data also receive the data
+items and the operation node, everything else only gets the data. The
+choice depends on the builtin and on the types found in the data, which
+a given call site almost always sees the same.
+
+Each operation node (`R.ic`) keeps the convention it resolved for the
+builtin and data class it saw last (monomorphic) and, once it sees
+others, for up to `POLY_SIZE` of them (polymorphic). Past that the site
+is megamorphic and always takes the slow path. Entries are only added
+when the data class alone decides the convention: array data given to a
+quantum builtin depends on the items and is always resolved again.
+
+Hit rates are available as `get_stats("inline_cache")`.
+"""
+
+from __future__ import annotations
+
+from enum import IntEnum, auto, unique
+from typing import Any
+
+from hhat_lang.interpreter.memory import Mem
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.interpreter.stats import register_stats
+from hhat_lang.datatypes import DataType
+from hhat_lang.datatypes.builtin_datatype import quantum_array_types_list
+from hhat_lang.utils.utils import get_types_set
+from hhat_lang.utils.tracing import tracer, TraceCategory
+
+
+POLY_SIZE = 4
+
+
+@unique
+class CallConv(IntEnum):
+    DATA        = auto()    # fn(mem, data)
+    QUANTUM     = auto()    # fn(mem, *data, code)
+
+
+class InlineCache:
+    __slots__ = ("fn", "cls", "conv", "entries", "megamorphic")
+
+    def __init__(self, fn: type, cls: type, conv: CallConv):
+        self.fn = fn
+        self.cls = cls
+        self.conv = conv
+        # filled in once the site sees a second signature
+        self.entries: dict[tuple[type, type], CallConv] | None = None
+        self.megamorphic = False
+
+    def add(self, fn: type, cls: type, conv: CallConv) -> None:
+        if self.entries is None:
+            self.entries = {(self.fn, self.cls): self.conv}
+        if len(self.entries) >= POLY_SIZE:
+            self.megamorphic = True
+            self.entries = None
+            return
+        self.entries[(fn, cls)] = conv
+        # the latest one is checked first
+        self.fn, self.cls, self.conv = fn, cls, conv
+
+
+class CacheStats:
+    __slots__ = ("hits", "misses", "uncached", "sites", "polymorphic", "megamorphic")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self.sites = 0
+        self.polymorphic = 0
+        self.megamorphic = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses + self.uncached
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            uncached=self.uncached,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            sites=self.sites,
+            polymorphic=self.polymorphic,
+            megamorphic=self.megamorphic,
+        )
+
+
+ic_stats = CacheStats()
+register_stats("inline_cache", ic_stats.as_dict, ic_stats.reset)
+
+
+def call_convention(fn: type, data: Any) -> CallConv:
+    """Slow path: look for quantum data if the builtin is a quantum one"""
+    if fn.quantum and len(set(quantum_array_types_list).intersection(get_types_set(data))) > 0:
+        return CallConv.QUANTUM
+    return CallConv.DATA
+
+
+def is_cacheable(fn: type, data: Any) -> bool:
+    """Whether the data class alone decides the call convention"""
+    return not fn.quantum or isinstance(data, DataType)
+
+
+def resolve(fn: type, data: Any, code: R) -> CallConv:
+    conv = call_convention(fn, data)
+    if not is_cacheable(fn, data):
+        ic_stats.uncached += 1
+        return conv
+    ic_stats.misses += 1
+    ic = code.ic
+    if ic is None:
+        code.ic = InlineCache(fn, type(data), conv)
+        ic_stats.sites += 1
+    elif not ic.megamorphic:
+        was_polymorphic = ic.entries is not None
+        ic.add(fn, type(data), conv)
+        if ic.megamorphic:
+            ic_stats.megamorphic += 1
+            ic_stats.polymorphic -= was_polymorphic
+        elif not was_polymorphic:
+            ic_stats.polymorphic += 1
+    return conv
+
+
+def call_builtin(fn: type, mem: Mem, data: Any, code: R) -> Any:
+    """Builtin `fn` instance for `data`, called from operation node `code`"""
+    ic = code.ic
+    cls = type(data)
+    if ic is not None and ic.fn is fn and ic.cls is cls:
+        ic_stats.hits += 1
+        conv = ic.conv
+    elif ic is not None and ic.entries is not None and (fn, cls) in ic.entries:
+        ic_stats.hits += 1
+        conv = ic.entries[(fn, cls)]
+    elif ic is not None and ic.megamorphic:
+        ic_stats.uncached += 1
+        conv = call_convention(fn, data)
+    else:
+        conv = resolve(fn, data, code)
+    if conv == CallConv.QUANTUM:
+        if tracer.quantum:
+            tracer.debug(TraceCategory.QUANTUM, "* * has quantum! %s -> %s", code, data)
+        return fn(mem, *(data + (code,)))
+    return fn(mem, data)
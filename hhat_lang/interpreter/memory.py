@@ -1,6 +1,6 @@
+from collections import ChainMap
 from copy import deepcopy
 from typing import Any, Callable, Iterable
-from uuid import uuid4, uuid3, NAMESPACE_OID
 from dataclasses import dataclass, field
 
 from hhat_lang.interpreter.var_handlers import Var
@@ -9,6 +9,8 @@ from hhat_lang.interpreter.post_ast import R
 
 from hhat_lang.syntax_trees.ast import ATO, AST, ASTType, DataTypeEnum
 from hhat_lang.datatypes.base_datatype import DataType, DataTypeArray
+from hhat_lang.datatypes.array_storage import is_ndarray
+from hhat_lang.utils.ids import current_ids
 
 
 def transform_token_type(data: ATO):
@@ -34,7 +36,7 @@ class Data:
 
     def __init__(self, *values: Any):
         self.value = values
-        self.id = str(uuid3(NAMESPACE_OID, str(self.value)))
+        self.id = current_ids().new_data()
 
     def format_value(self, value: Any):
         if isinstance(value, tuple):
@@ -78,6 +80,13 @@ class Data:
         yield from self.value
 
 
+def value_size(value: Any) -> int:
+    data = getattr(value, "data", None)
+    if isinstance(data, tuple) or is_ndarray(data):
+        return len(data) or 1
+    return 1
+
+
 # TODO: make memory class lightweight
 #  1- memory methods into a separated entity
 #  2- only memory data inside memory
@@ -88,31 +97,107 @@ class Mem:
 
     Handles all memory related operations for the scope.
     """
-    parent_id: str = ""
-    id: str = field(init=False, default=str(uuid4()))
+    parent_id: int = -1
+    id: int = field(init=False, default=-1)
     data: dict = field(init=False, default_factory=dict)
+    # shared variables indexed by their resolved slot (see `Var.slot`)
+    frame: list = field(init=False, default_factory=list, repr=False)
+    # `frame` is the parent's one, copied on the first write
+    frame_shared: bool = field(init=False, default=False, repr=False)
+    # stacks are the parent's ones, copied on the first write
+    stacks_shared: bool = field(init=False, default=False, repr=False)
+    # scope this one was pushed from (see `push_scope`)
+    parent: "Mem | None" = field(init=False, default=None, repr=False, compare=False)
 
     def __post_init__(self):
+        self.id = current_ids().new_mem()
         self.data = self._reset_data()
 
+    def branch(self) -> "Mem":
+        """Child scope memory, copy-on-write over this one
+
+        The child shares its stacks with its parent until it first writes
+        to them. Initialized variables cannot be assigned again, so its
+        variables are an overlay (`ChainMap`) holding its own writes only,
+        and the frame is copied on the first write. `share_vars` merges
+        the child writes back. The parent must not change while the child
+        is in use.
+        """
+        mem = Mem.__new__(Mem)
+        mem.parent_id = self.id
+        mem.id = current_ids().new_mem()
+        mem.parent = None
+        shared = self.data["shared"]
+        parent_vars = shared["vars"]
+        mem.data = dict(
+            shared=dict(
+                shared,
+                vars=(
+                    parent_vars.new_child()
+                    if isinstance(parent_vars, ChainMap)
+                    else ChainMap(dict(), parent_vars)
+                ),
+                fn=deepcopy(shared["fn"]) if shared["fn"] else dict(),
+                main=deepcopy(shared["main"]) if shared["main"] else dict(),
+            ),
+            pvt=dict(self.data["pvt"]),
+            quantum=dict(self.data["quantum"]),
+        )
+        mem.frame = self.frame
+        mem.frame_shared = True
+        mem.stacks_shared = True
+        return mem
+
+    def __getstate__(self) -> dict:
+        # pickled alone (e.g. for a worker process): the variables seen
+        # from this scope are flattened and the scopes it was pushed from
+        # are left out
+        state = dict(self.__dict__)
+        state["parent"] = None
+        shared = self.data["shared"]
+        if isinstance(shared["vars"], ChainMap):
+            state["data"] = dict(self.data, shared=dict(shared, vars=dict(shared["vars"])))
+        return state
+
+    def push_scope(self) -> "Mem":
+        """Enter a child scope (a branch of this memory)"""
+        mem = self.branch()
+        mem.parent = self
+        return mem
+
+    def pop_scope(self) -> "Mem":
+        """Leave this scope, sharing its variables back, and return its parent"""
+        parent = self.parent
+        self.share_vars(parent)
+        self.parent = None
+        return parent
+
+    def own_stacks(self) -> None:
+        # copy the stacks shared with the parent before writing to them
+        for k in self.data.values():
+            for name in ("stack", "data", "exprs"):
+                if name in k:
+                    k[name] = list(k[name])
+        self.stacks_shared = False
+
     @staticmethod
     def _reset_data() -> dict:
         return dict(
             shared=dict(
-                stack=(),
-                data=(),
-                exprs=(),
+                stack=[],
+                data=[],
+                exprs=[],
                 vars=dict(),
                 fn=dict(),
                 main=dict()
             ),
             pvt=dict(
-                stack=(),
-                data=(),
-                exprs=(),
+                stack=[],
+                data=[],
+                exprs=[],
             ),
             quantum=dict(
-                stack=(),
+                stack=[],
             )
         )
 
@@ -125,55 +210,76 @@ class Mem:
         return tuple(self.data["shared"]["fn"].keys())
 
     def pop_stack(self, key: str = "shared") -> Any:
-        res = self.data[key]["stack"][-1]
-        self.data[key]["stack"] = tuple(self.data[key]["stack"][:-1])
-        return res
+        if self.stacks_shared:
+            self.own_stacks()
+        return self.data[key]["stack"].pop()
 
     def pop_expr(self, key: str = "shared") -> Any:
-        res = self.data[key]["exprs"][-1]
-        self.data[key]["exprs"] = tuple(self.data[key]["exprs"][:-1])
-        return res
+        if self.stacks_shared:
+            self.own_stacks()
+        return self.data[key]["exprs"].pop()
+
+    # stack values are not changed in place, so they need no copy
 
     def get_stack(self, key: str = "shared") -> tuple[Any]:
-        res = deepcopy(self.data[key]["stack"])
-        self.data[key]["stack"] = ()
+        res = tuple(self.data[key]["stack"])
+        self.data[key]["stack"] = []
         return res
 
     def get_data(self, key: str = "shared") -> tuple[Any]:
-        res = deepcopy(self.data[key]["data"])
-        self.data[key]["data"] = ()
+        res = tuple(self.data[key]["data"])
+        self.data[key]["data"] = []
         return res
 
     def get_var(self, name: str, key: str = "shared") -> Any:
         return self.data[key]["vars"][name]["data"]
 
+    def get_slot(self, slot: int) -> Var | None:
+        frame = self.frame
+        return frame[slot] if slot < len(frame) else None
+
     def get_expr(self, key: str = "shared") -> tuple[Any]:
-        expr = self.data[key]["exprs"][-1]
-        self.data[key]["exprs"] = tuple(self.data[key]["exprs"][:-1])
-        return expr
+        return self.pop_expr(key)
 
     def get_fn(self, name: str, n_args: int, args: Any) -> Any:
         # TODO: implement it properly
         raise NotImplemented("Mem.get_fn not implemented yet.")
 
     def get_q(self) -> R | Var | tuple[R | Var]:
-        res = deepcopy(self.data["quantum"]["stack"])
-        self.data["quantum"]["stack"] = ()
+        res = tuple(self.data["quantum"]["stack"])
+        self.data["quantum"]["stack"] = []
         return res
 
     def put_stack(self, value: Any, key: str = "shared") -> None:
-        self.data[key]["stack"] += value,
+        if self.stacks_shared:
+            self.own_stacks()
+        self.data[key]["stack"].append(value)
 
     def put_expr(self, value: Any, key: str = "shared") -> None:
-        self.data[key]["exprs"] += value,
+        if self.stacks_shared:
+            self.own_stacks()
+        self.data[key]["exprs"].append(value)
 
     def put_data(self, value: Data | DataType | DataTypeArray, key: str = "shared") -> None:
-        self.data[key]["data"] += value,
+        if self.stacks_shared:
+            self.own_stacks()
+        self.data[key]["data"].append(value)
 
-    def put_var(self, data: Var, scope_id: str, key: str = "shared") -> tuple[str, str]:
+    def put_var(self, data: Var, scope_id: str, key: str = "shared") -> tuple[int, str]:
         self.data[key]["vars"][data.name] = dict(data=data, scope_id=scope_id)
+        if data.slot >= 0 and key == "shared":
+            self.put_slot(data.slot, data)
         return data.id, scope_id
 
+    def put_slot(self, slot: int, data: Var) -> None:
+        if self.frame_shared:
+            self.frame = list(self.frame)
+            self.frame_shared = False
+        frame = self.frame
+        if slot >= len(frame):
+            frame.extend([None] * (slot + 1 - len(frame)))
+        frame[slot] = data
+
     def put_fn(self, data: "Fn") -> None:
         # TODO: implement properly how to deal with the data args
         mem_fn = self.data["shared"]["fn"]
@@ -187,10 +293,17 @@ class Mem:
 
     def put_q(self, data2: R | tuple | tuple[R] | Var | ATO) -> None:
         if data2:
-            self.data["quantum"]["stack"] += (data2 if isinstance(data2, tuple) else (data2,))
+            if self.stacks_shared:
+                self.own_stacks()
+            if isinstance(data2, tuple):
+                self.data["quantum"]["stack"].extend(data2)
+            else:
+                self.data["quantum"]["stack"].append(data2)
 
     def to_quantum(self, key: str = "shared"):
-        self.data["quantum"]["stack"] += self.data[key]["stack"]
+        if self.stacks_shared:
+            self.own_stacks()
+        self.data["quantum"]["stack"].extend(self.data[key]["stack"])
 
     def append_var_data(self, var: Var, data: Any, key: str = "shared") -> Var:
         if data is None:
@@ -200,36 +313,76 @@ class Mem:
         # TODO: include `scope_id` as well
         old_data = self.get_var(var.name).get_data()
         new_data = tuple(old_data) + data
-        new_var = Var(var.name)(*new_data)
+        new_var = Var(var.name, var.slot)(*new_data)
         self.put_var(new_var, "", key=key)
         return new_var
 
     def share_stack(self, mem_target: "Mem") -> None:
-        mem_target.data["shared"]["stack"] += self.data["shared"]["stack"]
+        if mem_target.stacks_shared:
+            mem_target.own_stacks()
+        mem_target.data["shared"]["stack"].extend(self.data["shared"]["stack"])
+
+    def written_vars(self) -> dict:
+        """Variables written in this scope (all of them, if not a branch)"""
+        variables = self.data["shared"]["vars"]
+        return variables.maps[0] if isinstance(variables, ChainMap) else variables
+
+    def merge_vars(self, variables: dict) -> None:
+        """Add variables written in another scope (see `written_vars`)"""
+        self.data["shared"]["vars"].update(variables)
+        for k in variables.values():
+            if k["data"].slot >= 0:
+                self.put_slot(k["data"].slot, k["data"])
 
     def share_vars(self, mem_target: "Mem") -> None:
+        if isinstance(self.data["shared"]["vars"], ChainMap):
+            # a branch: only its own writes
+            mem_target.merge_vars(self.written_vars())
+            return
         mem_target.data["shared"]["vars"].update(self.data["shared"]["vars"])
+        for slot, data in enumerate(self.frame):
+            if data is not None:
+                mem_target.put_slot(slot, data)
 
     def share_data(self, mem_target: "Mem") -> None:
-        mem_target.data["shared"]["data"] += self.data["shared"]["data"]
+        if mem_target.stacks_shared:
+            mem_target.own_stacks()
+        mem_target.data["shared"]["data"].extend(self.data["shared"]["data"])
 
     def clear_stack(self, key: str = "shared") -> None:
-        self.data[key]["stack"] = ()
+        self.data[key]["stack"] = []
 
     def clear_data(self, key: str = "shared") -> None:
-        self.data[key]["data"] = ()
+        self.data[key]["data"] = []
 
     def clear_var(self, key: str = "shared") -> None:
         self.data[key]["vars"] = dict()
+        if key == "shared":
+            self.frame = []
+            self.frame_shared = False
 
     def clear_exprs(self, key: str = "shared") -> None:
-        self.data[key]["exprs"] = ()
+        self.data[key]["exprs"] = []
 
     def clear_q(self):
-        self.data["quantum"]["stack"] = ()
+        self.data["quantum"]["stack"] = []
 
     def clear_all(self) -> None:
         self.data = self._reset_data()
+        self.frame = []
+        self.frame_shared = False
+        self.stacks_shared = False
+
+    def size(self) -> int:
+        """Number of values held on the stacks and in the variables,
+        counting the elements of arrays and variables (one level deep)
+        """
+        res = sum(value_size(k["data"]) for k in self.data["shared"]["vars"].values())
+        for k in self.data.values():
+            for name in ("stack", "data", "exprs"):
+                if name in k:
+                    res += sum(value_size(v) for v in k[name])
+        return res
 
     def __contains__(self, item: Any) -> bool:
         return (
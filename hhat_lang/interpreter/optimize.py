@@ -0,0 +1,242 @@
+"""Optimization passes over the analyzed R tree
+
+Level 1 folds constant pipeline prefixes: a literal (or literal array)
+followed by pure builtin calls, such as `.[2 3 4]:sum` or
+`.[68 9]:sum(12 35)`, is evaluated once at analysis time and replaced by
+its result as a literal. Side-effecting builtins (`print`, quantum
+functions) and anything involving variables are left untouched.
+
+Level 2 also fuses the remaining runs of pure builtin calls without
+arguments, such as `sum:times` in `x:sum:times:print`, into a single
+`FUSED` node. It takes its input from the memory stack once and passes
+intermediate results directly from one builtin to the next. The calls
+are kept as the node children, to run them one by one as a fallback.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from hhat_lang.interpreter.memory import Mem
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.syntax_trees.ast import (
+    ATO,
+    Literal,
+    ASTType,
+    DataTypeEnum,
+    ExprParadigm,
+)
+from hhat_lang.datatypes.builtin_datatype import Int, IntArray, int_value
+from hhat_lang.builtins.functions import builtin_fn_dict
+from hhat_lang.utils.spans import join_spans
+from hhat_lang.utils.tracing import tracer, TraceCategory
+
+
+def is_int_literal(code: R | ATO) -> bool:
+    return isinstance(code, Literal) and code.type == DataTypeEnum.INT
+
+
+def is_literal_array(code: R | ATO) -> bool:
+    return (
+        isinstance(code, R)
+        and code.type == ASTType.ARRAY
+        and not code.has_q
+        and len(code) > 0
+        and all(is_int_literal(k) for k in code)
+    )
+
+
+def is_pure_builtin(code: R | ATO) -> bool:
+    if not isinstance(code, R) or code.type != ASTType.BUILTIN or code.has_q:
+        return False
+    fn = builtin_fn_dict.get(code.value[0].token)
+    return fn is not None and fn.pure
+
+
+def is_pure_call(code: R | ATO) -> bool:
+    """Pure builtin call, without arguments or with literal ones"""
+    if not isinstance(code, R) or code.type != ASTType.CALL or code.has_q:
+        return False
+    if len(code) == 1:
+        return is_pure_builtin(code.value[0])
+    if len(code) == 2:
+        args = code.value[1]
+        return (
+            is_pure_builtin(code.value[0])
+            and args.type == ASTType.ARGS
+            and all(is_int_literal(k) for k in args)
+        )
+    return False
+
+
+def is_pure_step(code: R | ATO) -> bool:
+    if is_pure_call(code):
+        return True
+    return (
+        isinstance(code, R)
+        and code.type == ASTType.ARRAY
+        and not code.has_q
+        and len(code) > 0
+        and all(is_pure_call(k) for k in code)
+    )
+
+
+def produces_result(code: R | ATO) -> bool:
+    """Whether a pipeline element gives the expression a new result"""
+    if isinstance(code, ATO):
+        return True
+    return code.type == ASTType.ARRAY or (code.type == ASTType.CALL and len(code) == 1)
+
+
+def constant_prefix(code: R) -> int:
+    """Length of the foldable prefix of an expression (0 if none)"""
+    if not code.value or not (is_int_literal(code.value[0]) or is_literal_array(code.value[0])):
+        return 0
+    size = 1
+    while size < len(code) and is_pure_step(code.value[size]):
+        size += 1
+    return size if size > 1 else 0
+
+
+def to_literal(data: Any) -> R | ATO | None:
+    """Literal node for a folded value, if it can be written as one"""
+    if isinstance(data, Int):
+        value = int_value(data)
+        if value is not None:
+            return Literal(token=str(value), lit_type=DataTypeEnum.INT)
+        return None
+    if isinstance(data, IntArray):
+        values = tuple(int_value(k) if isinstance(k, Int) else None for k in data)
+        if not values or None in values:
+            return None
+        return R(
+            ast_type=ASTType.ARRAY,
+            value=tuple(Literal(token=str(k), lit_type=DataTypeEnum.INT) for k in values),
+            paradigm_type=ExprParadigm.SEQUENTIAL,
+            role="",
+            execute_after=None,
+        )
+    return None
+
+
+def fold_prefix(code: R, size: int) -> R | ATO | None:
+    """Literal for the first `size` elements of expression `code`, if
+    they can be folded
+    """
+    from hhat_lang.interpreter.eval import eval_expr
+
+    value = code.value[:size]
+    # building the prefix node makes it the parent of the elements,
+    # which must keep their own parent if nothing is folded
+    parents = [(k, k.parent_id) for k in value if isinstance(k, R)]
+    prefix = R(
+        ast_type=ASTType.EXPR,
+        value=value,
+        paradigm_type=code.paradigm,
+        role=code.role,
+        execute_after=None,
+    )
+    for k, parent_id in parents:
+        k.nodes.set_parent(k.id, parent_id)
+    mem = Mem()
+    try:
+        res = eval_expr(prefix, mem)
+    except Exception:
+        # left for the execution to fail at the right place
+        return None
+    stack = mem.data["shared"]["stack"]
+    if len(stack) != 1 or mem.data["shared"]["exprs"]:
+        return None
+    if (not res or res[0] is not stack[0]) and not (
+        size < len(code) and produces_result(code.value[size])
+    ):
+        # a call with arguments leaves its result on the stack but not
+        # as the expression result: only fold it if something follows
+        return None
+    folded = to_literal(stack[0])
+    if folded is not None and tracer.analysis:
+        tracer.debug(TraceCategory.ANALYSIS, "folded %s -> %s", prefix, folded)
+    return folded
+
+
+def fold_expr(code: R) -> None:
+    """Replace the constant prefix of expression `code`, in place"""
+    size = constant_prefix(code)
+    if size == 0:
+        return
+    folded = fold_prefix(code, size)
+    if folded is None:
+        return
+    folded.span = join_spans(code.value[0].span, code.value[size - 1].span)
+    code.value = (folded,) + code.value[size:]
+    if isinstance(folded, R):
+        folded.nodes.set_parent(folded.id, code.id)
+
+
+def is_fusable(code: R | ATO) -> bool:
+    return is_pure_call(code) and len(code) == 1
+
+
+def fuse_expr(code: R) -> None:
+    """Fuse the runs of pure calls of expression `code`, in place"""
+    value = []
+    run = []
+    for k in code.value + (None,):
+        if k is not None and is_fusable(k):
+            run.append(k)
+            continue
+        if len(run) > 1:
+            fused = R(
+                ast_type=ASTType.FUSED,
+                value=tuple(run),
+                paradigm_type=code.paradigm,
+                role=code.role,
+                execute_after=None,
+            )
+            fused.span = join_spans(run[0].span, run[-1].span)
+            fused.nodes.set_parent(fused.id, code.id)
+            if tracer.analysis:
+                tracer.debug(TraceCategory.ANALYSIS, "fused %s", fused)
+            value.append(fused)
+        else:
+            value.extend(run)
+        run = []
+        if k is not None:
+            value.append(k)
+    code.value = tuple(value)
+
+
+def fuse_pipelines(code: R | ATO) -> R | ATO:
+    """Pipeline fusion pass, over all the (non-quantum) expressions"""
+    if not isinstance(code, R) or code.has_q:
+        return code
+    if code.type == ASTType.EXPR:
+        fuse_expr(code)
+    for k in code:
+        fuse_pipelines(k)
+    return code
+
+
+def fold_constants(code: R | ATO) -> R | ATO:
+    """Constant folding pass
+
+    Only expressions starting a top-level line or an array element are
+    folded: there, the memory stack below the folded value is never used.
+    """
+    if not isinstance(code, R) or code.has_q:
+        return code
+    if code.type == ASTType.EXPR:
+        fold_expr(code)
+    if code.type in (ASTType.MAIN, ASTType.EXPR, ASTType.ARRAY):
+        for k in code:
+            if isinstance(k, R) and k.type in (ASTType.EXPR, ASTType.ARRAY):
+                fold_constants(k)
+    return code
+
+
+def optimize(code: R | ATO, opt_level: int = 1) -> R | ATO:
+    if opt_level >= 1:
+        code = fold_constants(code)
+    if opt_level >= 2:
+        code = fuse_pipelines(code)
+    return code
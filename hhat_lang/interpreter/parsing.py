@@ -9,17 +9,36 @@ from hhat_lang.syntax_trees.ast import (
     DataTypeEnum,
 )
 from hhat_lang.grammar import grammar_file
-from arpeggio import visit_parse_tree, PTNodeVisitor
+from hhat_lang.grammar.python_grammar import program as python_program
+from hhat_lang.interpreter.fast_parsing import fast_parse_code, ParseError
+from hhat_lang.utils.spans import make_span
+from hhat_lang.utils.tracing import tracer, TraceCategory
+from arpeggio import visit_parse_tree, NoMatch, PTNodeVisitor, Parser, ParserPython
 from arpeggio.cleanpeg import ParserPEG
+from enum import Enum, auto, unique
+from threading import Lock
+
+
+@unique
+class ParserBackend(Enum):
+    PEG     = auto()
+    PYTHON  = auto()
+    FAST    = auto()
 
 
 class CST(PTNodeVisitor):
-    def __init__(self, defaults=True, **kwargs):
+    def __init__(self, defaults=True, offset: int = 0, **kwargs):
         super().__init__(defaults=defaults, **kwargs)
+        # position of the code in the whole source (e.g. when streaming)
+        self.offset = offset
+
+    def spanned(self, n, node):
+        node.span = make_span(self.offset + n.position, self.offset + n.position_end)
+        return node
 
     def visit_program(self, n, k):
-        res = Array(ExprParadigm.CONCURRENT, *k)
-        return Main(res)
+        res = self.spanned(n, Array(ExprParadigm.CONCURRENT, *k))
+        return self.spanned(n, Main(res))
 
     def visit_exprs(self, n, k):
         new_k = ()
@@ -29,50 +48,106 @@ class CST(PTNodeVisitor):
                 new_k += p.edges
             else:
                 new_k += p,
-        return Expr(*new_k, has_q=has_q_var)
+        return self.spanned(n, Expr(*new_k, has_q=has_q_var))
 
     def visit_parallel(self, n, k):
         has_q_var = all(p.has_q for p in k)
-        return Array(ExprParadigm.PARALLEL, *k, has_q=has_q_var)
+        return self.spanned(n, Array(ExprParadigm.PARALLEL, *k, has_q=has_q_var))
 
     def visit_concurrent(self, n, k):
         has_q_var = all(p.has_q for p in k)
-        return Array(ExprParadigm.CONCURRENT, *k, has_q=has_q_var)
+        return self.spanned(n, Array(ExprParadigm.CONCURRENT, *k, has_q=has_q_var))
 
     def visit_sequential(self, n, k):
         has_q_var = all(p.has_q for p in k)
-        return Array(ExprParadigm.SEQUENTIAL, *k, has_q=has_q_var)
+        return self.spanned(n, Array(ExprParadigm.SEQUENTIAL, *k, has_q=has_q_var))
 
     def visit_expr(self, n, k):
-        print("EXPR!")
+        if tracer.parse:
+            tracer.debug(TraceCategory.PARSE, "EXPR!")
         if len(k) > 1:
-            return Expr(*k)
+            return self.spanned(n, Expr(*k))
         return k
 
     def visit_single(self, n, k):
-        print("SINGLE!")
-        return Expr(*k)
+        if tracer.parse:
+            tracer.debug(TraceCategory.PARSE, "SINGLE!")
+        return self.spanned(n, Expr(*k))
 
     def visit_operation(self, n, k):
         if len(k) > 1:
-            return Operation(k[0], k[1])
-        return Operation(k[0], None)
+            return self.spanned(n, Operation(k[0], k[1]))
+        return self.spanned(n, Operation(k[0], None))
 
     def visit_id(self, n, k):
-        return Id(token=n.value)
+        return self.spanned(n, Id(token=n.value))
 
     def visit_literal(self, n, k):
         return k[0]
 
     def visit_INT(self, n, k):
-        return Literal(token=n.value, lit_type=DataTypeEnum.INT)
+        return self.spanned(n, Literal(token=n.value, lit_type=DataTypeEnum.INT))
 
     def visit_BOOL(self, n, k):
-        return Literal(token=n.value, lit_type=DataTypeEnum.BOOL)
-
-
-def parse_code(code):
-    peg_grammar = open(grammar_file, "r").read()
-    parsed_code = ParserPEG(peg_grammar, "program", reduce_tree=True)
-    pt = parsed_code.parse(code)
-    return visit_parse_tree(pt, CST())
+        return self.spanned(n, Literal(token=n.value, lit_type=DataTypeEnum.BOOL))
+
+
+##################
+# PARSER CACHING #
+##################
+
+# Parsers are built once per process, lazily on first use. Arpeggio
+# parsers keep state while parsing, so each one is paired with its own
+# lock to be safely shared between threads.
+_parsers: dict[ParserBackend, tuple[Parser, Lock]] = dict()
+_parsers_lock = Lock()
+
+
+def build_parser(backend: ParserBackend = ParserBackend.PEG) -> Parser:
+    match backend:
+        case ParserBackend.PEG:
+            peg_grammar = open(grammar_file, "r").read()
+            return ParserPEG(peg_grammar, "program", reduce_tree=True)
+        case ParserBackend.PYTHON:
+            return ParserPython(python_program, reduce_tree=True)
+        case ParserBackend.FAST:
+            raise ValueError("fast parser backend does not use an Arpeggio parser.")
+    raise NotImplementedError(f"parser backend {backend} not implemented.")
+
+
+def get_parser(backend: ParserBackend = ParserBackend.PEG) -> tuple[Parser, Lock]:
+    cached = _parsers.get(backend)
+    if cached is None:
+        with _parsers_lock:
+            cached = _parsers.get(backend)
+            if cached is None:
+                cached = build_parser(backend), Lock()
+                _parsers[backend] = cached
+    return cached
+
+
+def clear_parser_cache() -> None:
+    with _parsers_lock:
+        _parsers.clear()
+
+
+def parse_code(
+        code: str,
+        backend: ParserBackend = ParserBackend.PEG,
+        offset: int = 0,
+) -> Main:
+    """Parse the code; node spans are shifted by `offset`
+
+    Syntax errors raise `ParseError`, whatever the backend.
+    """
+    if backend is ParserBackend.FAST:
+        # hand-written parser: no Arpeggio parser to build nor CST to visit
+        return fast_parse_code(code, offset)
+    parser, lock = get_parser(backend)
+    with lock:
+        try:
+            pt = parser.parse(code)
+        except NoMatch as e:
+            # `str` also works out the line and column of the error
+            raise ParseError(str(e), e.line, e.col) from e
+    return visit_parse_tree(pt, CST(offset=offset))
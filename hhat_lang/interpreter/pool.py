@@ -0,0 +1,86 @@
+"""Process pool for parallel (`{...}`) arrays and top-level expressions
+
+The pool is opt-in: with a single worker (the default), everything runs
+serially, in process. Otherwise it is created on first use and shut down
+at exit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from hhat_lang.interpreter.governor import governor
+from hhat_lang.utils.event_trace import events
+from hhat_lang.utils.profiling import profiler
+from hhat_lang.utils.tracing import tracer
+
+
+_workers: int | None = 1
+_parallel_lines = False
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = Lock()
+
+
+def set_workers(workers: int | None = 1) -> None:
+    """Number of worker processes (`None`: one per CPU)"""
+    global _workers
+    if workers is not None and workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}.")
+    with _pool_lock:
+        if workers != _workers:
+            _shutdown()
+            _workers = workers
+
+
+def get_workers() -> int:
+    return _workers if _workers is not None else (os.cpu_count() or 1)
+
+
+def set_parallel_lines(enabled: bool = False) -> None:
+    """Run independent top-level expressions on the pool"""
+    global _parallel_lines
+    _parallel_lines = enabled
+
+
+def get_parallel_lines() -> bool:
+    return _parallel_lines
+
+
+def _init_worker() -> None:
+    global _workers, _parallel_lines, _pool
+    # everything inside a worker runs serially
+    _workers, _parallel_lines, _pool = 1, False, None
+    # only the parent process is profiled and traced
+    profiler.disable()
+    events.disable()
+    # tasks bring their own budget (see `Governor.remaining`)
+    governor.stop()
+    # lines the parent process had buffered are for it to write
+    if tracer.sink is not None:
+        tracer.sink.buffer.clear()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=get_workers(), initializer=_init_worker)
+        return _pool
+
+
+def _shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def shutdown_pool() -> None:
+    with _pool_lock:
+        _shutdown()
+
+
+atexit.register(shutdown_pool)
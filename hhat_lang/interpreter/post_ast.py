@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 from typing import Any, Iterable, Union
-from uuid import uuid4
 
 from hhat_lang.syntax_trees.ast import ATO, AST, ASTType, ExprParadigm
+from hhat_lang.utils.ids import current_ids
+from hhat_lang.utils.spans import NO_SPAN
 
 
 class R:
@@ -12,29 +13,56 @@ class R:
     Defines some extra properties for the AST
     data to be used on semantics and execution.
     """
+    __slots__ = (
+        "type",
+        "value",
+        "id",
+        "paradigm",
+        "role",
+        "execute_after",
+        "has_q",
+        "ic",
+        "span",
+        "nodes",
+    )
+
     def __init__(
             self,
             ast_type: ASTType,
             value: ATO | R | tuple[Union[ATO, R], ...],
             paradigm_type: ExprParadigm,
             role: str,
-            execute_after: tuple[str, ...] | None,
+            execute_after: tuple[int, ...] | None,
             has_q: bool = False,
+            source: AST | ATO | None = None,
     ):
         self.type = ast_type
         self.value = value if isinstance(value, tuple) else (value,)
-        self.id = str(uuid4())
-        self.parent_id = ""
+        ids = current_ids()
+        self.id = ids.new_node(source)
+        # node table of the run this node was built in
+        self.nodes = ids.nodes
         self.paradigm = paradigm_type
         self.role = role
         self.execute_after = execute_after if execute_after else ()
         self.assign_parent_id()
         self.has_q = has_q
+        # inline cache of builtin calls (see `inline_cache`)
+        self.ic = None
+        self.span = getattr(source, "span", NO_SPAN)
+
+    @property
+    def parent_id(self) -> int:
+        return self.nodes.parent_of(self.id)
+
+    @property
+    def source(self) -> AST | ATO | None:
+        return self.nodes.source_of(self.id)
 
     def assign_parent_id(self):
         for k in self.value:
             if isinstance(k, R):
-                k.parent_id = self.id
+                k.nodes.set_parent(k.id, self.id)
 
     def __hash__(self) -> int:
         return hash(self.value)
@@ -12,15 +12,27 @@ from hhat_lang.syntax_trees.ast import (
 )
 from hhat_lang.builtins.functions import builtin_fn_dict
 from hhat_lang.interpreter.post_ast import R
+from hhat_lang.interpreter.dataflow import build_dataflow, DataflowBuilder
+from hhat_lang.interpreter.optimize import optimize
+from hhat_lang.utils.ids import new_run
+from hhat_lang.utils.tracing import tracer, TraceCategory
 
 
 class Analysis:
-    def __init__(self, parsed_code: AST):
+    def __init__(self, parsed_code: AST, opt_level: int = 0):
         self.code = parsed_code
+        self.opt_level = opt_level
+        self.dataflow: DataflowBuilder | None = None
+        self.slots: dict[str, int] = dict()
 
     def run(self) -> R:
-        res = analyze(self.code)
-        print(res)
+        # a fresh id run, so the same program always gets the same ids
+        new_run()
+        res = optimize(analyze(self.code), self.opt_level)
+        self.slots = resolve_names(res)
+        self.dataflow = build_dataflow(res)
+        if tracer.analysis:
+            tracer.info(TraceCategory.ANALYSIS, "%s", res)
         return res
 
 
@@ -39,6 +51,7 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                 role=role,
                 execute_after=None,
                 has_q=code_.has_q,
+                source=code_,
             )
         case Literal():
             return code_
@@ -52,6 +65,7 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                     role="caller",
                     execute_after=None,
                     has_q=code_.has_q,
+                    source=code_,
                 )
             else:
                 id_code = R(
@@ -61,6 +75,7 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                     role=role,
                     execute_after=None,
                     has_q=code_.has_q,
+                    source=code_,
                 )
             return R(
                 ast_type=ASTType.CALL,
@@ -69,6 +84,7 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                 role=role,
                 execute_after=None,
                 has_q=code_.has_q,
+                source=code_,
             )
         case Array():
             res = iter_analyze(code_, role)
@@ -79,6 +95,7 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                 role=role,
                 execute_after=None,
                 has_q=code_.has_q,
+                source=code_,
             )
         case Operation():
             res = iter_analyze(code_, role="callee")
@@ -97,6 +114,7 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                         role="caller",
                         execute_after=None,
                         has_q=code_.has_q,
+                        source=code_.node,
                     ),
                     R(
                         ast_type=ASTType.ARGS,
@@ -105,12 +123,14 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                         role="callee",
                         execute_after=None,
                         has_q=code_.has_q,
+                        source=code_.edges,
                     )
                 ),
                 paradigm_type=ExprParadigm.SINGLE,
                 role=role,
                 execute_after=None,
                 has_q=code_.has_q,
+                source=code_,
             )
         case Main():
             res = iter_analyze(code_, role)
@@ -121,6 +141,31 @@ def analyze(code_: AST | ATO, role: str = "") -> R | AST | ATO:
                 role="",
                 execute_after=None,
                 has_q=code_.has_q,
+                source=code_,
             )
         case _:
-            print(f"!! no match on previous cases: is {type(code_)}!")
+            if tracer.analysis:
+                tracer.warning(TraceCategory.ANALYSIS, "!! no match on previous cases: is %s!", type(code_))
+
+
+def resolve_names(code_: R | ATO, slots: dict[str, int] | None = None) -> dict[str, int]:
+    """Bind each `Id` to its builtin function class or to a variable slot
+
+    Variables share a single namespace (array scopes share their
+    variables back), so each name gets one slot for the whole program.
+    Pass the same `slots` dict to resolve a program in pieces.
+    """
+    slots = dict() if slots is None else slots
+    stack = [code_]
+    while stack:
+        k = stack.pop()
+        if isinstance(k, R):
+            stack.extend(k.value)
+        elif isinstance(k, Id):
+            if k.token in builtin_fn_dict.keys():
+                k.ref = builtin_fn_dict[k.token]
+            else:
+                k.slot = slots.setdefault(k.token, len(slots))
+    if tracer.analysis:
+        tracer.debug(TraceCategory.ANALYSIS, "slots: %s", slots)
+    return slots
@@ -0,0 +1,40 @@
+"""Runtime statistics of the interpreter
+
+Components register a named source of counters; `get_stats` collects
+all of them and `reset_stats` zeroes them (e.g. between runs).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable
+
+
+_sources: dict[str, tuple[Callable[[], dict[str, Any]], Callable[[], None]]] = dict()
+
+
+def register_stats(
+        name: str,
+        get: Callable[[], dict[str, Any]],
+        reset: Callable[[], None],
+) -> None:
+    """Register a source of counters under `name`"""
+    _sources[name] = get, reset
+
+
+def get_stats(name: str | None = None) -> dict[str, Any]:
+    """Counters of source `name`, or of all the sources by name"""
+    if name is not None:
+        if name not in _sources:
+            raise ValueError(f"no stats named {name!r}.")
+        return _sources[name][0]()
+    return {k: get() for k, (get, _) in _sources.items()}
+
+
+def reset_stats(name: str | None = None) -> None:
+    if name is not None:
+        if name not in _sources:
+            raise ValueError(f"no stats named {name!r}.")
+        _sources[name][1]()
+        return
+    for _, reset in _sources.values():
+        reset()
@@ -0,0 +1,114 @@
+"""Streaming, expression-at-a-time parsing and analysis
+
+The source is read in chunks and split at top-level expression
+boundaries. Each top-level expression is parsed and analyzed on its own
+and handed to the evaluator right away, so memory stays bounded by the
+largest top-level expression instead of the whole program.
+"""
+
+from __future__ import annotations
+
+from itertools import chain
+from typing import Iterable, Iterator
+
+from hhat_lang.interpreter.dataflow import DataflowBuilder
+from hhat_lang.interpreter.fast_parsing import token_regex
+from hhat_lang.interpreter.parsing import parse_code, ParserBackend
+from hhat_lang.interpreter.optimize import optimize
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.interpreter.semantics import analyze, resolve_names
+from hhat_lang.syntax_trees.ast import ATO, AST
+from hhat_lang.utils.ids import new_run
+
+
+CHUNK_SIZE = 1 << 16
+
+opening_punct = ("[", "(", "{")
+closing_punct = ("]", ")", "}")
+
+
+def iter_file_chunks(file: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    with open(file, "r") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def split_exprs(chunks: Iterable[str]) -> Iterator[str]:
+    """Split the source, given in chunks, into top-level expressions
+
+    A top-level expression ends when, outside any bracket, a complete
+    element is followed by anything but `:` or, right after an id, an
+    opening bracket (the operation arguments). Tokens touching the end
+    of a chunk are only scanned once the next chunk arrives.
+    """
+    buf = ""
+    pos = 0
+    depth = 0
+    complete = False
+    after_id = False
+    for chunk in chain(chunks, (None,)):
+        final = chunk is None
+        if not final:
+            buf += chunk
+        while m := token_regex.match(buf, pos):
+            if not final and m.end() == len(buf):
+                # token may continue on the next chunk
+                break
+            kind = m.lastgroup
+            if kind == "WS":
+                pos = m.end()
+                continue
+            token = m.group()
+            if depth == 0 and complete and token != ":" and not (
+                after_id and token in opening_punct
+            ):
+                yield buf[:m.start()]
+                buf = buf[m.start():]
+                pos = 0
+                complete = False
+                after_id = False
+                continue
+            if token in opening_punct:
+                depth += 1
+                complete = False
+            elif token in closing_punct:
+                depth = max(depth - 1, 0)
+                complete = depth == 0
+            elif token in (":", "."):
+                complete = False
+            else:
+                complete = depth == 0
+            after_id = kind == "ID" and depth == 0
+            pos = m.end()
+    if buf.strip():
+        yield buf
+
+
+def stream_parse(
+        chunks: Iterable[str],
+        backend: ParserBackend = ParserBackend.FAST,
+) -> Iterator[AST | ATO]:
+    # expressions are split without dropping any text, so spans get
+    # their offsets in the whole source by adding up their lengths
+    offset = 0
+    for code in split_exprs(chunks):
+        yield from parse_code(code, backend=backend, offset=offset).edges
+        offset += len(code)
+
+
+def stream_analyze(
+        chunks: Iterable[str],
+        backend: ParserBackend = ParserBackend.FAST,
+        opt_level: int = 0,
+) -> Iterator[R | ATO]:
+    # ids are still deterministic, but each top-level expression gets
+    # its own node table, so memory does not grow with the program size
+    ids = new_run()
+    dataflow = DataflowBuilder(keep_graph=False)
+    slots = dict()
+    for code in stream_parse(chunks, backend=backend):
+        ids.new_table()
+        res = optimize(analyze(code), opt_level)
+        resolve_names(res, slots)
+        dataflow.add(res)
+        yield res
@@ -1,8 +1,8 @@
 from typing import Any, Iterable
-from uuid import uuid4
 
 from hhat_lang.datatypes import DataType, DataTypeArray, builtin_array_types_dict
 from hhat_lang.syntax_trees.ast import DataTypeEnum
+from hhat_lang.utils.ids import current_ids
 
 
 def get_var_type(data: Any, types: set[str]) -> DataTypeEnum:
@@ -26,11 +26,12 @@ class Var:
     """
     token = "id"
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, slot: int = -1):
         self.initialized = False
         self.name = name if name else ""
+        self.slot = slot
         self.data = ()
-        self.id = str(uuid4())
+        self.id = current_ids().new_var()
         # TODO: generalize it for any quantum data type
         self.type = DataTypeEnum.Q_ARRAY if name.startswith("@") else DataTypeEnum.NULL
 
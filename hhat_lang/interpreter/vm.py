@@ -0,0 +1,474 @@
+"""Bytecode compiler and stack VM
+
+The analyzed R tree is compiled to a flat list of instructions, in
+execution order, and run by a dispatch loop over a value stack. The VM
+reuses `Mem` and the builtins, and has the same effects on memory as the
+tree-walking evaluator (`eval.execute`), which remains the reference.
+
+Quantum (has_q) nodes, parallel arrays run on the process pool,
+concurrent arrays whose branches interleave and node shapes the compiler
+does not know are deferred to the tree-walker as a whole.
+"""
+
+from __future__ import annotations
+
+from array import array
+from enum import IntEnum, unique
+from typing import Any, Iterable
+
+from hhat_lang.interpreter.eval import (
+    arrange_array_output,
+    execute,
+    fused_fns,
+    interleaves,
+    parallel_lines,
+    run_fused,
+)
+from hhat_lang.interpreter.governor import governor
+from hhat_lang.interpreter.inline_cache import call_builtin
+from hhat_lang.interpreter.memory import Mem
+from hhat_lang.interpreter.pool import get_workers
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.interpreter.var_handlers import Var
+from hhat_lang.syntax_trees.ast import ATO, ASTType, ExprParadigm, operations_or_id
+from hhat_lang.datatypes.builtin_datatype import builtin_data_types_dict
+from hhat_lang.builtins.functions import builtin_fn_dict
+from hhat_lang.utils.profiling import profiler, ProfileKind
+from hhat_lang.utils.spans import NO_SPAN
+from hhat_lang.utils.tracing import tracer, TraceCategory
+
+
+@unique
+class Op(IntEnum):
+    LIT             = 0     # push literal
+    LIT_PUSH        = 1     # push literal, also on memory stack (expression element)
+    MARK            = 2     # remember value stack size
+    EXPR_END        = 3     # keep only the last value since the mark (pipe)
+    SCOPE_ENTER     = 4     # array element runs on its own memory scope
+    SCOPE_EXIT      = 5     # share its variables back and leave it
+    ARRAY_END       = 6     # make array from the values since the mark
+    ARGS_END        = 7     # make arguments array from the values since the mark
+    OPER_BUILTIN    = 8     # builtin instance from memory stack, put on exprs
+    OPER_VAR        = 9     # load variable, put on exprs unless callee
+    CALL_BUILTIN    = 10    # builtin without arguments: build and call it
+    CALL_VAR        = 11    # load initialized variable or store value into a new one
+    LOAD_CALLEE_VAR = 12    # load variable used as argument
+    CALL_ARGS       = 13    # call operation from exprs with args from memory stack
+    CALL_NAME       = 14    # generic call without arguments
+    MAIN_STEP       = 15    # end of a top-level expression
+    Q_DEFER         = 16    # quantum node, run by the tree-walker
+    EXEC_TREE       = 17    # unknown node shape, run by the tree-walker
+    CALL_FUSED      = 18    # fused pure builtin calls (see `optimize`)
+
+
+oper_types = (ASTType.BUILTIN, ASTType.ID, ASTType.OPERATION, ASTType.Q_OPERATION)
+
+
+class Bytecode:
+    """Flat instruction list: pairs of `Op` and argument
+
+    `spans[n]` is the source span of the node instruction `n` was
+    compiled from and `tops[n]` the one of its top-level expression;
+    `span` and `top` are the ones set for the next instructions.
+    """
+    __slots__ = ("code", "spans", "tops", "span", "top")
+
+    def __init__(self):
+        self.code: list[tuple[Op, Any]] = []
+        self.spans = array("q")
+        self.tops = array("q")
+        self.span = NO_SPAN
+        self.top = NO_SPAN
+
+    def emit(self, op: Op, arg: Any = None) -> None:
+        self.code.append((op, arg))
+        self.spans.append(self.span)
+        self.tops.append(self.top)
+
+    def extend(self, other: Bytecode) -> None:
+        self.code.extend(other.code)
+        self.spans.extend(other.spans)
+        self.tops.extend(other.tops)
+
+    def disassemble(self) -> str:
+        lines = []
+        for n, (op, arg) in enumerate(self.code):
+            if isinstance(arg, tuple):
+                arg = " ".join(str(k.__name__ if isinstance(k, type) else k) for k in arg)
+            lines.append(f"{n:5d} {op.name:<16}" + ("" if arg is None else f" {arg}"))
+        return "\n".join(lines)
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+    def __repr__(self) -> str:
+        return self.disassemble()
+
+    def __iter__(self) -> Iterable:
+        yield from self.code
+
+
+############
+# COMPILER #
+############
+
+def single_token(code: R) -> ATO | None:
+    """The id token of an operation node, if it is a plain one"""
+    if (
+        code.type in oper_types
+        and not code.has_q
+        and len(code) == 1
+        and isinstance(code.value[0], ATO)
+        and code.value[0].type in operations_or_id
+    ):
+        return code.value[0]
+    return None
+
+
+def compile_oper(code: R, bc: Bytecode) -> None:
+    token = single_token(code)
+    if token is None:
+        compile_node(code, bc)
+    elif token.token in builtin_fn_dict:
+        bc.emit(Op.OPER_BUILTIN, (builtin_fn_dict[token.token], code))
+    else:
+        bc.emit(Op.OPER_VAR, (token.token, token.slot, code.role == "callee"))
+
+
+def compile_call(code: R, bc: Bytecode) -> None:
+    if len(code) == 2:
+        bc.emit(Op.MARK)
+        compile_oper(code.value[0], bc)
+        compile_node(code.value[1], bc)
+        bc.emit(Op.CALL_ARGS)
+        return
+
+    caller = code.value[0]
+    token = single_token(caller) if isinstance(caller, R) else None
+    if token is None:
+        bc.emit(Op.MARK)
+        compile_node(caller, bc)
+        bc.emit(Op.CALL_NAME)
+    elif token.token in builtin_fn_dict:
+        bc.emit(Op.CALL_BUILTIN, (builtin_fn_dict[token.token], caller))
+    elif caller.role == "callee":
+        bc.emit(Op.LOAD_CALLEE_VAR, (token.token, token.slot))
+    else:
+        bc.emit(Op.CALL_VAR, (token.token, token.slot))
+
+
+def compile_node(code: R | ATO, bc: Bytecode) -> None:
+    outer = bc.span
+    if code.span != NO_SPAN:
+        bc.span = code.span
+    emit_node(code, bc)
+    bc.span = outer
+
+
+def emit_node(code: R | ATO, bc: Bytecode) -> None:
+    if isinstance(code, ATO):
+        if code.type in builtin_data_types_dict:
+            bc.emit(Op.LIT, (builtin_data_types_dict[code.type], code.value))
+        else:
+            bc.emit(Op.EXEC_TREE, code)
+        return
+
+    if code.has_q:
+        bc.emit(Op.Q_DEFER, code)
+        return
+
+    match code.type:
+        case ASTType.EXPR:
+            bc.emit(Op.MARK)
+            for k in code:
+                if isinstance(k, ATO) and k.type in builtin_data_types_dict:
+                    bc.emit(Op.LIT_PUSH, (builtin_data_types_dict[k.type], k.value))
+                else:
+                    compile_node(k, bc)
+            bc.emit(Op.EXPR_END)
+
+        case ASTType.ARRAY if code.paradigm == ExprParadigm.PARALLEL and len(code) > 1 and get_workers() > 1:
+            # run on the process pool by the tree-walker
+            bc.emit(Op.EXEC_TREE, code)
+
+        case ASTType.ARRAY if code.paradigm == ExprParadigm.CONCURRENT and interleaves(code):
+            # scheduled on an event loop by the tree-walker
+            bc.emit(Op.EXEC_TREE, code)
+
+        case ASTType.ARRAY:
+            bc.emit(Op.MARK)
+            for k in code:
+                # tokens do not touch memory, so they need no scope
+                if isinstance(k, ATO):
+                    compile_node(k, bc)
+                else:
+                    bc.emit(Op.SCOPE_ENTER)
+                    compile_node(k, bc)
+                    bc.emit(Op.SCOPE_EXIT)
+            bc.emit(Op.ARRAY_END)
+
+        case ASTType.ARGS:
+            bc.emit(Op.MARK)
+            for k in code:
+                compile_node(k, bc)
+            bc.emit(Op.ARGS_END)
+
+        case ASTType.CALL if 1 <= len(code) <= 2:
+            compile_call(code, bc)
+
+        case ASTType.FUSED:
+            bc.emit(Op.CALL_FUSED, (fused_fns(code), code))
+
+        case _:
+            bc.emit(Op.EXEC_TREE, code)
+
+
+def compile_code(code: R | ATO) -> Bytecode:
+    """Compile a program (MAIN node) or a single top-level expression"""
+    bc = Bytecode()
+    if isinstance(code, R) and code.type == ASTType.MAIN and parallel_lines(code):
+        # top-level expressions run on the process pool by the tree-walker
+        bc.emit(Op.EXEC_TREE, code)
+    elif isinstance(code, R) and code.type == ASTType.MAIN and not code.has_q:
+        for k in code:
+            bc.top = k.span
+            compile_node(k, bc)
+            bc.emit(Op.MAIN_STEP)
+    else:
+        bc.top = code.span
+        compile_node(code, bc)
+        bc.emit(Op.MAIN_STEP)
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "bytecode:\n%s", bc)
+    return bc
+
+
+######
+# VM #
+######
+
+class VM:
+    """Stack VM running `Bytecode` on a `Mem`
+
+    `vals` holds the values each instruction produces (the results the
+    tree-walker returns as tuples), `marks` the value stack sizes where
+    expressions, arrays and calls started. Array elements run on their
+    own memory scope (`Mem.push_scope`).
+    """
+    __slots__ = ("mem", "vals", "marks", "handlers")
+
+    def __init__(self, mem: Mem):
+        self.mem = mem
+        self.vals: list[Any] = []
+        self.marks: list[int] = []
+        handlers = {
+            Op.LIT: self.op_lit,
+            Op.LIT_PUSH: self.op_lit_push,
+            Op.MARK: self.op_mark,
+            Op.EXPR_END: self.op_expr_end,
+            Op.SCOPE_ENTER: self.op_scope_enter,
+            Op.SCOPE_EXIT: self.op_scope_exit,
+            Op.ARRAY_END: self.op_array_end,
+            Op.ARGS_END: self.op_args_end,
+            Op.OPER_BUILTIN: self.op_oper_builtin,
+            Op.OPER_VAR: self.op_oper_var,
+            Op.CALL_BUILTIN: self.op_call_builtin,
+            Op.CALL_VAR: self.op_call_var,
+            Op.LOAD_CALLEE_VAR: self.op_load_callee_var,
+            Op.CALL_ARGS: self.op_call_args,
+            Op.CALL_NAME: self.op_call_name,
+            Op.MAIN_STEP: self.op_main_step,
+            Op.Q_DEFER: self.op_exec_tree,
+            Op.EXEC_TREE: self.op_exec_tree,
+            Op.CALL_FUSED: self.op_call_fused,
+        }
+        self.handlers = [handlers[k] for k in Op]
+
+    def run(self, bc: Bytecode) -> None:
+        handlers = self.dispatch_table()
+        # the sampler reads `pc` to find the instruction source span
+        for pc, (op, arg) in enumerate(bc.code):
+            handlers[op](arg)
+
+    def dispatch_table(self) -> list:
+        """Handlers for this run, wrapped in the instrumentation enabled
+        (tracing, profiling, execution budget); plain ones otherwise
+        """
+        if not (tracer.eval or profiler.enabled or governor.enabled):
+            return self.handlers
+        return [self.instrument(op, handler) for op, handler in zip(Op, self.handlers)]
+
+    def instrument(self, op: Op, handler: Any) -> Any:
+        if profiler.enabled:
+            handler = self.profiled(op, handler)
+        if tracer.eval:
+            handler = self.traced(op, handler)
+        if governor.enabled:
+            handler = self.governed(handler)
+        return handler
+
+    @staticmethod
+    def profiled(op: Op, handler: Any) -> Any:
+        def run_op(arg: Any) -> None:
+            profiler.measure(ProfileKind.OP, op.name, handler, arg)
+
+        return run_op
+
+    @staticmethod
+    def traced(op: Op, handler: Any) -> Any:
+        def run_op(arg: Any) -> None:
+            tracer.debug(TraceCategory.EVAL, "* op: %s %s", op.name, arg)
+            handler(arg)
+
+        return run_op
+
+    def governed(self, handler: Any) -> Any:
+        def run_op(arg: Any) -> None:
+            # `governor.step`, inlined
+            governor.left -= 1
+            if governor.left <= 0:
+                governor.check(self.mem)
+            handler(arg)
+
+        return run_op
+
+    def load_var(self, name: str, slot: int) -> Var:
+        mem = self.mem
+        if slot >= 0:
+            var = mem.get_slot(slot)
+            if var is not None:
+                return var
+        return mem.get_var(name) if name in mem else Var(name, slot)
+
+    def new_builtin(self, fn: type, code: R) -> Any:
+        mem = self.mem
+        return call_builtin(fn, mem, mem.pop_stack(), code)
+
+    def make_array(self) -> None:
+        mark = self.marks.pop()
+        res = tuple(self.vals[mark:])
+        del self.vals[mark:]
+        self.vals.extend(arrange_array_output(res, self.mem))
+
+    ##############
+    # OPERATIONS #
+    ##############
+
+    def op_lit(self, arg: tuple) -> None:
+        self.vals.append(arg[0](arg[1]))
+
+    def op_lit_push(self, arg: tuple) -> None:
+        data = arg[0](arg[1])
+        self.vals.append(data)
+        self.mem.put_stack(data)
+
+    def op_mark(self, arg: None) -> None:
+        self.marks.append(len(self.vals))
+
+    def op_expr_end(self, arg: None) -> None:
+        mark = self.marks.pop()
+        if len(self.vals) - mark > 1:
+            del self.vals[mark:-1]
+
+    def op_scope_enter(self, arg: None) -> None:
+        self.mem = self.mem.push_scope()
+
+    def op_scope_exit(self, arg: None) -> None:
+        self.mem = self.mem.pop_scope()
+
+    def op_array_end(self, arg: None) -> None:
+        self.mem.clear_stack()
+        self.make_array()
+
+    def op_args_end(self, arg: None) -> None:
+        self.make_array()
+
+    def op_oper_builtin(self, arg: tuple) -> None:
+        oper = self.new_builtin(*arg)
+        self.mem.put_expr(oper)
+        self.vals.append(oper)
+
+    def op_oper_var(self, arg: tuple) -> None:
+        name, slot, callee = arg
+        var = self.load_var(name, slot)
+        if callee:
+            self.vals.append(self.mem.get_var(var.name))
+        else:
+            self.mem.put_expr(var)
+            self.vals.append(var)
+
+    def op_call_builtin(self, arg: tuple) -> None:
+        res = self.new_builtin(*arg)()
+        mem = self.mem
+        for p in res:
+            mem.put_stack(p)
+        self.vals.extend(res)
+
+    def op_call_var(self, arg: tuple) -> None:
+        mem = self.mem
+        var = self.load_var(*arg)
+        if var.initialized:
+            mem.put_expr(var)
+            self.vals.append(var)
+        else:
+            self.vals.append(var(mem.pop_stack()))
+            mem.put_var(var, "")
+            mem.put_stack(var)
+
+    def op_load_callee_var(self, arg: tuple) -> None:
+        name, slot = arg
+        var = self.mem.get_slot(slot) if slot >= 0 else None
+        # raises, as the tree-walker does, when the variable does not exist
+        self.vals.append(var if var is not None else self.mem.get_var(name))
+
+    def op_call_args(self, arg: None) -> None:
+        del self.vals[self.marks.pop():]
+        mem = self.mem
+        args = mem.pop_stack()
+        oper = mem.pop_expr()
+        for p in oper(args):
+            mem.put_stack(p)
+
+    def op_call_name(self, arg: None) -> None:
+        mark = self.marks.pop()
+        first = self.vals[mark]
+        mem = self.mem
+        if isinstance(first, Var):
+            if first.initialized:
+                return
+            mem.pop_expr()
+            del self.vals[mark:]
+            self.vals.append(first(mem.pop_stack()))
+            mem.put_var(first, "")
+            mem.put_stack(first)
+        else:
+            oper = mem.pop_expr()
+            if oper.token in builtin_fn_dict:
+                del self.vals[mark:]
+                res = oper()
+                for p in res:
+                    mem.put_stack(p)
+                self.vals.extend(res)
+            elif tracer.eval:
+                tracer.warning(TraceCategory.EVAL, "/!\\ unexpected code /!\\ %s", oper)
+
+    def op_main_step(self, arg: None) -> None:
+        self.mem.clear_stack()
+        self.vals.clear()
+
+    def op_call_fused(self, arg: tuple) -> None:
+        self.vals.extend(run_fused(*arg, self.mem))
+
+    def op_exec_tree(self, arg: R | ATO) -> None:
+        self.vals.extend(execute(arg, self.mem))
+
+
+def run_vm(code: R | ATO, mem: Mem) -> None:
+    VM(mem).run(compile_code(code))
+
+
+def run_vm_stream(code: Iterable[R | ATO], mem: Mem) -> None:
+    """Compile and run a stream of top-level expressions, one at a time"""
+    vm = VM(mem)
+    for k in code:
+        vm.run(compile_code(k))
@@ -7,6 +7,8 @@ from hhat_lang.syntax_trees.literal_define import (
     literal_int_define
 )
 from enum import Enum, auto, unique
+from hhat_lang.utils.spans import NO_SPAN
+from hhat_lang.utils.tracing import tracer, TraceCategory
 
 
 ################
@@ -36,6 +38,7 @@ class ASTType(Enum):
     ARRAY       = auto()
     MAIN        = auto()
     PROGRAM     = auto()
+    FUSED       = auto()
 
 
 @unique
@@ -64,10 +67,14 @@ class ATO(ABC):
     """Abstract tree object
 
     """
+    __slots__ = ("token", "type", "has_q", "span")
+
     def __init__(self, token: str, ato_type: ato_types, has_q: bool = False):
         self.token = token
         self.type = ato_type
         self.has_q = has_q
+        # position in the source code (see `utils.spans`)
+        self.span = NO_SPAN
 
     def __repr__(self) -> str:
         return self.token
@@ -77,6 +84,8 @@ class AST(ABC):
     """Abstract syntax tree object
 
     """
+    __slots__ = ("node", "type", "edges", "paradigm", "has_q", "span")
+
     def __init__(
             self,
             node: ATO | None = None,
@@ -90,6 +99,7 @@ class AST(ABC):
         self.edges = args
         self.paradigm = paradigm
         self.has_q = has_q
+        self.span = NO_SPAN
 
     def match_paradigm(self, args: str) -> str:
         match self.paradigm:
@@ -135,12 +145,16 @@ class AST(ABC):
 ###############
 
 class Literal(ATO):
+    __slots__ = ("value",)
+
     def __init__(self, token: str, lit_type: DataTypeEnum):
         super().__init__(token, lit_type)
         self.value = literal_dict[self.type](self.token)
 
 
 class Id(ATO):
+    __slots__ = ("value", "ref", "slot")
+
     def __init__(
             self,
             token: str,
@@ -149,9 +163,15 @@ class Id(ATO):
         has_q_var = True if token.startswith("@") else False
         super().__init__(token=token, ato_type=ato_type, has_q=has_q_var)
         self.value = self.token
+        # bound by the resolution pass: builtin function class or
+        # variable slot in memory
+        self.ref = None
+        self.slot = -1
 
 
 class Expr(AST):
+    __slots__ = ()
+
     def __init__(self, *values: Any, parent_id: str = "", has_q: bool = False):
         super().__init__(
             node=None,
@@ -163,6 +183,8 @@ class Expr(AST):
 
 
 class Array(AST):
+    __slots__ = ()
+
     def __init__(
             self,
             paradigm: ExprParadigm,
@@ -180,6 +202,8 @@ class Array(AST):
 
 
 class Operation(AST):
+    __slots__ = ()
+
     def __init__(
             self,
             oper_token: ATO | str,
@@ -199,7 +223,8 @@ class Operation(AST):
     @staticmethod
     def get_oper_type(oper_token: ATO) -> tuple[ASTType, bool]:
         if oper_token.token.startswith("@"):
-            print("oper quantum?")
+            if tracer.parse:
+                tracer.debug(TraceCategory.PARSE, "oper quantum? %s", oper_token.token)
             return ASTType.Q_OPERATION, True
         return ASTType.OPERATION, False
 
@@ -213,6 +238,8 @@ class Operation(AST):
 
 
 class Main(AST):
+    __slots__ = ()
+
     def __init__(self, exprs: AST):
         super().__init__(
             node=None,
@@ -223,6 +250,8 @@ class Main(AST):
 
 
 class Program(AST):
+    __slots__ = ()
+
     def __init__(self, *super_exprs: Any):
         super().__init__(
             node=None,
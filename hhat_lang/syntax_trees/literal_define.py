@@ -3,8 +3,8 @@ import re
 
 def literal_bool_define(value: str) -> bool:
     bool_vals = dict(T=True, F=False)
-    if res := bool_vals.get(value, False):
-        return res
+    if value in bool_vals:
+        return bool_vals[value]
     raise ValueError(f"wrong value for boolean ({value}).")
 
 
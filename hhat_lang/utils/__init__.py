@@ -1 +1,2 @@
 from .utils import get_types_set
+from .tracing import tracer, TraceCategory, TraceLevel, TraceSink
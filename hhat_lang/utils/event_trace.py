@@ -0,0 +1,168 @@
+"""Enter/exit event tracing of the interpreter execution
+
+When enabled, `events` records an enter and an exit event around each
+evaluated node (`execute`) and builtin call, so the nesting of the
+evaluation can be seen as a flame graph (collapsed stacks) or in a
+Chrome `trace_event` viewer (`chrome://tracing`, Perfetto). Events are
+appended to two flat arrays (event id, `perf_counter_ns` timestamp) and
+only turned into stacks and names when written. Probes are guarded like
+trace points:
+
+    if events.enabled:
+        return events.record(event_id, fn, code, mem)
+
+Builtin calls have no probe: their recorded `__call__` is installed by
+`enable` and removed by `disable` (see `builtins.functions.install_calls`).
+Event ids come from `intern`, which names a key (e.g. node type and
+paradigm) once. Only the current process is traced.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from array import array
+from collections import Counter
+from functools import wraps
+from time import perf_counter_ns
+from typing import Any, Callable, Hashable, Iterator, TextIO
+
+
+# event id of an exit: it always closes the innermost open event
+EXIT = -1
+
+
+class EventTracer:
+    def __init__(self):
+        self.enabled = False
+        self.ids: dict[Hashable, int] = dict()
+        self.names: list[str] = []
+        self.categories: list[str] = []
+        self.events = array("l")
+        self.times = array("q")
+        # called when recording is enabled or disabled
+        self.listeners: list[Callable[[], None]] = []
+
+    def enable(self, reset: bool = True) -> None:
+        if reset:
+            self.reset()
+        if not self.enabled:
+            self.enabled = True
+            self.notify()
+
+    def disable(self) -> None:
+        if self.enabled:
+            self.enabled = False
+            self.notify()
+
+    def notify(self) -> None:
+        for listener in self.listeners:
+            listener()
+
+    def reset(self) -> None:
+        self.events = array("l")
+        self.times = array("q")
+
+    def intern(self, key: Hashable, name: str, category: str) -> int:
+        """Event id of `key`, named `name` on first use"""
+        eid = self.ids.get(key)
+        if eid is None:
+            eid = self.ids[key] = len(self.names)
+            self.names.append(name)
+            self.categories.append(category)
+        return eid
+
+    def record(self, eid: int, fn: Callable, *args: Any) -> Any:
+        events, times = self.events, self.times
+        events.append(eid)
+        times.append(perf_counter_ns())
+        try:
+            return fn(*args)
+        finally:
+            events.append(EXIT)
+            times.append(perf_counter_ns())
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def spans(self) -> Iterator[tuple[tuple[int, ...], int, int, int]]:
+        """(stack of event ids, start, duration, self time) of each closed event
+
+        Events still open when recording stopped are closed at the last
+        timestamp; exits without an enter (recording started inside a
+        node) are skipped.
+        """
+        stack: list[int] = []
+        starts: list[int] = []
+        children: list[int] = [0]
+        for eid, t in zip(self.events, self.times):
+            if eid != EXIT:
+                stack.append(eid)
+                starts.append(t)
+                children.append(0)
+            elif stack:
+                yield from self._close(stack, starts, children, t)
+        end = self.times[-1] if self.times else 0
+        while stack:
+            yield from self._close(stack, starts, children, end)
+
+    @staticmethod
+    def _close(stack: list[int], starts: list[int], children: list[int], t: int) -> Iterator:
+        start = starts.pop()
+        duration = t - start
+        self_time = duration - children.pop()
+        children[-1] += duration
+        yield tuple(stack), start, duration, self_time
+        stack.pop()
+
+    def collapsed(self) -> Counter[str]:
+        """Self time (ns) per stack of event names, `;`-separated"""
+        by_ids: Counter[tuple[int, ...]] = Counter()
+        for stack, _, _, self_time in self.spans():
+            by_ids[stack] += self_time
+        names = self.names
+        res: Counter[str] = Counter()
+        for stack, self_time in by_ids.items():
+            res[";".join(names[k] for k in stack)] += self_time
+        return res
+
+    def write_collapsed(self, stream: TextIO) -> None:
+        """Collapsed stacks (`flamegraph.pl`, speedscope, inferno), in ns"""
+        for stack, self_time in sorted(self.collapsed().items()):
+            stream.write(f"{stack} {self_time}\n")
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        """Complete (`X`) events of the Chrome `trace_event` format, in us"""
+        names, categories = self.names, self.categories
+        origin = self.times[0] if self.times else 0
+        pid, tid = os.getpid(), threading.get_ident()
+        return [
+            dict(
+                name=names[stack[-1]],
+                cat=categories[stack[-1]],
+                ph="X",
+                ts=(start - origin) / 1e3,
+                dur=duration / 1e3,
+                pid=pid,
+                tid=tid,
+            )
+            for stack, start, duration, _ in self.spans()
+        ]
+
+    def write_chrome(self, stream: TextIO) -> None:
+        json.dump(dict(traceEvents=self.trace_events(), displayTimeUnit="ns"), stream)
+        stream.write("\n")
+
+
+events = EventTracer()
+
+
+def traced_call(call: Callable) -> Callable:
+    """Record the `__call__` of a builtin as an event named after its token"""
+    @wraps(call)
+    def wrapper(self, *args: Any) -> Any:
+        eid = events.intern(("builtin", self.token), self.token, "builtin")
+        return events.record(eid, call, self, *args)
+
+    return wrapper
@@ -0,0 +1,168 @@
+"""Per-run id allocator
+
+R nodes, variables, functions, memories and data objects get integer ids
+from monotonic per-run counters, so the same program always gets the
+same ids. R nodes are also recorded in a node table indexed by their id:
+the parent id of each node and the AST/ATO it was analyzed from. Each
+node keeps the table it was recorded in, so a tree answers from its own
+table even after other runs (a later analysis, a worker process) start.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import Any
+
+
+class NodeTable:
+    """Parent ids and sources of the R nodes with ids from `base` on
+
+    Pickled tables keep the parent ids but not the sources.
+    """
+    __slots__ = ("base", "parents", "sources")
+
+    def __init__(self, base: int = 0):
+        self.base = base
+        self.parents = array("q")
+        self.sources: list[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    @property
+    def end(self) -> int:
+        return self.base + len(self.parents)
+
+    def add(self, node_id: int, source: Any = None) -> None:
+        if not self.parents:
+            self.base = node_id
+        elif node_id > self.end:
+            # ids allocated elsewhere (e.g. by a worker process)
+            grow = node_id - self.end
+            self.parents.extend([-1] * grow)
+            self.sources.extend([None] * grow)
+        self.parents.append(-1)
+        self.sources.append(source)
+
+    def set_parent(self, node_id: int, parent_id: int) -> None:
+        if 0 <= node_id - self.base < len(self.parents):
+            self.parents[node_id - self.base] = parent_id
+
+    def parent_of(self, node_id: int) -> int:
+        if 0 <= node_id - self.base < len(self.parents):
+            return self.parents[node_id - self.base]
+        return -1
+
+    def source_of(self, node_id: int) -> Any:
+        if 0 <= node_id - self.base < len(self.sources):
+            return self.sources[node_id - self.base]
+        return None
+
+    def __getstate__(self) -> tuple[int, array]:
+        return self.base, self.parents
+
+    def __setstate__(self, state: tuple[int, array]) -> None:
+        self.base, self.parents = state
+        self.sources = [None] * len(self.parents)
+
+
+class IdAllocator:
+    """Id counters and the node table of a single run"""
+    __slots__ = (
+        "next_node",
+        "next_var",
+        "next_fn",
+        "next_mem",
+        "next_data",
+        "nodes",
+    )
+
+    def __init__(self):
+        self.next_node = 0
+        self.next_var = 0
+        self.next_fn = 0
+        self.next_mem = 0
+        self.next_data = 0
+        self.nodes = NodeTable()
+
+    def new_node(self, source: Any = None) -> int:
+        node_id = self.next_node
+        self.next_node += 1
+        self.nodes.add(node_id, source)
+        return node_id
+
+    def new_table(self) -> NodeTable:
+        """Record the next nodes in a new table, so trees that are no
+        longer used do not keep the table of the whole run alive
+        """
+        self.nodes = NodeTable(self.next_node)
+        return self.nodes
+
+    def new_var(self) -> int:
+        self.next_var += 1
+        return self.next_var - 1
+
+    def new_fn(self) -> int:
+        self.next_fn += 1
+        return self.next_fn - 1
+
+    def new_mem(self) -> int:
+        self.next_mem += 1
+        return self.next_mem - 1
+
+    def new_data(self) -> int:
+        self.next_data += 1
+        return self.next_data - 1
+
+    def counters(self) -> tuple[int, int, int, int, int]:
+        return self.next_node, self.next_var, self.next_fn, self.next_mem, self.next_data
+
+    def reserve(self, size: int = 1 << 32) -> tuple[int, int, int, int, int]:
+        """Counters for code run elsewhere (e.g. by a worker process)
+
+        A block of `size` variable, function, memory and data ids is kept
+        for it, so code run at the same time elsewhere gets other ids. Node
+        ids are not reserved: evaluation only builds R nodes for quantum
+        code, which always runs in process.
+        """
+        counters = self.counters()
+        self.next_var += size
+        self.next_fn += size
+        self.next_mem += size
+        self.next_data += size
+        return counters
+
+    def advance(self, counters: tuple[int, int, int, int, int]) -> None:
+        """Move the counters past ids allocated elsewhere (e.g. by a worker process)"""
+        next_node, next_var, next_fn, next_mem, next_data = counters
+        self.next_node = max(self.next_node, next_node)
+        self.next_var = max(self.next_var, next_var)
+        self.next_fn = max(self.next_fn, next_fn)
+        self.next_mem = max(self.next_mem, next_mem)
+        self.next_data = max(self.next_data, next_data)
+
+    def adopt(self, code: Any) -> None:
+        """Continue a tree built in another run (e.g. loaded from a .hatc file)
+
+        The node counter is moved past its ids and new nodes are recorded
+        in its table. Sources are not available.
+        """
+        self.nodes = code.nodes
+        self.next_node = max(self.next_node, self.nodes.end)
+
+
+current = IdAllocator()
+
+
+def current_ids() -> IdAllocator:
+    return current
+
+
+def new_run() -> IdAllocator:
+    """Start a new run: counters start over in a new node table.
+
+    Trees of earlier runs keep their own tables.
+    """
+    global current
+    current = IdAllocator()
+    return current
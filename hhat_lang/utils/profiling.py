@@ -0,0 +1,171 @@
+"""Profiling of the interpreter execution
+
+When enabled, `profiler` collects for each evaluated node type (`@EXPR`
+for quantum nodes, `token:INT` for tokens), VM instruction and builtin
+token: the number of calls, the inclusive and exclusive wall time and the
+number of memory blocks allocated (net, from `sys.getallocatedblocks`).
+Probes are guarded like trace points:
+
+    if profiler.enabled:
+        return profiler.measure(ProfileKind.NODE, key, fn, code, mem)
+
+so a disabled probe costs one attribute lookup. Builtin calls have no
+probe: their profiled `__call__` is installed by `enable` and removed by
+`disable` (see `builtins.functions.install_calls`). Only the current process
+is profiled: work sent to worker processes counts as part of the node
+that sent it.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from enum import Enum, unique
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, TextIO
+
+
+@unique
+class ProfileKind(Enum):
+    NODE        = "node"
+    OP          = "op"
+    BUILTIN     = "builtin"
+
+
+class ProfileEntry:
+    __slots__ = ("calls", "inclusive", "exclusive", "allocs", "self_allocs")
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.allocs = 0
+        self.self_allocs = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(
+            calls=self.calls,
+            inclusive=self.inclusive,
+            exclusive=self.exclusive,
+            allocs=self.allocs,
+            self_allocs=self.self_allocs,
+        )
+
+
+class Profiler:
+    """Call counts, times and allocations per node type, instruction and builtin
+
+    Inclusive values of a node type also count the nested nodes of the
+    same type (e.g. an `EXPR` inside an array inside an `EXPR`).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.entries: dict[tuple[ProfileKind, str], ProfileEntry] = dict()
+        # time and allocations of the children of the running probes
+        self.child_time: list[float] = []
+        self.child_allocs: list[int] = []
+        self.elapsed = 0.0
+        self.start = 0.0
+        # called when the profiler is enabled or disabled
+        self.listeners: list[Callable[[], None]] = []
+
+    def enable(self, reset: bool = True) -> None:
+        if reset:
+            self.reset()
+        toggled = not self.enabled
+        self.enabled = True
+        self.start = perf_counter()
+        if toggled:
+            self.notify()
+
+    def disable(self) -> None:
+        if not self.enabled:
+            return
+        self.elapsed += perf_counter() - self.start
+        self.enabled = False
+        self.notify()
+
+    def notify(self) -> None:
+        for listener in self.listeners:
+            listener()
+
+    def reset(self) -> None:
+        self.entries.clear()
+        self.child_time.clear()
+        self.child_allocs.clear()
+        self.elapsed = 0.0
+
+    def measure(self, kind: ProfileKind, key: str, fn: Callable, *args: Any) -> Any:
+        child_time, child_allocs = self.child_time, self.child_allocs
+        child_time.append(0.0)
+        child_allocs.append(0)
+        blocks = sys.getallocatedblocks()
+        start = perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = perf_counter() - start
+            allocs = sys.getallocatedblocks() - blocks
+            entry = self.entries.get((kind, key))
+            if entry is None:
+                entry = self.entries[kind, key] = ProfileEntry()
+            entry.calls += 1
+            entry.inclusive += elapsed
+            entry.exclusive += elapsed - child_time.pop()
+            entry.allocs += allocs
+            entry.self_allocs += allocs - child_allocs.pop()
+            if child_time:
+                child_time[-1] += elapsed
+                child_allocs[-1] += allocs
+
+    def as_dict(self) -> dict[str, Any]:
+        res: dict[str, Any] = dict(elapsed=self.elapsed)
+        for kind in ProfileKind:
+            res[kind.value] = {
+                key: entry.as_dict()
+                for (k, key), entry in sorted(
+                    self.entries.items(), key=lambda x: -x[1].exclusive
+                )
+                if k == kind
+            }
+        return res
+
+    def report(self, limit: int | None = None) -> str:
+        """Text report, sorted by exclusive time"""
+        lines = [f"profile: {self.elapsed * 1e3:.2f} ms"]
+        for kind in ProfileKind:
+            entries = sorted(
+                ((key, entry) for (k, key), entry in self.entries.items() if k == kind),
+                key=lambda x: -x[1].exclusive,
+            )[:limit]
+            if not entries:
+                continue
+            lines.append(
+                f"{kind.value:<20} {'calls':>10} {'incl ms':>11} {'excl ms':>11}"
+                f" {'excl %':>7} {'allocs':>10} {'self allocs':>12}"
+            )
+            for key, entry in entries:
+                share = entry.exclusive / self.elapsed * 100 if self.elapsed else 0.0
+                lines.append(
+                    f"{key:<20} {entry.calls:>10} {entry.inclusive * 1e3:>11.3f}"
+                    f" {entry.exclusive * 1e3:>11.3f} {share:>6.1f}%"
+                    f" {entry.allocs:>10} {entry.self_allocs:>12}"
+                )
+        return "\n".join(lines)
+
+    def write_json(self, stream: TextIO) -> None:
+        json.dump(self.as_dict(), stream, indent=2)
+        stream.write("\n")
+
+
+profiler = Profiler()
+
+
+def profiled(call: Callable) -> Callable:
+    """Profile the `__call__` of a builtin under its token"""
+    @wraps(call)
+    def wrapper(self, *args: Any) -> Any:
+        return profiler.measure(ProfileKind.BUILTIN, self.token, call, self, *args)
+
+    return wrapper
@@ -0,0 +1,79 @@
+"""Source spans
+
+A span is the pair of start and end offsets of a node in the source
+code, packed into a single int (`start << 32 | end`), so every `ATO`,
+`AST` and `R` node carries it in one slot. `NO_SPAN` marks nodes that
+come from no source code (e.g. folded constants built by the optimizer
+without a span to inherit). `SourceMap` turns offsets into lines and
+columns.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+
+
+NO_SPAN = -1
+_OFFSET_BITS = 32
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+
+def make_span(start: int, end: int) -> int:
+    return start << _OFFSET_BITS | end
+
+
+def span_start(span: int) -> int:
+    return span >> _OFFSET_BITS
+
+
+def span_end(span: int) -> int:
+    return span & _OFFSET_MASK
+
+
+def join_spans(first: int, last: int) -> int:
+    """Span from the start of `first` to the end of `last`"""
+    if first == NO_SPAN:
+        return last
+    if last == NO_SPAN:
+        return first
+    return make_span(span_start(first), span_end(last))
+
+
+class SourceMap:
+    """Lines and columns (1-based) of offsets in a source code"""
+    __slots__ = ("code", "file", "line_starts")
+
+    def __init__(self, code: str, file: str | None = None):
+        self.code = code
+        self.file = file
+        self.line_starts = array("q", [0])
+        pos = code.find("\n")
+        while pos >= 0:
+            self.line_starts.append(pos + 1)
+            pos = code.find("\n", pos + 1)
+
+    @classmethod
+    def from_file(cls, file: str) -> SourceMap:
+        with open(file, "r") as f:
+            return cls(f.read(), file)
+
+    def linecol(self, pos: int) -> tuple[int, int]:
+        line = bisect_right(self.line_starts, pos)
+        return line, pos - self.line_starts[line - 1] + 1
+
+    def line_of(self, span: int) -> int:
+        return self.linecol(span_start(span))[0]
+
+    def line_text(self, line: int) -> str:
+        start = self.line_starts[line - 1]
+        end = self.line_starts[line] - 1 if line < len(self.line_starts) else len(self.code)
+        return self.code[start:end]
+
+    def text(self, span: int) -> str:
+        return self.code[span_start(span):span_end(span)]
+
+    def location(self, span: int) -> str:
+        """`file:line:col` (or `line:col`) where the span starts"""
+        line, col = self.linecol(span_start(span))
+        return f"{self.file}:{line}:{col}" if self.file else f"{line}:{col}"
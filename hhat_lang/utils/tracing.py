@@ -0,0 +1,125 @@
+"""Structured tracing for the interpreter
+
+Trace points are guarded by a per-category attribute of `tracer`, which
+holds the enabled level (0 when disabled):
+
+    if tracer.eval:
+        tracer.debug(TraceCategory.EVAL, "* token: %s", code)
+
+so a disabled trace point costs one attribute lookup, and messages are
+only formatted when they are going to be written.
+"""
+
+from __future__ import annotations
+
+import atexit
+import sys
+from enum import Enum, IntEnum, unique
+from typing import Any, Iterable, TextIO
+
+
+@unique
+class TraceCategory(Enum):
+    PARSE       = "parse"
+    ANALYSIS    = "analysis"
+    EVAL        = "eval"
+    QUANTUM     = "quantum"
+
+
+@unique
+class TraceLevel(IntEnum):
+    OFF         = 0
+    WARNING     = 1
+    INFO        = 2
+    DEBUG       = 3
+
+
+class TraceSink:
+    """Buffered trace output
+
+    Lines are kept in memory and written to the stream once `buffer_size`
+    lines are collected, on `flush` or at interpreter exit. It takes no
+    lock: the interpreter runs on a single thread, and parallel work runs
+    in worker processes, each with its own copy of the sink.
+    """
+    def __init__(self, stream: TextIO | None = None, buffer_size: int = 4096):
+        self.stream = stream if stream is not None else sys.stderr
+        self.buffer_size = buffer_size
+        self.buffer: list[str] = []
+
+    def write(self, line: str) -> None:
+        self.buffer.append(line)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            lines, self.buffer = self.buffer, []
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self.stream not in (sys.stderr, sys.stdout):
+            self.stream.close()
+
+
+class Tracer:
+    """Tracer with levels and categories
+
+    Attributes `parse`, `analysis`, `eval` and `quantum` hold the level
+    enabled for each category, as plain ints.
+    """
+    def __init__(self):
+        self.parse = TraceLevel.OFF.value
+        self.analysis = TraceLevel.OFF.value
+        self.eval = TraceLevel.OFF.value
+        self.quantum = TraceLevel.OFF.value
+        self.sink: TraceSink | None = None
+
+    def enable(
+            self,
+            categories: Iterable[TraceCategory | str] | None = None,
+            level: TraceLevel | str = TraceLevel.DEBUG,
+            sink: TraceSink | None = None,
+    ) -> None:
+        if isinstance(level, str):
+            level = TraceLevel[level.upper()]
+        if sink is not None:
+            self.close()
+            self.sink = sink
+        elif self.sink is None:
+            self.sink = TraceSink()
+        for k in categories if categories is not None else TraceCategory:
+            setattr(self, TraceCategory(k).value, level.value)
+
+    def disable(self, categories: Iterable[TraceCategory | str] | None = None) -> None:
+        for k in categories if categories is not None else TraceCategory:
+            setattr(self, TraceCategory(k).value, TraceLevel.OFF.value)
+        self.flush()
+
+    def emit(self, category: TraceCategory, level: TraceLevel, msg: str, *args: Any) -> None:
+        if getattr(self, category.value) >= level and self.sink is not None:
+            self.sink.write(f"[{category.value}:{level.name.lower()}] " + (msg % args if args else msg))
+
+    def debug(self, category: TraceCategory, msg: str, *args: Any) -> None:
+        self.emit(category, TraceLevel.DEBUG, msg, *args)
+
+    def info(self, category: TraceCategory, msg: str, *args: Any) -> None:
+        self.emit(category, TraceLevel.INFO, msg, *args)
+
+    def warning(self, category: TraceCategory, msg: str, *args: Any) -> None:
+        self.emit(category, TraceLevel.WARNING, msg, *args)
+
+    def flush(self) -> None:
+        if self.sink is not None:
+            self.sink.flush()
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+
+tracer = Tracer()
+atexit.register(tracer.flush)
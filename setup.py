@@ -41,6 +41,7 @@ setup(
     include_package_data=True,
     extras_require={
         # "netqasm": ["netqasm"],
+        "numpy": ["numpy"],
     },
     entry_points={
         "console_scripts": ["hhat=hhat_lang.exec:main"]
@@ -0,0 +1,63 @@
+"""Programs shared by the differential tests"""
+
+import random
+from pathlib import Path
+
+
+examples = sorted((Path(__file__).parent.parent / "examples").glob("*.hat"))
+
+
+def random_code(rng: random.Random, depth: int = 3) -> str:
+    """Random, often invalid, code using every token and bracket kind"""
+    def ws() -> str:
+        return rng.choice(["", " ", "  ", "\n", "\t "])
+
+    def element(d: int) -> str:
+        choice = rng.randrange(6 if d > 0 else 2)
+        if choice == 0:
+            return rng.choice(["0", "1", "-7", "42", "T", "Tx", "05", "-0"])
+        if choice == 1:
+            return rng.choice(["x", "sum", "print", "@q1", "@shuffle", "!a", "`b", "-", "n_2"])
+        if choice == 2:
+            return rng.choice(["x", "times", "@sync"]) + ws() + array(d - 1)
+        return "." + ws() + array(d - 1)
+
+    def array(d: int) -> str:
+        opening, closing = rng.choice(["[]", "()", "{}"])
+        inner = " ".join(exprs(d) for _ in range(rng.randint(1, 3)))
+        return opening + ws() + inner + ws() + closing
+
+    def exprs(d: int) -> str:
+        return (ws() + ":" + ws()).join(element(d) for _ in range(rng.randint(1, 4)))
+
+    return "\n".join(exprs(depth) for _ in range(rng.randint(1, 5)))
+
+
+def random_program(rng: random.Random) -> str:
+    """Random program built from the forms the interpreter supports."""
+    names = []
+
+    def value() -> str:
+        ints = " ".join(str(rng.randint(0, 20)) for _ in range(rng.randint(1, 4)))
+        return rng.choice([str(rng.randint(0, 20)), ".[" + ints + "]"])
+
+    def step() -> str:
+        choice = rng.randrange(5)
+        if choice == 0:
+            return rng.choice(["sum", "times", "print"])
+        if choice == 1:
+            return rng.choice(["sum", "times"]) + "(" + value().strip(".[]") + ")"
+        if choice == 2 and names:
+            return rng.choice(["sum", "times"]) + "(" + rng.choice(names) + ")"
+        if choice == 3:
+            return ".(" + " ".join(rng.choice(["sum", "times", "print"]) for _ in range(rng.randint(1, 3))) + ")"
+        return "print"
+
+    lines = []
+    for n in range(rng.randint(1, 6)):
+        line = value() + "".join(":" + step() for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.5:
+            names.append(f"x{n}")
+            line += f":x{n}"
+        lines.append(line)
+    return "\n".join(lines)
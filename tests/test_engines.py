@@ -0,0 +1,96 @@
+"""Differential tests: every way of running a program has the same effects
+
+The tree-walking evaluator, without optimizations, run serially, is the
+reference for the VM, the optimization levels, streaming execution and
+the process pool (parallel arrays and top-level expressions): programs
+must print the same output and leave the same memory (ids aside), or
+raise the same error.
+"""
+
+import io
+import random
+import re
+from contextlib import redirect_stdout
+from itertools import product
+from pathlib import Path
+
+import pytest
+
+from hhat_lang.interpreter.eval import Eval, EvalBackend
+from hhat_lang.interpreter.parsing import parse_code, ParserBackend
+from hhat_lang.interpreter.pool import set_parallel_lines, set_workers
+from hhat_lang.interpreter.semantics import Analysis
+from hhat_lang.interpreter.streaming import stream_analyze
+from programs import examples, random_code, random_program
+
+
+reference = EvalBackend.TREE, 0, False, 1, False
+configs = [
+    config
+    for config in product(EvalBackend, (0, 1, 2), (False, True), (1, 2), (False, True))
+    # top-level expressions only run on the pool when not streamed
+    if config != reference and not (config[4] and (config[2] or config[3] == 1))
+]
+# random programs have few parallel arrays: they run serially only
+serial_configs = [config for config in configs if config[3] == 1]
+
+
+@pytest.fixture(autouse=True)
+def serial_after():
+    yield
+    set_workers()
+    set_parallel_lines()
+
+
+def run(
+        code: str,
+        engine: EvalBackend,
+        opt_level: int,
+        stream: bool,
+        workers: int,
+        parallel_lines: bool,
+) -> tuple:
+    """Program output and final memory (without ids), or the error raised"""
+    set_workers(workers)
+    set_parallel_lines(parallel_lines)
+    out = io.StringIO()
+    try:
+        if stream:
+            r_tree = stream_analyze([code], opt_level=opt_level)
+        else:
+            r_tree = Analysis(parse_code(code, backend=ParserBackend.FAST), opt_level=opt_level).run()
+        with redirect_stdout(out):
+            mem = Eval(r_tree, backend=engine).run()
+        return out.getvalue(), re.sub(r"id=-?\d+", "", repr(mem))
+    except Exception as e:
+        return "error", type(e).__name__, out.getvalue()
+
+
+def config_id(config: tuple) -> str:
+    engine, opt_level, stream, workers, parallel_lines = config
+    return (
+        f"{engine.name.lower()}-O{opt_level}"
+        + ("-stream" if stream else "")
+        + f"-w{workers}"
+        + ("-lines" if parallel_lines else "")
+    )
+
+
+@pytest.mark.parametrize("config", configs, ids=config_id)
+@pytest.mark.parametrize("path", examples, ids=lambda k: k.name)
+def test_examples(path: Path, config: tuple):
+    code = path.read_text()
+    expected = run(code, *reference)
+    assert expected[0] != "error"
+    assert run(code, *config) == expected
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_programs(seed: int):
+    rng = random.Random(seed)
+    corpus = [random_code(rng, depth=2) for _ in range(10)]
+    corpus += [random_program(rng) for _ in range(50)]
+    for code in corpus:
+        expected = run(code, *reference)
+        for config in serial_configs:
+            assert run(code, *config) == expected, (code, config_id(config))
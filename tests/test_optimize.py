@@ -0,0 +1,38 @@
+"""Optimization passes keep the R tree consistent"""
+
+import pytest
+
+from hhat_lang.interpreter.parsing import parse_code, ParserBackend
+from hhat_lang.interpreter.post_ast import R
+from hhat_lang.interpreter.semantics import Analysis
+
+
+def analyze(code: str, opt_level: int) -> R:
+    return Analysis(parse_code(code, backend=ParserBackend.FAST), opt_level=opt_level).run()
+
+
+def wrong_parents(code: R) -> list:
+    res = []
+    for k in code:
+        if isinstance(k, R):
+            if k.parent_id != code.id:
+                res.append((k, k.parent_id, code.id))
+            res += wrong_parents(k)
+    return res
+
+
+@pytest.mark.parametrize("opt_level", (1, 2))
+@pytest.mark.parametrize("code", (
+    # folded
+    ".[2 3 4]:sum:print",
+    ".[68 9]:sum(12 35):print",
+    # not folded: the result of the call is not the expression result
+    ".[68 9]:sum(12 35)",
+))
+def test_parent_ids(code: str, opt_level: int):
+    assert wrong_parents(analyze(code, opt_level)) == []
+
+
+def test_folded():
+    folded = analyze(".[2 3 4]:sum:print", 1)
+    assert str(analyze("9:print", 0)) == str(folded)
@@ -0,0 +1,103 @@
+"""Differential tests: all parser backends build the same tree"""
+
+import random
+from pathlib import Path
+
+import pytest
+
+from arpeggio import EndOfFile, ParsingExpression, RegExMatch, StrMatch
+
+from hhat_lang.interpreter.parsing import build_parser, parse_code, ParseError, ParserBackend
+from hhat_lang.interpreter.streaming import stream_parse
+from hhat_lang.syntax_trees.ast import ATO, AST
+from programs import examples, random_code
+
+
+# empty programs are left out: Arpeggio reduces them to a lone EOF node
+# the CST cannot handle, while the fast parser returns an empty Main
+snippets = ["1", "x", "F", ".[1 2]", "sum(1):x", "@q1:@sync:@q3", ".{1 2}:print", "a:\n\tb"]
+bad_snippets = [".[1", "1 ]", "a:", "x()", ".(1 2", ":x"]
+
+
+def dump(code: AST | ATO) -> tuple:
+    if isinstance(code, ATO):
+        return type(code).__name__, code.token, code.type, code.has_q, code.value, code.span
+    node = dump(code.node) if isinstance(code.node, ATO) else code.node
+    edges = tuple(dump(k) for k in code.edges) if isinstance(code.edges, tuple) else dump(code.edges)
+    return type(code).__name__, code.type, code.paradigm, code.has_q, node, edges, code.span
+
+
+@pytest.mark.parametrize("path", examples, ids=lambda k: k.name)
+@pytest.mark.parametrize("backend", [ParserBackend.PYTHON, ParserBackend.FAST], ids=lambda k: k.name.lower())
+def test_examples(path: Path, backend: ParserBackend):
+    code = path.read_text()
+    assert dump(parse_code(code, backend=backend)) == dump(parse_code(code, backend=ParserBackend.PEG))
+
+
+@pytest.mark.parametrize("code", snippets)
+@pytest.mark.parametrize("backend", [ParserBackend.PYTHON, ParserBackend.FAST], ids=lambda k: k.name.lower())
+def test_snippets(code: str, backend: ParserBackend):
+    assert dump(parse_code(code, backend=backend)) == dump(parse_code(code, backend=ParserBackend.PEG))
+
+
+@pytest.mark.parametrize("code", bad_snippets)
+@pytest.mark.parametrize("backend", list(ParserBackend), ids=lambda k: k.name.lower())
+def test_syntax_errors(code: str, backend: ParserBackend):
+    with pytest.raises(ParseError):
+        parse_code(code, backend=backend)
+    # every backend reports the same position
+    assert parse_or_error(code, backend) == parse_or_error(code, ParserBackend.PEG)
+
+
+def parse_or_error(code: str, backend: ParserBackend) -> tuple:
+    try:
+        return dump(parse_code(code, backend=backend))
+    except ParseError as e:
+        return "error", e.line, e.col
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_code(seed: int):
+    rng = random.Random(seed)
+    for _ in range(20):
+        code = random_code(rng)
+        trees = {k: parse_or_error(code, k) for k in ParserBackend}
+        assert len(set(trees.values())) == 1, code
+
+
+@pytest.mark.parametrize("path", examples, ids=lambda k: k.name)
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_stream(path: Path, chunk_size: int):
+    code = path.read_text()
+    chunks = [code[k:k + chunk_size] for k in range(0, len(code), chunk_size)]
+    streamed = tuple(dump(k) for k in stream_parse(chunks, backend=ParserBackend.FAST))
+    assert streamed == tuple(dump(k) for k in parse_code(code, backend=ParserBackend.PEG).edges)
+
+
+def grammar_rules(expr: ParsingExpression) -> dict:
+    """Parsing expression of each rule of a parser model, by rule name"""
+    def describe(k: ParsingExpression, top: bool = False) -> tuple | str:
+        if isinstance(k, EndOfFile):
+            return "EOF"
+        if k.root and not top:
+            return k.rule_name
+        if isinstance(k, (RegExMatch, StrMatch)):
+            return type(k).__name__, k.to_match
+        return type(k).__name__, tuple(describe(p) for p in k.nodes)
+
+    rules = dict()
+    stack = [expr]
+    while stack:
+        k = stack.pop()
+        if k.root and not isinstance(k, EndOfFile):
+            if k.rule_name in rules:
+                continue
+            rules[k.rule_name] = describe(k, top=True)
+        stack.extend(k.nodes)
+    return rules
+
+
+def test_python_grammar():
+    # the Python grammar is a copy of grammar.peg: they must not drift apart
+    peg = grammar_rules(build_parser(ParserBackend.PEG).parser_model)
+    assert grammar_rules(build_parser(ParserBackend.PYTHON).parser_model) == peg